@@ -3,26 +3,34 @@ Flask web application to keep the bot alive on Render.
 This runs alongside the Telegram bot to satisfy Render's web service requirements.
 """
 
-from flask import Flask, jsonify, render_template
+from flask import Flask, Response, abort, jsonify, render_template, request
 import threading
 import time
 import os
+import signal
 import asyncio
 import logging
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
-from bot.handlers import (
-    start_command, help_command, handle_spotify_url, 
-    handle_button_callback, handle_message
-)
+from telegram.ext import Application
+from config import WORKER_COUNT, TELEGRAM_API_URL, TELEGRAM_LOCAL_MODE
+from bot.handlers import register_handlers, post_init, admission, drain_and_stop
+from bot.circuit_breaker import circuit_stats
+from bot.executors import executor_stats
+from bot.logs import setup_logging
+from bot.metrics import render_metrics, PROMETHEUS_CONTENT_TYPE
+from bot.profiling import ProfilerBusyError, sample_stacks
+from bot.utils import verify_admin_token
+from bot.watchdog import watchdog
+from worker import start_workers
 
 app = Flask(__name__)
-bot_status = {"running": False, "last_seen": 0}
+bot_status = {"running": False, "stopping": False}
+
+# Restart backoff after a crash: 5s, 10s, 20s, ... capped at 5 minutes
+RESTART_DELAY_MIN = 5
+RESTART_DELAY_MAX = 300
 
 # Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
 
 @app.route('/')
 def home():
@@ -31,13 +39,15 @@ def home():
 
 @app.route('/health')
 def health():
-    """Health check endpoint for monitoring."""
+    """Health check endpoint for monitoring. Returns 503 when the bot's event loop is wedged."""
+    healthy = watchdog.healthy()
     return jsonify({
-        "status": "healthy", 
+        "status": "healthy" if healthy else "unhealthy",
         "timestamp": time.time(),
         "bot_running": bot_status["running"],
+        "event_loop_lag_ms": round(watchdog.current_lag() * 1000, 2),
         "service": "keep_alive"
-    })
+    }), 200 if healthy else 503
 
 @app.route('/ping')
 def ping():
@@ -51,7 +61,7 @@ def json_status():
         "status": "✅ Bot is alive and running!",
         "service": "Telegram Music Bot",
         "message": "Keep-alive server active - bot stays online 24/7",
-        "last_seen": bot_status["last_seen"],
+        "last_seen": watchdog.last_seen,
         "uptime": time.time() - bot_status.get("start_time", time.time())
     })
 
@@ -61,10 +71,31 @@ def api_status():
     return jsonify({
         "bot_running": bot_status["running"],
         "uptime": time.time() - bot_status.get("start_time", time.time()),
-        "last_seen": bot_status["last_seen"],
+        "last_seen": watchdog.last_seen,
+        "downloads": admission.stats(),
+        "event_loop": watchdog.stats(),
+        "circuits": circuit_stats(),
+        "executors": executor_stats(),
         "service": "MusicFlow Bot"
     })
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for every pipeline stage."""
+    return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/admin/profile')
+def admin_profile():
+    """Sample all threads for ?seconds=N and return collapsed stacks (admin token required)."""
+    if not verify_admin_token(request.headers.get("Authorization")):
+        abort(404)
+    seconds = request.args.get("seconds", 10.0, type=float)
+    try:
+        stacks = sample_stacks(seconds)
+    except ProfilerBusyError as e:
+        return jsonify({"error": str(e)}), 409
+    return Response(stacks, content_type="text/plain; charset=utf-8")
+
 def keep_alive():
     """Keep alive function to prevent bot from sleeping."""
     print("🚀 Starting keep_alive server on port 8080...")
@@ -79,12 +110,13 @@ def run_flask():
 def run_telegram_bot():
     """Run the Telegram bot directly in this process."""
     logger = logging.getLogger(__name__)
+    restart_delay = RESTART_DELAY_MIN
     
-    while True:
+    while not bot_status["stopping"]:
+        started = time.time()
         try:
             print("Starting Telegram bot...")
             bot_status["running"] = True
-            bot_status["last_seen"] = time.time()
             bot_status["start_time"] = time.time()
             
             # Get bot token from environment
@@ -100,35 +132,45 @@ def run_telegram_bot():
             asyncio.set_event_loop(loop)
             
             # Create application
-            application = Application.builder().token(bot_token).build()
+            application = (
+                Application.builder()
+                .token(bot_token)
+                .base_url(f"{TELEGRAM_API_URL}/bot")
+                .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+                .local_mode(TELEGRAM_LOCAL_MODE)
+                .concurrent_updates(True)
+                .post_init(post_init)
+                .build()
+            )
             
             # Add handlers
-            application.add_handler(CommandHandler("start", start_command))
-            application.add_handler(CommandHandler("help", help_command))
-            application.add_handler(CallbackQueryHandler(handle_button_callback))
-            application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+            register_handlers(application)
+            
+            # SIGTERM drains in-flight downloads before polling stops
+            def on_sigterm():
+                bot_status["stopping"] = True
+                loop.create_task(drain_and_stop(application))
+            loop.add_signal_handler(signal.SIGTERM, on_sigterm)
             
             # Start the bot
             logger.info("Telegram Music Bot starting...")
             
-            # Update status periodically
-            def update_status():
-                while bot_status["running"]:
-                    bot_status["last_seen"] = time.time()
-                    time.sleep(5)
-            
-            status_thread = threading.Thread(target=update_status, daemon=True)
-            status_thread.start()
-            
             # Run bot
-            application.run_polling()
+            application.run_polling(stop_signals=(signal.SIGINT,))
+            bot_status["running"] = False
             
         except Exception as e:
             logger.error(f"Bot error: {e}")
             bot_status["running"] = False
+            if bot_status["stopping"]:
+                break
+            if time.time() - started > RESTART_DELAY_MAX:
+                # It ran fine for a while; this is a fresh failure
+                restart_delay = RESTART_DELAY_MIN
             print(f"Bot error: {e}")
-            print("Restarting bot in 30 seconds...")
-            time.sleep(30)
+            print(f"Restarting bot in {restart_delay} seconds...")
+            time.sleep(restart_delay)
+            restart_delay = min(restart_delay * 2, RESTART_DELAY_MAX)
 
 if __name__ == '__main__':
     print("🎵 Starting Telegram Music Bot with Keep-Alive System...")
@@ -136,6 +178,10 @@ if __name__ == '__main__':
     # Initialize bot status
     bot_status["start_time"] = time.time()
     
+    # Start download workers when running in multi-process mode
+    if WORKER_COUNT:
+        start_workers(WORKER_COUNT)
+    
     # Start keep_alive Flask server in a separate thread
     flask_thread = threading.Thread(target=keep_alive, daemon=True)
     flask_thread.start()
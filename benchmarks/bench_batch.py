@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Batch Delivery Benchmark
+Sends a playlist link, presses the batch download button and counts the Bot
+API calls and time the job took. The same playlist is then requested by a
+second user, when every track is already known to Telegram by file_id.
+
+Usage:
+    python benchmarks/bench_batch.py --playlist-size 30 --telegram-latency 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from common import apply_environment, callback_update, feed, git_revision, message_update, start_application
+from fakes import FakeUpstreams, ServiceProfile, UpstreamConfig
+
+PLAYLIST_LINK = "https://open.spotify.com/playlist/list00000000000000001"
+
+
+async def one_job(application, fakes, user_id, quality):
+    before = Counter(fakes.telegram.calls)
+    start = time.perf_counter()
+    await feed(application, message_update(2 * user_id, user_id, PLAYLIST_LINK))
+    await feed(application, callback_update(2 * user_id + 1, user_id, f"batch_{quality}"))
+    elapsed = time.perf_counter() - start
+    calls = Counter(fakes.telegram.calls)
+    calls.subtract(before)
+    calls = {method: count for method, count in calls.items() if count}
+    return {
+        "wall_s": round(elapsed, 3),
+        "audio_delivered": fakes.telegram.audio_by_chat[user_id],
+        "bot_api_calls": sum(calls.values()),
+        "calls_by_method": calls,
+    }
+
+
+async def run(args, fakes):
+    application = await start_application()
+    try:
+        cold = await one_job(application, fakes, 100, args.quality)
+        warm = await one_job(application, fakes, 200, args.quality)
+    finally:
+        await application.shutdown()
+    return {
+        "benchmark": "batch",
+        "revision": git_revision(),
+        "parameters": vars(args),
+        "cold": cold,
+        "warm_file_ids": warm,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--playlist-size", type=int, default=30)
+    parser.add_argument("--quality", type=int, default=128)
+    parser.add_argument("--file-kb", type=int, default=256)
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="seconds added to every Bot API call")
+    parser.add_argument("--output", help="write JSON results to this file as well as stdout")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    config = UpstreamConfig(
+        telegram=ServiceProfile(latency=args.telegram_latency),
+        file_size=args.file_kb * 1024,
+        playlist_size=args.playlist_size,
+    )
+    fakes = FakeUpstreams(config).start()
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            apply_environment(fakes.environment(), data_dir)
+            results = asyncio.run(run(args, fakes))
+    finally:
+        fakes.stop()
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Bitrate Fitting Benchmark
+Requests tracks of different lengths at a chosen quality (link, then the
+quality button) and reports what happened: whether audio was delivered, the
+bitrate of the file that was sent, the bytes downloaded from the converter
+and the time from the button press to the last status message. Long tracks
+show whether a file over TELEGRAM_UPLOAD_LIMIT is downloaded only to be
+thrown away.
+
+Usage:
+    python benchmarks/bench_bitrate.py --cases 4x320,25x320,60x128
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+import time
+
+from common import apply_environment, callback_update, feed, git_revision, message_update, start_application
+from fakes import FakeUpstreams, track_id
+
+
+async def one_case(application, fakes, n, minutes, quality):
+    user_id = 100 + n
+    fakes.config.track_duration_ms = minutes * 60_000
+    downloaded = fakes.y2mate.download_bytes
+    uploaded = fakes.telegram.upload_bytes
+    link = f"https://open.spotify.com/track/{track_id(1000 + n)}"
+
+    await feed(application, message_update(2 * user_id, user_id, link))
+    start = time.perf_counter()
+    await feed(application, callback_update(2 * user_id + 1, user_id, f"quality_{quality}"))
+    elapsed = time.perf_counter() - start
+
+    sent = fakes.telegram.upload_bytes - uploaded
+    return {
+        "minutes": minutes,
+        "requested_kbps": quality,
+        "delivered": fakes.telegram.audio_by_chat[user_id] > 0,
+        "sent_kbps": round(sent * 8 / (minutes * 60) / 1000) if sent else None,
+        "downloaded_mb": round((fakes.y2mate.download_bytes - downloaded) / (1024 * 1024), 1),
+        "wall_s": round(elapsed, 3),
+        "last_message": fakes.telegram.messages_by_chat[user_id][-1],
+    }
+
+
+async def run(args, fakes):
+    application = await start_application()
+    cases = [tuple(int(v) for v in case.split("x")) for case in args.cases.split(",")]
+    try:
+        results = [await one_case(application, fakes, n, minutes, quality) for n, (minutes, quality) in enumerate(cases)]
+    finally:
+        await application.shutdown()
+    return {"benchmark": "bitrate", "revision": git_revision(), "parameters": vars(args), "cases": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", default="4x320,25x320,60x128", help="comma-separated MINUTESxKBPS requests")
+    parser.add_argument("--output", help="write JSON results to this file as well as stdout")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    fakes = FakeUpstreams().start()
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            apply_environment(fakes.environment(), data_dir)
+            results = asyncio.run(run(args, fakes))
+    finally:
+        fakes.stop()
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+End-to-end Benchmark
+Drives the real handlers (link message -> quality button -> audio upload)
+against local fakes of Spotify, YouTube, Y2Mate and the Telegram Bot API,
+and reports throughput and p50/p95/p99 latency as JSON, both end to end and
+from the button press (with --think-time, what the user waits for).
+
+Usage:
+    python benchmarks/bench_e2e.py --requests 100 --concurrency 10 --file-kb 512 \
+        --youtube-latency 0.05 --y2mate-latency 0.1 --output results.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import tempfile
+import time
+
+from common import (
+    apply_environment, callback_update, feed, git_revision, latency_summary,
+    message_update, stage_summary, start_application
+)
+from fakes import FakeUpstreams, ServiceProfile, UpstreamConfig, track_id
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50, help="number of end-to-end downloads")
+    parser.add_argument("--concurrency", type=int, default=10, help="simultaneous users")
+    parser.add_argument("--tracks", type=int, default=0, help="distinct tracks (0 = one per request)")
+    parser.add_argument("--quality", type=int, default=128)
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="seconds between the quality card and the button press")
+    parser.add_argument("--file-kb", type=int, default=0, help="128 kbps MP3 size; overrides --duration (0 = unused)")
+    parser.add_argument("--duration", type=int, default=180, help="track duration in seconds")
+    parser.add_argument("--bad-file-rate", type=float, default=0.0,
+                        help="fraction of downloads served as HTML pages or truncated files")
+    parser.add_argument("--youtube-page-kb", type=int, default=300)
+    for service in ("spotify", "youtube", "y2mate", "telegram"):
+        parser.add_argument(f"--{service}-latency", type=float, default=0.0)
+        parser.add_argument(f"--{service}-failure-rate", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform extra latency for every service")
+    parser.add_argument("--output", help="write JSON results to this file as well as stdout")
+    return parser.parse_args()
+
+
+def build_config(args):
+    def profile(service):
+        return ServiceProfile(
+            latency=getattr(args, f"{service}_latency"),
+            jitter=args.jitter,
+            failure_rate=getattr(args, f"{service}_failure_rate"),
+        )
+
+    return UpstreamConfig(
+        spotify=profile("spotify"),
+        youtube=profile("youtube"),
+        y2mate=profile("y2mate"),
+        telegram=profile("telegram"),
+        track_duration_ms=args.duration * 1000,
+        file_size=args.file_kb * 1024,
+        bad_file_rate=args.bad_file_rate,
+        youtube_page_kb=args.youtube_page_kb,
+    )
+
+
+async def run(args, fakes):
+    application = await start_application()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, tap_latencies, failures = [], [], 0
+    distinct = args.tracks or args.requests
+
+    async def one_download(i):
+        nonlocal failures
+        user_id = 1000 + i
+        link = f"https://open.spotify.com/track/{track_id(i % distinct)}"
+        async with semaphore:
+            start = time.perf_counter()
+            await feed(application, message_update(2 * i + 1, user_id, link))
+            await asyncio.sleep(args.think_time)
+            tapped = time.perf_counter()
+            await feed(application, callback_update(2 * i + 2, user_id, f"quality_{args.quality}"))
+            elapsed = time.perf_counter() - start
+        if fakes.telegram.audio_by_chat[user_id]:
+            latencies.append(elapsed)
+            tap_latencies.append(time.perf_counter() - tapped)
+        else:
+            failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_download(i) for i in range(args.requests)))
+    wall = time.perf_counter() - start
+    await application.shutdown()
+
+    return {
+        "benchmark": "e2e",
+        "revision": git_revision(),
+        "parameters": vars(args),
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(latencies) / wall, 3) if wall else 0.0,
+        "succeeded": len(latencies),
+        "failed": failures,
+        "latency": latency_summary(latencies),
+        "after_tap_latency": latency_summary(tap_latencies),
+        "stages": stage_summary(),
+        "upstream_calls": {
+            "spotify": dict(fakes.spotify.calls),
+            "youtube": dict(fakes.youtube.calls),
+            "y2mate": dict(fakes.y2mate.calls),
+            "telegram": dict(fakes.telegram.calls),
+        },
+        "uploaded_bytes": fakes.telegram.upload_bytes,
+    }
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    fakes = FakeUpstreams(build_config(args)).start()
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            apply_environment(fakes.environment(), data_dir)
+            results = asyncio.run(run(args, fakes))
+    finally:
+        fakes.stop()
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0 if results["succeeded"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
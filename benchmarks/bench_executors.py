@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Stage Executor Benchmark
+Keeps a number of slow downloads running (bandwidth-limited fake Y2Mate) and
+meanwhile sends new track links, timing how long the bot takes to answer
+each link with its quality card. That answer needs only a Spotify lookup.
+
+    shared   every stage runs on one thread pool the size of asyncio's default
+             executor, as when everything used run_in_executor(None, ...)
+    staged   the per-stage executors from bot/executors.py
+
+Usage:
+    python benchmarks/bench_executors.py --downloads 8 --lookups 40 --shared-workers 5
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import apply_environment, feed, git_revision, latency_summary, message_update, start_application
+from fakes import FakeUpstreams, UpstreamConfig, track_id
+
+
+def share_one_pool(workers):
+    """Point every stage executor at a single thread pool (benchmark-only reach into the pools)."""
+    from bot import executors
+
+    pool = ThreadPoolExecutor(workers, thread_name_prefix="shared")
+    for executor in executors.EXECUTORS:
+        executor._pool = pool
+        executor.max_workers = workers
+
+
+async def run(args):
+    from bot import executors
+    from bot.handlers import get_audio_processor, get_spotify_client
+
+    if args.mode == "shared":
+        share_one_pool(args.shared_workers)
+    application = await start_application()
+    processor, spotify = get_audio_processor(), get_spotify_client()
+
+    async def one_download(i):
+        track_info = await spotify.get_track_info(track_id(i))
+        return await processor.download_track(track_info, 128)
+
+    downloads = [asyncio.create_task(one_download(i)) for i in range(args.downloads)]
+    await asyncio.sleep(args.settle)
+
+    latencies = []
+    for i in range(args.lookups):
+        link = f"https://open.spotify.com/track/{track_id(10_000 + i)}"
+        latencies.append(await feed(application, message_update(i + 1, 5000 + i, link)))
+        await asyncio.sleep(args.interval)
+    stats = executors.executor_stats()
+
+    started = time.perf_counter()
+    finished = sum(1 for path in await asyncio.gather(*downloads) if path)
+    drain = time.perf_counter() - started
+    await application.shutdown()
+
+    return {
+        "mode": args.mode,
+        "lookup_latency": latency_summary(latencies),
+        "downloads_finished": finished,
+        "download_drain_s": round(drain, 3),
+        "executors_during_lookups": stats,
+    }
+
+
+def child(args):
+    logging.basicConfig(level=logging.ERROR)
+    config = UpstreamConfig(file_size=args.file_kb * 1024, download_bandwidth=args.bandwidth_kb * 1024)
+    fakes = FakeUpstreams(config).start()
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            apply_environment(fakes.environment(), data_dir)
+            print(json.dumps(asyncio.run(run(args))), flush=True)
+    finally:
+        fakes.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--downloads", type=int, default=8, help="slow downloads kept running")
+    parser.add_argument("--lookups", type=int, default=40, help="links sent while they run")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between links")
+    parser.add_argument("--settle", type=float, default=1.0, help="seconds to let downloads start first")
+    parser.add_argument("--file-kb", type=int, default=2048)
+    parser.add_argument("--bandwidth-kb", type=int, default=256, help="per-download transfer rate")
+    parser.add_argument("--shared-workers", type=int, default=min(32, (os.cpu_count() or 1) + 4),
+                        help="size of the shared pool (asyncio's default executor size)")
+    parser.add_argument("--mode", choices=("shared", "staged"), help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write JSON results to this file as well as stdout")
+    args = parser.parse_args()
+
+    if args.mode:
+        child(args)
+        return 0
+
+    # One fresh interpreter per mode: config and the executors are fixed at import time
+    results = {"benchmark": "executors", "revision": git_revision(), "parameters": vars(args), "modes": {}}
+    for mode in ("shared", "staged"):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--mode", mode],
+            check=True, stdout=subprocess.PIPE, text=True
+        ).stdout
+        results["modes"][mode] = json.loads(output.strip().splitlines()[-1])
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
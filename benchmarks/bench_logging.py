@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Logging Benchmark
+Measures what a log call costs the thread that makes it when the output is
+slow (every write to the sink sleeps), the situation of a busy stderr pipe.
+
+    sync     logging.basicConfig-style StreamHandler and f-string messages,
+             formatted and written in the calling thread
+    queued   bot.logs.setup_logging(): lazy %-style messages, queued for the
+             background writer thread
+
+Each mode logs the same per-download INFO line and, 20 times as often, a
+DEBUG detail line (dropped by the level in sync mode, sampled in queued mode
+when --level DEBUG).
+
+Usage:
+    python benchmarks/bench_logging.py --records 5000 --write-delay-ms 1
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+from common import git_revision, latency_summary
+
+
+class SlowSink:
+    """File-like object whose writes take `delay` seconds each."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.lines = 0
+
+    def write(self, text):
+        time.sleep(self.delay)
+        self.lines += text.count("\n")
+
+    def flush(self):
+        pass
+
+
+def log_calls(logger, records, lazy):
+    track = {"name": "Believer", "artist": "Imagine Dragons"}
+    url = "https://dl.example/file/0pqnGHJpmpxLKifKRmU6WP_128.mp3"
+    costs = []
+    for i in range(records):
+        start = time.perf_counter()
+        if lazy:
+            logger.info("Searching via Y2Mate: %s %s", track['name'], track['artist'])
+            for _ in range(20):
+                logger.debug("Downloading from: %s", url)
+        else:
+            logger.info(f"Searching via Y2Mate: {track['name']} {track['artist']}")
+            for _ in range(20):
+                logger.debug(f"Downloading from: {url}")
+        costs.append(time.perf_counter() - start)
+    return costs
+
+
+def run(mode, args):
+    sink = SlowSink(args.write_delay_ms / 1000)
+    logger = logging.getLogger("bench")
+    if mode == "sync":
+        logging.basicConfig(
+            stream=sink, level=args.level,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        )
+    else:
+        from bot.logs import setup_logging
+        setup_logging(level=args.level, fmt="json", stream=sink)
+
+    started = time.perf_counter()
+    costs = log_calls(logger, args.records, lazy=(mode == "queued"))
+    caller_s = time.perf_counter() - started
+
+    if mode == "queued":
+        from bot.logs import stop_logging
+        stop_logging()
+    drained_s = time.perf_counter() - started
+
+    from bot.metrics import LOG_RECORDS_DROPPED
+    return {
+        "mode": mode,
+        "per_iteration": latency_summary(costs),
+        "caller_total_s": round(caller_s, 3),
+        "until_written_s": round(drained_s, 3),
+        "lines_written": sink.lines,
+        "dropped": LOG_RECORDS_DROPPED.get(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=5000, help="iterations (1 INFO + 20 DEBUG calls each)")
+    parser.add_argument("--write-delay-ms", type=float, default=1.0, help="time every write to the sink takes")
+    parser.add_argument("--level", default="INFO")
+    parser.add_argument("--mode", choices=("sync", "queued"), help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write JSON results to this file as well as stdout")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.mode, args)))
+        return 0
+
+    # A fresh interpreter per mode, since logging is configured once per process
+    results = {"benchmark": "logging", "revision": git_revision(), "parameters": vars(args), "modes": {}}
+    for mode in ("sync", "queued"):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--mode", mode],
+            check=True, stdout=subprocess.PIPE, text=True
+        ).stdout
+        results["modes"][mode] = json.loads(output.strip().splitlines()[-1])
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark
+Spawns fresh interpreters and measures how long a cold bot process takes to
+import its handlers, initialize the Application and answer its first /start
+(against the fake Bot API). Also reports which heavy modules were loaded
+before that first response.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HEAVY_MODULES = ("bs4", "spotipy", "requests", "urllib3")
+
+
+def child():
+    """Runs in the spawned interpreter; prints one JSON line once /start is answered."""
+    start = time.perf_counter()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from common import feed, message_update, start_application
+
+    import bot.handlers  # noqa: F401
+    imported = time.perf_counter()
+
+    async def first_response():
+        application = await start_application()
+        initialized = time.perf_counter()
+        await feed(application, message_update(1, 42, "/start"))
+        answered = time.perf_counter()
+        loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+        print(json.dumps({
+            "import_ms": round((imported - start) * 1000, 2),
+            "init_ms": round((initialized - imported) * 1000, 2),
+            "first_response_ms": round((answered - start) * 1000, 2),
+            "heavy_modules_loaded": loaded,
+        }), flush=True)
+        await application.shutdown()
+
+    asyncio.run(first_response())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write JSON results to this file as well as stdout")
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return 0
+
+    from common import git_revision
+    from fakes import FakeUpstreams
+
+    fakes = FakeUpstreams().start()
+    runs = []
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            env = dict(os.environ, **fakes.environment(), DATA_DIR=data_dir)
+            for _ in range(args.runs):
+                spawned = time.perf_counter()
+                process = subprocess.Popen(
+                    [sys.executable, os.path.abspath(__file__), "--child"],
+                    env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+                )
+                line = process.stdout.readline()
+                wall = time.perf_counter() - spawned
+                process.wait()
+                if not line:
+                    raise SystemExit("child process produced no result")
+                result = json.loads(line)
+                result["spawn_to_first_response_ms"] = round(wall * 1000, 2)
+                runs.append(result)
+    finally:
+        fakes.stop()
+
+    def median(key):
+        values = sorted(run[key] for run in runs)
+        return values[len(values) // 2]
+
+    results = {
+        "benchmark": "startup",
+        "revision": git_revision(),
+        "runs": runs,
+        "median": {key: median(key) for key in ("import_ms", "init_ms", "first_response_ms",
+                                                 "spawn_to_first_response_ms")},
+    }
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
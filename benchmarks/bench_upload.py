@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Upload Benchmark
+Times sending one MP3 to a local stand-in of the Bot API in three ways:
+
+    buffered   the old path: send_audio(open(path)), file read into memory first
+    streamed   handlers.upload_audio against the public API: chunked multipart from an open handle
+    local      handlers.upload_audio in local mode: only the file path is sent
+
+For each it reports wall time, effective MB/s, bytes that crossed the HTTP
+connection, the largest event-loop stall during the upload and the peak
+Python memory allocated. The fake Bot API runs in a separate process so its
+multipart parsing does not pollute the client-side numbers.
+
+Usage:
+    python benchmarks/bench_upload.py --sizes-mb 10,100 --runs 3
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from common import apply_environment, git_revision, latency_summary
+from fakes import FakeUpstreams, make_mp3
+
+MODES = ("buffered", "streamed", "local")
+
+
+def serve_fakes(conn):
+    """Child process: run the fakes and answer upload_bytes queries until told to stop."""
+    fakes = FakeUpstreams().start()
+    conn.send(fakes.environment())
+    while conn.recv() != "stop":
+        conn.send(fakes.telegram.upload_bytes)
+    fakes.stop()
+
+
+async def max_loop_stall(stop, interval=0.005):
+    """Probe the loop while an upload runs; return the worst lateness in seconds."""
+    loop = asyncio.get_running_loop()
+    worst = 0.0
+    while not stop.is_set():
+        scheduled = loop.time()
+        await asyncio.sleep(interval)
+        worst = max(worst, loop.time() - scheduled - interval)
+    return worst
+
+
+async def upload_once(bot, mode, path):
+    from bot.handlers import upload_audio
+
+    if mode == "buffered":
+        return await bot.send_audio(chat_id=1, audio=open(path, "rb"), write_timeout=300)
+    return await upload_audio(bot, 1, path)
+
+
+async def run(args, fakes_conn, workdir):
+    from telegram import Bot
+    from config import TELEGRAM_API_URL, TELEGRAM_BOT_TOKEN
+
+    results = []
+    for size_mb in [int(s) for s in args.sizes_mb.split(",")]:
+        path = os.path.join(workdir, f"bench_{size_mb}mb.mp3")
+        with open(path, "wb") as f:
+            f.write(make_mp3(size_mb * 1024 * 1024))
+
+        for mode in MODES:
+            bot = Bot(
+                TELEGRAM_BOT_TOKEN,
+                base_url=f"{TELEGRAM_API_URL}/bot",
+                base_file_url=f"{TELEGRAM_API_URL}/file/bot",
+                local_mode=mode == "local",
+            )
+            async with bot:
+                durations, stalls, peaks = [], [], []
+                fakes_conn.send("upload_bytes")
+                bytes_before = fakes_conn.recv()
+                for _ in range(args.runs):
+                    stop = asyncio.Event()
+                    probe = asyncio.create_task(max_loop_stall(stop))
+                    tracemalloc.start()
+                    started = time.perf_counter()
+                    await upload_once(bot, mode, path)
+                    durations.append(time.perf_counter() - started)
+                    peaks.append(tracemalloc.get_traced_memory()[1])
+                    tracemalloc.stop()
+                    stop.set()
+                    stalls.append(await probe)
+                fakes_conn.send("upload_bytes")
+                sent = (fakes_conn.recv() - bytes_before) // args.runs
+
+            mean = sum(durations) / len(durations)
+            results.append({
+                "size_mb": size_mb,
+                "mode": mode,
+                "latency": latency_summary(durations),
+                "mb_per_s": round(size_mb / mean, 1) if mean else None,
+                "http_bytes_per_upload": sent,
+                "max_loop_stall_ms": round(max(stalls) * 1000, 2),
+                "peak_python_alloc_mb": round(max(peaks) / (1024 * 1024), 1),
+            })
+        os.remove(path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", default="10,100")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", help="write JSON results to this file as well as stdout")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.get_context("spawn").Process(target=serve_fakes, args=(child_conn,), daemon=True)
+    server.start()
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            apply_environment(conn.recv(), data_dir)
+            results = asyncio.run(run(args, conn, data_dir))
+    finally:
+        conn.send("stop")
+        server.join(10)
+
+    output = json.dumps({
+        "benchmark": "upload",
+        "revision": git_revision(),
+        "parameters": vars(args),
+        "results": results,
+    }, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
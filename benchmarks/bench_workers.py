@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Worker Scaling Benchmark
+Measures job throughput of the shared job queue for different worker counts.
+
+Each job simulates an I/O-bound download with a fixed sleep. Jobs are spread
+over a small set of track keys so the partitioning rule (one track is never
+processed by two workers at once) is exercised and verified.
+
+Usage:
+    python benchmarks/bench_workers.py --jobs 200 --tracks 50 --delay 0.05 --workers 1 2 4 8
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.job_queue import JobQueue  # noqa: E402
+from worker import worker_loop  # noqa: E402
+
+
+def _bench_worker(worker_id, queue_path, delay, log_path):
+    async def handle_job(payload):
+        start = time.monotonic()
+        await asyncio.sleep(delay)
+        with open(log_path, "a") as f:
+            f.write(json.dumps([payload["track_key"], start, time.monotonic()]) + "\n")
+        return True
+
+    asyncio.run(worker_loop(worker_id, handle_job, queue_path,
+                            poll_interval=0.005, stop_when_empty=True))
+
+
+def _count_overlaps(log_path):
+    spans = {}
+    with open(log_path) as f:
+        for line in f:
+            key, start, end = json.loads(line)
+            spans.setdefault(key, []).append((start, end))
+
+    overlaps = 0
+    for intervals in spans.values():
+        intervals.sort()
+        for (_, prev_end), (start, _) in zip(intervals, intervals[1:]):
+            if start < prev_end:
+                overlaps += 1
+    return overlaps
+
+
+def run(workers, jobs, tracks, delay):
+    with tempfile.TemporaryDirectory() as tmp:
+        queue_path = os.path.join(tmp, "jobs.db")
+        log_path = os.path.join(tmp, "spans.jsonl")
+        queue = JobQueue(queue_path)
+        for i in range(jobs):
+            key = f"track-{i % tracks}"
+            queue.enqueue(key, {"track_key": key})
+
+        ctx = multiprocessing.get_context("spawn")
+        processes = [
+            ctx.Process(target=_bench_worker, args=(f"bench-{i}", queue_path, delay, log_path))
+            for i in range(workers)
+        ]
+        start = time.monotonic()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.monotonic() - start
+
+        return {
+            "workers": workers,
+            "jobs": jobs,
+            "elapsed_s": round(elapsed, 3),
+            "jobs_per_s": round(jobs / elapsed, 2),
+            "same_track_overlaps": _count_overlaps(log_path),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--tracks", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.05, help="simulated download time per job (s)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    results = [run(n, args.jobs, args.tracks, args.delay) for n in args.workers]
+    baseline = results[0]["jobs_per_s"] / results[0]["workers"]
+    for result in results:
+        result["scaling_efficiency"] = round(result["jobs_per_s"] / (baseline * result["workers"]), 2)
+
+    print(json.dumps({"benchmark": "workers", "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
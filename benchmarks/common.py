@@ -0,0 +1,133 @@
+"""
+Shared helpers for the benchmark scripts: latency statistics, synthetic
+Telegram updates and an Application wired to the fake upstreams.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(seconds):
+    """Summarize latencies (in seconds) as milliseconds."""
+    values = sorted(seconds)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 2),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def stage_summary():
+    """Mean and count of every pipeline stage recorded by bot.metrics in this process."""
+    from bot.metrics import STAGE_SECONDS
+    return {
+        key[0]: {"count": value["count"], "mean_ms": round(value["mean"] * 1000, 2)}
+        for key, value in STAGE_SECONDS.summary().items()
+    }
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def message_update(update_id, user_id, text):
+    """Raw Update dict for a private text message (commands get a bot_command entity)."""
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+def callback_update(update_id, user_id, data, message_id=1):
+    """Raw Update dict for an inline button press on a bot message."""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "Bench"},
+                "text": "card",
+            },
+        },
+    }
+
+
+def apply_environment(env, data_dir):
+    """Point config.py at the fakes. Must run before anything imports `bot` or `config`."""
+    os.environ.update(env)
+    os.environ["DATA_DIR"] = data_dir
+    if "config" in sys.modules:
+        raise RuntimeError("apply_environment() must be called before importing config")
+
+
+async def start_application(**builder_options):
+    """Build and initialize an Application using the real handlers and no updater."""
+    from telegram.ext import Application
+    from config import TELEGRAM_API_URL, TELEGRAM_BOT_TOKEN, TELEGRAM_LOCAL_MODE
+    from bot.handlers import register_handlers
+
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .base_url(f"{TELEGRAM_API_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        .local_mode(TELEGRAM_LOCAL_MODE)
+        .concurrent_updates(True)
+        .updater(None)
+    )
+    for name, value in builder_options.items():
+        builder = getattr(builder, name)(value)
+    application = builder.build()
+    register_handlers(application)
+    await application.initialize()
+    return application
+
+
+async def feed(application, raw_update):
+    """Process one raw update through the Application and return the elapsed seconds."""
+    from telegram import Update
+
+    update = Update.de_json(raw_update, application.bot)
+    start = time.perf_counter()
+    await application.process_update(update)
+    return time.perf_counter() - start
@@ -0,0 +1,396 @@
+"""
+Local stand-ins for the upstream services the bot talks to.
+
+Each fake is a small threaded HTTP server with configurable latency, failure
+rate and payload sizes:
+
+- FakeSpotify: client-credentials token endpoint plus tracks/albums/playlists
+- FakeYouTube: search results page containing a videoId
+- FakeY2Mate: analyze -> convert -> file download hops, serving MP3 frames
+- FakeTelegram: Bot API methods used by the bot, recording every call
+
+FakeUpstreams starts all of them and returns the environment variables that
+point config.py at them. Set those before importing anything from `bot`.
+"""
+
+import email.parser
+import email.policy
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# MPEG-1 Layer III, 44.1 kHz, stereo frame headers by bitrate (kbps)
+MP3_BITRATE_INDEX = {128: 0x9, 192: 0xB, 256: 0xD, 320: 0xE}
+
+
+def make_mp3(size: int, bitrate: int = 128) -> bytes:
+    """Build `size` bytes that look like an MP3: an ID3v2 header followed by frames."""
+    id3 = b"ID3\x03\x00\x00\x00\x00\x00\x00"
+    header = bytes((0xFF, 0xFB, MP3_BITRATE_INDEX.get(bitrate, 0x9) << 4, 0x00))
+    frame_size = 144 * bitrate * 1000 // 44100
+    frame = header + b"\x00" * (frame_size - len(header))
+    count = max(size - len(id3), 0) // frame_size + 1
+    return (id3 + frame * count)[:size]
+
+
+def track_id(n: int) -> str:
+    """Deterministic 22-character Spotify-style ID for synthetic track n."""
+    return f"bench{n:017d}"
+
+
+@dataclass
+class ServiceProfile:
+    """Latency and failure behaviour of one fake service."""
+    latency: float = 0.0  # Seconds added to every request
+    jitter: float = 0.0  # Uniform random extra seconds
+    failure_rate: float = 0.0  # Fraction of requests answered with HTTP 503
+
+    def delay(self):
+        wait = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if wait:
+            time.sleep(wait)
+
+    def should_fail(self) -> bool:
+        return self.failure_rate > 0 and random.random() < self.failure_rate
+
+
+@dataclass
+class UpstreamConfig:
+    spotify: ServiceProfile = field(default_factory=ServiceProfile)
+    youtube: ServiceProfile = field(default_factory=ServiceProfile)
+    y2mate: ServiceProfile = field(default_factory=ServiceProfile)
+    telegram: ServiceProfile = field(default_factory=ServiceProfile)
+    track_duration_ms: int = 180_000
+    file_size: int = 0  # Bytes per 128 kbps MP3 (the duration is derived from it); 0 = duration x bitrate
+    bad_file_rate: float = 0.0  # Fraction of downloads answered with an HTML page or a truncated file
+    youtube_page_kb: int = 300  # Size of the search results page (parse cost)
+    download_bandwidth: float = 0.0  # Bytes/s for file downloads; 0 is unlimited
+    album_size: int = 12
+    playlist_size: int = 30
+
+    def duration_ms(self) -> int:
+        """Track duration reported by Spotify, consistent with the MP3 size served."""
+        if self.file_size:
+            return self.file_size * 8 // 128
+        return self.track_duration_ms
+
+
+class _Request:
+    def __init__(self, handler: BaseHTTPRequestHandler, body: bytes):
+        parsed = urlparse(handler.path)
+        self.method = handler.command
+        self.path = parsed.path
+        self.query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        self.headers = handler.headers
+        self.body = body
+
+
+class _Response:
+    def __init__(self, status=200, body=b"", content_type="application/json", chunk_delay=0.0):
+        self.status = status
+        self.body = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.content_type = content_type
+        self.chunk_delay = chunk_delay
+
+
+class _FakeServer:
+    """Base class: runs a ThreadingHTTPServer on 127.0.0.1 with a random port."""
+
+    def __init__(self, profile: ServiceProfile):
+        self.profile = profile
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                request = _Request(self, body)
+                fake.profile.delay()
+                if fake.profile.should_fail():
+                    response = _Response(503, {"ok": False, "error": "injected failure"})
+                else:
+                    try:
+                        response = fake.handle(request)
+                    except Exception as e:
+                        response = _Response(500, {"ok": False, "error": str(e)})
+                self.send_response(response.status)
+                self.send_header("Content-Type", response.content_type)
+                self.send_header("Content-Length", str(len(response.body)))
+                self.end_headers()
+                if response.chunk_delay:
+                    for i in range(0, len(response.body), 65536):
+                        self.wfile.write(response.body[i:i + 65536])
+                        time.sleep(response.chunk_delay)
+                else:
+                    self.wfile.write(response.body)
+
+            do_GET = _dispatch
+            do_POST = _dispatch
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, name=type(self).__name__, daemon=True)
+
+    def count(self, name: str):
+        with self._lock:
+            self.calls[name] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, request: _Request) -> _Response:
+        raise NotImplementedError
+
+
+class FakeSpotify(_FakeServer):
+    def __init__(self, config: UpstreamConfig):
+        super().__init__(config.spotify)
+        self.config = config
+
+    def _track(self, spotify_id: str, number: int = 1):
+        return {
+            "id": spotify_id,
+            "type": "track",
+            "name": f"Track {spotify_id[-6:]}",
+            "artists": [{"name": "Bench Artist"}],
+            "album": {"name": "Bench Album", "release_date": "2020-01-01", "images": []},
+            "duration_ms": self.config.duration_ms(),
+            "popularity": int(hashlib.md5(spotify_id.encode()).hexdigest(), 16) % 100,
+            "preview_url": None,
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{spotify_id}"},
+            "track_number": number,
+        }
+
+    def handle(self, request):
+        parts = request.path.strip("/").split("/")
+        if request.path == "/api/token":
+            self.count("token")
+            return _Response(body={"access_token": "bench", "token_type": "Bearer", "expires_in": 3600})
+        if parts[:2] == ["v1", "tracks"] and len(parts) == 3:
+            self.count("track")
+            return _Response(body=self._track(parts[2]))
+        if parts[:2] == ["v1", "tracks"]:
+            self.count("tracks")
+            ids = request.query.get("ids", "").split(",")
+            return _Response(body={"tracks": [self._track(i) for i in ids if i]})
+        if parts[:2] == ["v1", "albums"]:
+            self.count("album")
+            tracks = [self._track(f"{parts[2][:15]}{n:07d}", n) for n in range(1, self.config.album_size + 1)]
+            return _Response(body={
+                "id": parts[2], "name": "Bench Album", "artists": [{"name": "Bench Artist"}],
+                "tracks": {"items": tracks}, "total_tracks": len(tracks), "release_date": "2020-01-01",
+                "genres": [], "popularity": 50, "images": [],
+            })
+        if parts[:2] == ["v1", "playlists"]:
+            self.count("playlist")
+            items = [{"track": self._track(f"{parts[2][:15]}{n:07d}", n)}
+                     for n in range(1, self.config.playlist_size + 1)]
+            return _Response(body={
+                "id": parts[2], "name": "Bench Playlist", "description": "",
+                "owner": {"display_name": "bench"}, "followers": {"total": 0}, "images": [],
+                "tracks": {"items": items, "next": None},
+            })
+        return _Response(404, {"error": "not found"})
+
+
+class FakeYouTube(_FakeServer):
+    def __init__(self, config: UpstreamConfig):
+        super().__init__(config.youtube)
+        self.config = config
+        filler = "<script>var filler = '" + "x" * 1000 + "';</script>\n"
+        self._padding = filler * max(config.youtube_page_kb, 0)
+
+    def handle(self, request):
+        if request.path != "/results":
+            return _Response(404, {"error": "not found"})
+        self.count("search")
+        video_id = hashlib.md5(request.query.get("search_query", "").encode()).hexdigest()[:11]
+        html = (
+            "<html><head>" + self._padding +
+            f'<script>var ytInitialData = {{"videoRenderer":{{"videoId":"{video_id}"}}}};</script>'
+            "</head><body></body></html>"
+        )
+        return _Response(body=html.encode(), content_type="text/html; charset=utf-8")
+
+
+class FakeY2Mate(_FakeServer):
+    def __init__(self, config: UpstreamConfig):
+        super().__init__(config.y2mate)
+        self.config = config
+        self._files = {}
+        self.download_prefix = f"{self.url}/dl"
+        self.download_bytes = 0
+
+    def _file(self, quality: int) -> bytes:
+        size = self.config.duration_ms() * quality // 8
+        if size not in self._files:
+            self._files[size] = make_mp3(size, quality)
+        return self._files[size]
+
+    def handle(self, request):
+        if request.path == "/mates/en68/analyze/ajax":
+            self.count("analyze")
+            form = {k: v[0] for k, v in parse_qs(request.body.decode()).items()}
+            video_id = form.get("url", "").rsplit("=", 1)[-1]
+            links = "".join(
+                f'<a href="/mates/en68/convert?v={video_id}&q={q}">MP3 {q}kbps</a>' for q in (128, 192, 320)
+            )
+            return _Response(body={"status": "ok", "result": f"<div>{links}</div>"})
+        if request.path == "/mates/en68/convert":
+            self.count("convert")
+            name = f"{request.query.get('v', 'x')}_{request.query.get('q', '128')}.mp3"
+            html = f'<html><body><a href="{self.download_prefix}/{name}">Download</a></body></html>'
+            return _Response(body=html.encode(), content_type="text/html")
+        if request.path.startswith("/dl/"):
+            self.count("download")
+            quality = int(request.path.rsplit("_", 1)[-1].split(".")[0] or 128)
+            body = self._file(quality)
+            if self.config.bad_file_rate and random.random() < self.config.bad_file_rate:
+                self.count("bad_file")
+                if random.random() < 0.5:
+                    return _Response(body=b"<html><body>Conversion failed</body></html>", content_type="text/html")
+                return _Response(body=body[:len(body) // 10], content_type="audio/mpeg")
+            with self._lock:
+                self.download_bytes += len(body)
+            chunk_delay = 65536 / self.config.download_bandwidth if self.config.download_bandwidth else 0.0
+            return _Response(body=body, content_type="audio/mpeg", chunk_delay=chunk_delay)
+        return _Response(404, {"error": "not found"})
+
+
+class FakeTelegram(_FakeServer):
+    """Minimal Bot API: records calls per method and chat, and bytes uploaded."""
+
+    def __init__(self, config: UpstreamConfig):
+        super().__init__(config.telegram)
+        self._message_ids = 0
+        self.upload_bytes = 0
+        self.audio_by_chat = Counter()
+        self.messages_by_chat = defaultdict(list)
+        self.local_paths = []
+
+    def _params(self, request):
+        content_type = request.headers.get("Content-Type", "")
+        params, files = {}, {}
+        if content_type.startswith("multipart/form-data"):
+            message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                f"Content-Type: {content_type}\r\n\r\n".encode() + request.body
+            )
+            for part in message.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                payload = part.get_payload(decode=True) or b""
+                if part.get_filename():
+                    files[name] = len(payload)
+                else:
+                    params[name] = payload.decode()
+        elif request.body:
+            params = {k: v[0] for k, v in parse_qs(request.body.decode()).items()}
+        decoded = {}
+        for key, value in params.items():
+            try:
+                decoded[key] = json.loads(value)
+            except (TypeError, ValueError):
+                decoded[key] = value
+        return decoded, files
+
+    def _message(self, chat_id, **extra):
+        with self._lock:
+            self._message_ids += 1
+            message_id = self._message_ids
+        message = {"message_id": message_id, "date": int(time.time()),
+                   "chat": {"id": int(chat_id), "type": "private"}}
+        message.update(extra)
+        return message
+
+    def _audio(self, params, files, key="audio"):
+        source = params.get(key)
+        if isinstance(source, str) and source.startswith("file://"):
+            self.local_paths.append(source)
+        file_id = hashlib.md5(f"{time.time()}{random.random()}".encode()).hexdigest()
+        return {"file_id": file_id, "file_unique_id": file_id[:16], "duration": int(params.get("duration") or 0)}
+
+    def handle(self, request):
+        method = request.path.rsplit("/", 1)[-1]
+        self.count(method)
+        params, files = self._params(request)
+        with self._lock:
+            self.upload_bytes += sum(files.values())
+        chat_id = params.get("chat_id", 0)
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(chat_id, text=params.get("text", ""))
+            with self._lock:
+                self.messages_by_chat[int(chat_id)].append(params.get("text", ""))
+        elif method == "sendAudio":
+            result = self._message(chat_id, audio=self._audio(params, files))
+            with self._lock:
+                self.audio_by_chat[int(chat_id)] += 1
+        elif method == "sendMediaGroup":
+            media = params.get("media") or []
+            result = []
+            for item in media:
+                source = item.get("media", "")
+                item_params = {"audio": source, "duration": item.get("duration")}
+                result.append(self._message(chat_id, audio=self._audio(item_params, files)))
+            with self._lock:
+                self.audio_by_chat[int(chat_id)] += len(media)
+        elif method == "sendDocument":
+            result = self._message(chat_id, document={"file_id": "doc", "file_unique_id": "doc"})
+        elif method in ("answerCallbackQuery", "deleteMessage", "setMyCommands"):
+            result = True
+        else:
+            result = True
+        return _Response(body={"ok": True, "result": result})
+
+
+class FakeUpstreams:
+    """Start every fake and expose the environment that points the bot at them."""
+
+    def __init__(self, config: UpstreamConfig = None):
+        self.config = config or UpstreamConfig()
+        self.spotify = FakeSpotify(self.config)
+        self.youtube = FakeYouTube(self.config)
+        self.y2mate = FakeY2Mate(self.config)
+        self.telegram = FakeTelegram(self.config)
+
+    def start(self):
+        for fake in (self.spotify, self.youtube, self.y2mate, self.telegram):
+            fake.start()
+        return self
+
+    def stop(self):
+        for fake in (self.spotify, self.youtube, self.y2mate, self.telegram):
+            fake.stop()
+
+    def environment(self) -> dict:
+        return {
+            "TELEGRAM_BOT_TOKEN": "123456:BENCH",
+            "TELEGRAM_API_URL": self.telegram.url,
+            "SPOTIFY_CLIENT_ID": "bench",
+            "SPOTIFY_CLIENT_SECRET": "bench",
+            "SPOTIFY_API_URL": self.spotify.url,
+            "SPOTIFY_AUTH_URL": self.spotify.url,
+            "YOUTUBE_BASE_URL": self.youtube.url,
+            "Y2MATE_BASE_URL": self.y2mate.url,
+            "Y2MATE_DOWNLOAD_PREFIX": self.y2mate.download_prefix,
+        }
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Update Replay Load Generator
+Synthesizes (or replays recorded) Telegram update streams and feeds them to
+the bot's Application at a controlled, open-loop rate while a fake Bot API
+captures the responses. Reports per-update latency and error rates, and with
+--ramp steps through increasing rates to find where one instance saturates.
+
+Traffic shapes (mix with --mix trending=3,playlist=1,double_tap=1,idle=5):
+    trending    many users sending the same hot track link in a burst
+    playlist    long playlist links followed by a batch download
+    double_tap  the quality button pressed twice in quick succession
+    idle        /start, /help and chatter that never downloads anything
+    single      an ordinary one-track download
+
+Usage:
+    python benchmarks/loadgen.py --rate 5 --duration 30 --mix trending=2,single=3,idle=5
+    python benchmarks/loadgen.py --ramp 2,4,8,16 --duration 20 --y2mate-latency 0.3
+    python benchmarks/loadgen.py --rate 5 --duration 30 --record stream.jsonl
+    python benchmarks/loadgen.py --replay stream.jsonl --speed 2
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from common import (
+    apply_environment, callback_update, feed, git_revision, latency_summary,
+    message_update, start_application
+)
+from fakes import FakeUpstreams, ServiceProfile, UpstreamConfig, track_id
+
+ERROR_MARKERS = ("❌", "🚫", "⚠️")
+SHED_MARKER = "🚦"
+
+
+class StreamBuilder:
+    """Builds a time-ordered list of (offset_seconds, kind, raw_update)."""
+
+    def __init__(self, seed=0, catalog=500):
+        self.random = random.Random(seed)
+        self.catalog = catalog
+        self.update_id = 0
+        self.user_id = 10_000
+        self.events = []
+
+    def _next_ids(self):
+        self.update_id += 1
+        return self.update_id
+
+    def _new_user(self):
+        self.user_id += 1
+        return self.user_id
+
+    def _think(self):
+        return self.random.uniform(0.5, 2.0)
+
+    def _add(self, t, kind, raw):
+        self.events.append((t, kind, raw))
+
+    def single(self, t):
+        user = self._new_user()
+        link = f"https://open.spotify.com/track/{track_id(self.random.randrange(self.catalog))}"
+        self._add(t, "message", message_update(self._next_ids(), user, link))
+        self._add(t + self._think(), "callback", callback_update(self._next_ids(), user, "quality_128"))
+
+    def trending(self, t, hot_track=0, burst=10, window=2.0):
+        link = f"https://open.spotify.com/track/{track_id(hot_track)}"
+        for _ in range(burst):
+            user = self._new_user()
+            start = t + self.random.uniform(0, window)
+            self._add(start, "message", message_update(self._next_ids(), user, link))
+            self._add(start + self._think(), "callback", callback_update(self._next_ids(), user, "quality_128"))
+
+    def playlist(self, t):
+        user = self._new_user()
+        link = f"https://open.spotify.com/playlist/list{self.random.randrange(50):017d}"
+        self._add(t, "message", message_update(self._next_ids(), user, link))
+        self._add(t + self._think(), "callback", callback_update(self._next_ids(), user, "batch_128"))
+
+    def double_tap(self, t):
+        user = self._new_user()
+        link = f"https://open.spotify.com/track/{track_id(self.random.randrange(self.catalog))}"
+        self._add(t, "message", message_update(self._next_ids(), user, link))
+        tap = t + self._think()
+        self._add(tap, "callback", callback_update(self._next_ids(), user, "quality_128"))
+        self._add(tap + self.random.uniform(0.02, 0.3), "callback", callback_update(self._next_ids(), user, "quality_128"))
+
+    def idle(self, t):
+        user = self._new_user()
+        text = self.random.choice(["/start", "/help", "hello", "is this working?"])
+        self._add(t, "command" if text.startswith("/") else "message", message_update(self._next_ids(), user, text))
+
+    def synthesize(self, mix, rate, duration):
+        """Poisson arrivals of sessions at `rate` per second, shaped by the weighted mix."""
+        shapes, weights = zip(*mix.items())
+        t = 0.0
+        while True:
+            t += self.random.expovariate(rate)
+            if t >= duration:
+                break
+            getattr(self, self.random.choices(shapes, weights)[0])(t)
+        self.events.sort(key=lambda event: event[0])
+        return self.events
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("single", "trending", "playlist", "double_tap", "idle"):
+            raise SystemExit(f"Unknown traffic shape: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def load_stream(path):
+    events = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                events.append((record["t"], record.get("kind", "message"), record["update"]))
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def save_stream(path, events):
+    with open(path, "w") as f:
+        for t, kind, raw in events:
+            f.write(json.dumps({"t": round(t, 4), "kind": kind, "update": raw}) + "\n")
+
+
+def _chat_id(raw):
+    if "message" in raw:
+        return raw["message"]["chat"]["id"]
+    return raw["callback_query"]["message"]["chat"]["id"]
+
+
+async def drive(application, fakes, events, speed=1.0):
+    """Feed events at their scheduled offsets and collect per-update outcomes."""
+    latencies = defaultdict(list)
+    handler_errors = Counter()
+
+    async def on_error(update, context):
+        handler_errors[type(context.error).__name__] += 1
+
+    application.add_error_handler(on_error)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    lateness = []
+
+    async def fire(offset, kind, raw):
+        delay = start + offset / speed - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        lateness.append(max(0.0, loop.time() - (start + offset / speed)))
+        latencies[kind].append(await feed(application, raw))
+
+    await asyncio.gather(*(fire(*event) for event in events))
+    wall = loop.time() - start
+    application.remove_error_handler(on_error)
+
+    chats = {_chat_id(raw) for _, _, raw in events}
+    texts = [text for chat in chats for text in fakes.telegram.messages_by_chat.get(chat, [])]
+    user_errors = sum(1 for text in texts if text.startswith(ERROR_MARKERS))
+    shed = sum(1 for text in texts if text.startswith(SHED_MARKER))
+    total = sum(len(v) for v in latencies.values())
+
+    return {
+        "updates": total,
+        "wall_s": round(wall, 3),
+        "offered_rate": round(len(events) / (events[-1][0] / speed), 3) if events and events[-1][0] else None,
+        "achieved_rate": round(total / wall, 3) if wall else None,
+        "scheduler_lag": latency_summary(lateness),
+        "latency": {kind: latency_summary(values) for kind, values in latencies.items()},
+        "latency_all": latency_summary([v for values in latencies.values() for v in values]),
+        "audio_sent": sum(fakes.telegram.audio_by_chat.get(chat, 0) for chat in chats),
+        "handler_errors": dict(handler_errors),
+        "user_visible_errors": user_errors,
+        "shed": shed,
+        "error_rate": round((sum(handler_errors.values()) + user_errors) / total, 4) if total else 0.0,
+    }
+
+
+def saturated(result, max_p95_ms, max_error_rate):
+    p95 = result["latency_all"].get("p95_ms", 0)
+    return p95 > max_p95_ms or result["error_rate"] > max_error_rate or result["shed"] > 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=2.0, help="sessions started per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of traffic per step")
+    parser.add_argument("--mix", default="single=3,trending=2,double_tap=1,playlist=1,idle=5")
+    parser.add_argument("--ramp", help="comma-separated rates to step through, e.g. 1,2,4,8")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--catalog", type=int, default=500, help="distinct tracks for random requests")
+    parser.add_argument("--replay", help="JSONL stream to replay instead of synthesizing")
+    parser.add_argument("--record", help="write the synthesized stream to this JSONL file")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier")
+    parser.add_argument("--max-p95-ms", type=float, default=30_000, help="saturation threshold for --ramp")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="saturation threshold for --ramp")
+    parser.add_argument("--file-kb", type=int, default=256)
+    parser.add_argument("--playlist-size", type=int, default=30)
+    for service in ("spotify", "youtube", "y2mate", "telegram"):
+        parser.add_argument(f"--{service}-latency", type=float, default=0.0)
+        parser.add_argument(f"--{service}-failure-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write JSON results to this file as well as stdout")
+    return parser.parse_args()
+
+
+async def run(args, fakes):
+    application = await start_application()
+    steps = []
+    try:
+        if args.replay:
+            events = load_stream(args.replay)
+            steps.append({"source": args.replay, **await drive(application, fakes, events, args.speed)})
+        else:
+            rates = [float(r) for r in args.ramp.split(",")] if args.ramp else [args.rate]
+            for step, rate in enumerate(rates):
+                events = StreamBuilder(args.seed + step, args.catalog).synthesize(
+                    parse_mix(args.mix), rate, args.duration
+                )
+                if args.record and step == 0:
+                    save_stream(args.record, events)
+                result = {"rate": rate, **await drive(application, fakes, events)}
+                steps.append(result)
+                if args.ramp and saturated(result, args.max_p95_ms, args.max_error_rate):
+                    break
+    finally:
+        await application.shutdown()
+
+    saturation = None
+    if args.ramp:
+        saturation = next(
+            (s["rate"] for s in steps if saturated(s, args.max_p95_ms, args.max_error_rate)), None
+        )
+    return {
+        "benchmark": "loadgen",
+        "revision": git_revision(),
+        "parameters": vars(args),
+        "steps": steps,
+        "saturation_rate": saturation,
+    }
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    def profile(service):
+        return ServiceProfile(
+            latency=getattr(args, f"{service}_latency"),
+            failure_rate=getattr(args, f"{service}_failure_rate"),
+        )
+
+    config = UpstreamConfig(
+        spotify=profile("spotify"), youtube=profile("youtube"),
+        y2mate=profile("y2mate"), telegram=profile("telegram"),
+        file_size=args.file_kb * 1024, playlist_size=args.playlist_size,
+    )
+    fakes = FakeUpstreams(config).start()
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            apply_environment(fakes.environment(), data_dir)
+            started = time.perf_counter()
+            results = asyncio.run(run(args, fakes))
+            results["total_s"] = round(time.perf_counter() - started, 3)
+    finally:
+        fakes.stop()
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
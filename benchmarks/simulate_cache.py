@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Cache Policy Simulator
+Replays a workload trace (written by the bot with TRACE_ENABLED=1, see
+bot/trace.py) against several audio cache eviction policies and disk
+budgets, and reports the hit ratio and the download bytes each would save.
+
+    lru         evict the least recently used file (what bot/index.py does)
+    lfu         evict the least frequently used file, oldest first on ties
+    size        GreedyDual-Size-Frequency: frequency per MB, with aging, so
+                one large file goes before several small ones
+    popularity  GreedyDual with frequency weighted by Spotify popularity
+                (1x at 0, 2x at 100), with aging
+    tinylfu     LRU behind the bot's TinyLFU admission filter (bot/tinylfu.py,
+                AUDIO_CACHE_ADMISSION=tinylfu): a new file is only cached if
+                it is requested more often than the files it would displace
+
+Every traced request for a (track, quality) is a cache lookup; a miss stores
+the file. Without --trace a synthetic Zipf workload is generated instead;
+--scan-every adds one-off bulk jobs (a playlist of tracks nobody asks for
+again) to it.
+
+--restart-every models a bot restart every N requests: the tinylfu sketch
+starts over, seeded from the hit counts the index keeps for cached files.
+
+--check-index also replays the requests through a real bot.index.TrackIndex
+(in a temporary directory, with tinylfu admission and no grace period) the
+way the bot serves them from disk, and fails if its hits or cached files
+differ from the tinylfu model at any budget.
+
+Usage:
+    python benchmarks/simulate_cache.py --trace data/trace.jsonl --budgets-mb 256,1024,2048
+    python benchmarks/simulate_cache.py --synthetic 50000 --catalog 20000 --zipf 0.9
+    python benchmarks/simulate_cache.py --scan-every 1000 --scan-length 50 --policies lru,tinylfu
+    python benchmarks/simulate_cache.py --synthetic 5000 --scan-every 500 --budgets-mb 64,256 --check-index
+    python benchmarks/simulate_cache.py --scan-every 1000 --restart-every 2000 --policies lru,tinylfu
+"""
+
+import argparse
+import heapq
+import json
+import os
+import random
+import sys
+import tempfile
+from collections import Counter, OrderedDict, defaultdict
+
+from common import latency_summary
+from bot.index import TrackIndex
+from bot.tinylfu import TinyLFU
+
+MB = 1024 * 1024
+
+
+class Entry:
+    __slots__ = ("size", "pop", "freq", "priority")
+
+    def __init__(self, size, pop):
+        self.size = size
+        self.pop = pop
+        self.freq = 0
+        self.priority = None
+
+
+# name: (priority of an entry, whether evictions age the cache)
+POLICIES = {
+    "lru": (lambda cache, entry: cache.clock, False),
+    "lfu": (lambda cache, entry: (entry.freq, cache.clock), False),
+    "size": (lambda cache, entry: cache.inflation + entry.freq / (entry.size / MB), True),
+    "popularity": (lambda cache, entry: cache.inflation + entry.freq * (1 + entry.pop / 100), True),
+}
+
+
+class SimulatedCache:
+    """
+    A byte-budgeted cache that evicts the entry with the lowest priority.
+
+    With aging (GreedyDual), the priority of the last evicted entry is added
+    to every new priority, so entries that were valuable long ago eventually
+    lose to recent ones.
+    """
+
+    def __init__(self, budget, policy):
+        self.budget = budget
+        self.priority, self.aging = POLICIES[policy]
+        self.used = 0
+        self.clock = 0
+        self.inflation = 0.0
+        self.evictions = 0
+        self.entries = {}
+        self._heap = []
+
+    def _touch(self, key, entry):
+        entry.freq += 1
+        entry.priority = self.priority(self, entry)
+        # Older heap items for the key are skipped when popped
+        heapq.heappush(self._heap, (entry.priority, self.clock, key))
+
+    def _evict(self):
+        while True:
+            priority, _, key = heapq.heappop(self._heap)
+            entry = self.entries.get(key)
+            if entry is not None and entry.priority == priority:
+                break
+        del self.entries[key]
+        self.used -= entry.size
+        self.evictions += 1
+        if self.aging:
+            self.inflation = priority
+
+    def access(self, key, size, pop):
+        """Look up a file, storing it on a miss. Returns True on a hit."""
+        self.clock += 1
+        entry = self.entries.get(key)
+        if entry is not None:
+            self._touch(key, entry)
+            return True
+        if size > self.budget:
+            return False
+        while self.used + size > self.budget:
+            self._evict()
+        entry = Entry(size, pop)
+        self.entries[key] = entry
+        self.used += size
+        self._touch(key, entry)
+        return False
+
+
+class AdmittedLRU:
+    """
+    LRU cache behind a TinyLFU admission filter, as bot/index.py runs it.
+
+    A rejected file is simply not stored (the bot deletes it after upload).
+    Hit counts are kept per file like the index's audio.hits column, and
+    restart() seeds a fresh sketch from them.
+    """
+
+    def __init__(self, budget, sketch_width):
+        self.budget = budget
+        self.sketch_width = sketch_width
+        self.admission = TinyLFU(sketch_width)
+        self.used = 0
+        self.evictions = 0
+        self.entries = OrderedDict()
+        self.hits = {}
+
+    def restart(self):
+        self.admission = TinyLFU(self.sketch_width)
+        for key in self.entries:
+            self.admission.seed(key, self.hits[key])
+
+    def access(self, key, size, pop):
+        self.admission.record(key, pop)
+        if key in self.hits:
+            self.hits[key] += 1
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return True
+        if size > self.budget:
+            return False
+
+        victims = []
+        over = self.used + size - self.budget
+        for victim, victim_size in self.entries.items():
+            if over <= 0:
+                break
+            victims.append(victim)
+            over -= victim_size
+        if not self.admission.admit(key, victims):
+            return False
+        for victim in victims:
+            self.used -= self.entries.pop(victim)
+            self.evictions += 1
+        self.entries[key] = size
+        self.hits.setdefault(key, 1)
+        self.used += size
+        return False
+
+
+def load_trace(path, exclude_telegram=False):
+    """Requests from a trace file: (key, size, popularity) in time order, plus the raw entries."""
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    entries.sort(key=lambda entry: entry["t"])
+    requests = [
+        ((entry["track"], entry["q"]), entry["size"], entry.get("pop") or 0)
+        for entry in entries
+        if entry.get("ok") and entry.get("size") and not (exclude_telegram and entry.get("src") == "telegram")
+    ]
+    return requests, entries
+
+
+def synthetic_trace(count, catalog, skew, seed, scan_every=0, scan_length=50):
+    """
+    Zipf-distributed requests over a catalogue of tracks.
+
+    Popularity falls with rank (plus noise), durations are 2.5-6 minutes and
+    most requests are for 128 kbps. With `scan_every`, a bulk job of
+    `scan_length` tracks that are never requested again (popularity below
+    30) follows every `scan_every` requests.
+    """
+    rng = random.Random(seed)
+    tracks = []
+    for rank in range(1, catalog + 1):
+        pop = max(0, min(100, round(100 - 60 * rank / catalog + rng.gauss(0, 15))))
+        tracks.append((f"t{rank}", pop, rng.uniform(150, 360)))
+    weights = [1 / rank ** skew for rank in range(1, catalog + 1)]
+    requests = []
+    for track_id, pop, duration in rng.choices(tracks, weights=weights, k=count):
+        quality = rng.choices((128, 192, 320), weights=(0.6, 0.25, 0.15))[0]
+        requests.append(((track_id, quality), int(duration * quality * 1000 / 8), pop))
+        if scan_every and len(requests) % (scan_every + scan_length) == scan_every:
+            for _ in range(scan_length):
+                scan_id = f"s{len(requests)}"
+                requests.append(((scan_id, quality), int(rng.uniform(150, 360) * quality * 1000 / 8), rng.randint(0, 30)))
+    return requests
+
+
+def simulate(requests, budget, policy, sketch_width, restart_every=0):
+    if policy == "tinylfu":
+        cache = AdmittedLRU(budget, sketch_width)
+    else:
+        cache = SimulatedCache(budget, policy)
+    hits = hit_bytes = total_bytes = 0
+    for i, (key, size, pop) in enumerate(requests):
+        if restart_every and i and i % restart_every == 0 and policy == "tinylfu":
+            cache.restart()
+        total_bytes += size
+        if cache.access(key, size, pop):
+            hits += 1
+            hit_bytes += size
+    return {
+        "hit_ratio": round(hits / len(requests), 4) if requests else 0.0,
+        "byte_hit_ratio": round(hit_bytes / total_bytes, 4) if total_bytes else 0.0,
+        "bytes_saved_mb": round(hit_bytes / MB, 1),
+        "evictions": cache.evictions,
+    }
+
+
+def check_index(requests, budget, sketch_width):
+    """
+    Replay requests through a real TrackIndex next to AdmittedLRU and compare them.
+
+    Each request does what AudioProcessor._cached_file and send_track do: count
+    the request, look the file up, and on a miss store it and record the
+    file_id Telegram returned. On a hit the file_id is recorded again, as
+    after re-uploading from disk. Files are empty; only their recorded size
+    counts.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        index = TrackIndex(os.path.join(directory, "index.db"), max_bytes=budget, admission="tinylfu", grace=0)
+        index.admission = TinyLFU(sketch_width)
+        model = AdmittedLRU(budget, sketch_width)
+        mismatches = []
+        for step, (key, size, pop) in enumerate(requests):
+            track_id, quality = key
+            index.record_request(track_id, quality, pop)
+            row = index.get_audio(track_id, quality)
+            hit = bool(row and row["file_path"] and os.path.exists(row["file_path"]))
+            # AdmittedLRU never stores a file larger than the whole budget
+            if not hit and size <= budget:
+                file_path = os.path.join(directory, f"{track_id}_{quality}.mp3")
+                open(file_path, "wb").close()
+                index.put_audio_file(track_id, quality, file_path, size)
+            index.put_file_id(track_id, quality, f"file-{track_id}-{quality}")
+            # The upload is done, so a file the filter turned away goes now
+            index.evict()
+            if hit != model.access(key, size, pop) and len(mismatches) < 10:
+                mismatches.append({"step": step, "key": list(key), "index_hit": hit})
+
+        stats = index.stats()
+        return {
+            "ok": not mismatches and stats["files"] == len(model.entries) and stats["bytes"] == model.used,
+            "mismatches": mismatches,
+            "index_files": stats["files"],
+            "model_files": len(model.entries),
+            "index_mb": round(stats["bytes"] / MB, 1),
+            "model_mb": round(model.used / MB, 1),
+        }
+
+
+def trace_summary(requests, entries):
+    sizes = {}
+    for key, size, _ in requests:
+        sizes[key] = size
+    summary = {
+        "requests": len(requests),
+        "unique_files": len(sizes),
+        "working_set_mb": round(sum(sizes.values()) / MB, 1),
+    }
+    if entries:
+        stages = defaultdict(list)
+        for entry in entries:
+            for stage, seconds in entry.get("stages", {}).items():
+                stages[stage].append(seconds)
+        summary["sources"] = dict(Counter(entry.get("src") for entry in entries))
+        summary["stage_latency"] = {stage: latency_summary(values) for stage, values in sorted(stages.items())}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trace", help="trace file written by the bot (TRACE_PATH)")
+    parser.add_argument("--exclude-telegram", action="store_true",
+                        help="skip requests answered by Telegram file_id, which never read the disk cache")
+    parser.add_argument("--synthetic", type=int, default=20000, help="synthetic requests when no --trace is given")
+    parser.add_argument("--catalog", type=int, default=10000, help="distinct tracks in the synthetic workload")
+    parser.add_argument("--zipf", type=float, default=0.9, help="skew of the synthetic workload")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scan-every", type=int, default=0,
+                        help="add a one-off bulk job after every N synthetic requests (0: none)")
+    parser.add_argument("--scan-length", type=int, default=50, help="tracks per bulk job")
+    parser.add_argument("--budgets-mb", default="256,1024,2048")
+    parser.add_argument("--policies", default=",".join([*POLICIES, "tinylfu"]))
+    parser.add_argument("--sketch-width", type=int, default=8192, help="TinyLFU counters per sketch row")
+    parser.add_argument("--restart-every", type=int, default=0,
+                        help="restart the bot (fresh tinylfu sketch, seeded from hit counts) every N requests")
+    parser.add_argument("--check-index", action="store_true",
+                        help="also replay through a real TrackIndex and fail if it differs from the tinylfu model")
+    parser.add_argument("--output", help="write JSON results to this file as well as stdout")
+    args = parser.parse_args()
+
+    if args.trace:
+        requests, entries = load_trace(args.trace, args.exclude_telegram)
+    else:
+        requests = synthetic_trace(
+            args.synthetic, args.catalog, args.zipf, args.seed, args.scan_every, args.scan_length
+        )
+        entries = []
+
+    policies = [policy for policy in args.policies.split(",") if policy]
+    results = {
+        "benchmark": "cache_policies",
+        "parameters": vars(args),
+        "trace": trace_summary(requests, entries),
+        "budgets": {},
+    }
+    for budget_mb in (int(value) for value in args.budgets_mb.split(",") if value):
+        results["budgets"][budget_mb] = {
+            policy: simulate(requests, budget_mb * MB, policy, args.sketch_width, args.restart_every)
+            for policy in policies
+        }
+        if args.check_index:
+            results.setdefault("index_check", {})[budget_mb] = check_index(requests, budget_mb * MB, args.sketch_width)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    if any(not check["ok"] for check in results.get("index_check", {}).values()):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
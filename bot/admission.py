@@ -0,0 +1,207 @@
+"""
+Admission Control Module
+Bounds the download queue and rejects work early when the estimated wait is too long.
+"""
+
+import asyncio
+import logging
+import math
+from collections import deque
+from typing import Dict, Optional
+from config import (
+    CONCURRENT_DOWNLOADS, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT,
+    ADMISSION_DEFAULT_JOB_TIME, ADMISSION_LATENCY_WINDOW
+)
+from .metrics import DOWNLOADS_REJECTED
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionTicket:
+    """
+    A reserved place in line. Use as `async with ticket:` to hold a download slot,
+    or call cancel() to give the place up without using it.
+    """
+
+    def __init__(self, controller, position: int, estimated_wait: float, waiter=None):
+        self.controller = controller
+        self.position = position
+        self.estimated_wait = estimated_wait
+        self._waiter = waiter
+
+    async def __aenter__(self):
+        if self._waiter is not None:
+            try:
+                await self._waiter
+            except asyncio.CancelledError:
+                self.controller._abandon(self._waiter)
+                raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.controller._release()
+
+    def cancel(self):
+        """Give up the slot or place in line before entering the ticket."""
+        if self._waiter is None:
+            self.controller._release()
+        else:
+            self._waiter.cancel()
+            self.controller._abandon(self._waiter)
+
+
+class AdmissionController:
+    """
+    Global admission control for downloads.
+
+    At most `max_concurrent` downloads run at once; the rest wait in a FIFO
+    line of at most `max_queue` entries. The expected wait is estimated from
+    the recent latency of every pipeline stage and the number of tracks
+    waiting (a batch counts each of its tracks), and a request is rejected
+    up front when that estimate exceeds `max_wait` seconds.
+    """
+
+    def __init__(self, max_concurrent: int = CONCURRENT_DOWNLOADS,
+                 max_queue: int = ADMISSION_MAX_QUEUE,
+                 max_wait: float = ADMISSION_MAX_WAIT,
+                 default_job_time: float = ADMISSION_DEFAULT_JOB_TIME,
+                 window: int = ADMISSION_LATENCY_WINDOW):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.default_job_time = default_job_time
+        self.window = window
+        self.active = 0
+        self.rejected = 0
+        self.closed = False
+        self._waiters = deque()
+        self._waiter_tracks: Dict[asyncio.Future, int] = {}
+        self._stage_latencies: Dict[str, deque] = {}
+
+    def record_stage(self, stage: str, seconds: float):
+        """Record how long one pipeline stage took for a finished job."""
+        samples = self._stage_latencies.get(stage)
+        if samples is None:
+            samples = self._stage_latencies[stage] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def job_time(self) -> float:
+        """Estimated service time of one job: the sum of recent mean stage latencies."""
+        if not self._stage_latencies:
+            return self.default_job_time
+        return sum(sum(s) / len(s) for s in self._stage_latencies.values() if s)
+
+    def estimate_wait(self, position: int, concurrency: Optional[int] = None,
+                      job_time: Optional[float] = None) -> float:
+        """
+        Estimate seconds until a job at the given queue position starts.
+
+        Args:
+            position: 1-based position in line (0 means it starts immediately)
+            concurrency: Number of parallel slots (defaults to max_concurrent)
+            job_time: Service time per job (defaults to the recent stage latencies)
+
+        Returns:
+            Estimated wait in seconds
+        """
+        if position <= 0:
+            return 0.0
+        concurrency = max(concurrency or self.max_concurrent, 1)
+        job_time = self.job_time() if job_time is None else job_time
+        return math.ceil(position / concurrency) * job_time
+
+    def should_reject(self, position: int, estimated_wait: float) -> bool:
+        """Return True if a job at this position should be turned away."""
+        return position > self.max_queue or estimated_wait > self.max_wait
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def waiting_tracks(self) -> int:
+        """Tracks in the downloads waiting in line."""
+        return sum(self._waiter_tracks.values())
+
+    def try_admit(self, force: bool = False, tracks: int = 1) -> Optional[AdmissionTicket]:
+        """
+        Reserve a place in line for a new download.
+
+        Args:
+            force: Queue the download even when it would normally be shed
+            tracks: Number of tracks the download fetches (a batch has several)
+
+        Returns:
+            An AdmissionTicket, or None if the request was shed or admission is closed
+        """
+        if self.closed:
+            return None
+
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return AdmissionTicket(self, 0, 0.0)
+
+        position = len(self._waiters) + 1
+        estimated_wait = self.estimate_wait(self.waiting_tracks + 1)
+        if not force and self.should_reject(position, estimated_wait):
+            self.reject()
+            logger.warning(f"Shedding download: position {position}, estimated wait {estimated_wait:.0f}s")
+            return None
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._waiter_tracks[waiter] = max(tracks, 1)
+        return AdmissionTicket(self, position, estimated_wait, waiter)
+
+    def reject(self):
+        """Count a request that was turned away."""
+        self.rejected += 1
+        DOWNLOADS_REJECTED.inc()
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Stop admitting new downloads and wait for admitted ones to finish.
+
+        Args:
+            timeout: Longest time to wait in seconds
+
+        Returns:
+            True if every admitted download finished in time
+        """
+        self.closed = True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self.active or self._waiters:
+            if loop.time() >= deadline:
+                logger.warning(f"Drain timed out with {self.active} active and {self.waiting} waiting")
+                return False
+            await asyncio.sleep(0.1)
+        return True
+
+    def _release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            self._waiter_tracks.pop(waiter, None)
+            if not waiter.done():
+                # Hand the slot straight to the next job in line
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _abandon(self, waiter):
+        self._waiter_tracks.pop(waiter, None)
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+        elif waiter.done() and not waiter.cancelled():
+            # The slot was handed over just before cancellation; pass it on
+            self._release()
+
+    def stats(self) -> Dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "waiting_tracks": self.waiting_tracks,
+            "rejected": self.rejected,
+            "closed": self.closed,
+            "job_time_estimate": round(self.job_time(), 2)
+        }
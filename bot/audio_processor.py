@@ -1,102 +1,384 @@
 import os
-import logging
 import asyncio
+import logging
 import hashlib
 import tempfile
-import requests
-from bs4 import BeautifulSoup
+import uuid
+from collections import Counter
+from urllib.parse import parse_qs, urlparse
+from config import YOUTUBE_BASE_URL, Y2MATE_BASE_URL, Y2MATE_DOWNLOAD_PREFIX, AUDIO_CACHE_DIR, HTTP_TIMEOUT
+from . import executors
+from .circuit_breaker import CircuitOpenError, breaker_for
+from .integrity import IntegrityError, StreamValidator
+from .journal import noop_checkpoint
+from .metrics import record_cache, track_stage
+from .profiling import profile_if_slow
 
 logger = logging.getLogger(__name__)
 
+HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8"
+}
+
+# Converted files come from per-request CDN hosts, so they share one breaker
+DOWNLOAD_BREAKER = "y2mate-download"
+
+
+class DownloadError(Exception):
+    """Raised when a step of the download chain cannot continue."""
+
+
+def _upstream_request(method, url, **kwargs):
+    """Send one upstream request with timeouts, through the host's circuit breaker."""
+    import requests
+
+    with breaker_for(url).guard():
+        response = requests.request(method, url, timeout=HTTP_TIMEOUT, **kwargs)
+        response.raise_for_status()
+    return response
+
+
+def parse_video_id(html):
+    """Return the first video ID on a YouTube search results page, or None. Runs in the parse pool."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    for script in soup.find_all("script"):
+        if 'videoId' in script.text:
+            start = script.text.find('"videoId":"') + 11
+            return script.text[start:start+11]
+    return None
+
+
+def parse_link(html, selector):
+    """Return the href of the first element matching a CSS selector, or None. Runs in the parse pool."""
+    from bs4 import BeautifulSoup
+
+    link = BeautifulSoup(html, 'html.parser').select_one(selector)
+    return link['href'] if link else None
+
+
+def parse_convert_link(html, quality):
+    """
+    Return the href of the Y2Mate convert link for a bitrate (its q= parameter).
+
+    Falls back to the first convert link on the page if none is marked with
+    that bitrate; None if there is no convert link at all. Runs in the parse pool.
+    """
+    from bs4 import BeautifulSoup
+
+    links = [link['href'] for link in BeautifulSoup(html, 'html.parser').select("a[href*='/mates/en68/convert']")]
+    for href in links:
+        if parse_qs(urlparse(href).query).get('q') == [str(quality)]:
+            return href
+    return links[0] if links else None
+
+
 class AudioProcessor:
-    def __init__(self):
-        self.download_dir = tempfile.mkdtemp(prefix="music_bot_")
+    def __init__(self, index=None):
+        # With a TrackIndex, downloads go to the persistent cache directory and are reused
+        self.index = index
+        if index is not None:
+            os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+            self.download_dir = AUDIO_CACHE_DIR
+        else:
+            self.download_dir = tempfile.mkdtemp(prefix="music_bot_")
+        # Downloads in progress by target file, and how many callers wait on each
+        self._inflight = {}
+        self._inflight_waiters = Counter()
         logger.info(f"AudioProcessor initialized. Download dir: {self.download_dir}")
 
-    async def download_track(self, track_info, quality):
+    async def download_track(self, track_info, quality, checkpoint=None, resume=None):
+        """
+        Find, convert and download a track.
+
+        A second call for the same track and quality while one is running
+        waits for that download instead of starting another. The download
+        is cancelled only once every caller waiting on it is.
+
+        Args:
+            track_info: Track metadata from SpotifyClient
+            quality: Requested bitrate in kbps
+            checkpoint: Optional `checkpoint(stage, **data)` callback for the job journal
+            resume: Optional journal state to continue from instead of starting over
+
+        Returns:
+            Path of the downloaded file, or None on failure
+
+        Raises:
+            CircuitOpenError: An upstream is known to be down; nothing was attempted
+        """
+        key = self._file_path(track_info, quality)
+        task = self._inflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.create_task(self._download_track(track_info, quality, checkpoint, resume))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._inflight.pop(key, None) if self._inflight.get(key) is done else None)
+        else:
+            logger.info("Joining download in progress: %s %s", track_info['name'], track_info['artist'])
+
+        self._inflight_waiters[task] += 1
         try:
-            search_query = f"{track_info['name']} {track_info['artist']}"
-            logger.info(f"Searching via Y2Mate: {search_query}")
+            return await asyncio.shield(task)
+        finally:
+            self._inflight_waiters[task] -= 1
+            if not self._inflight_waiters[task]:
+                del self._inflight_waiters[task]
+                if not task.done():
+                    task.cancel()
 
-            loop = asyncio.get_event_loop()
-            file_path = await loop.run_in_executor(None, self._download_from_y2mate, search_query)
+    async def _download_track(self, track_info, quality, checkpoint=None, resume=None):
+        try:
+            logger.info("Searching via Y2Mate: %s %s", track_info['name'], track_info['artist'])
+            file_path = await self._download_from_y2mate(
+                track_info, quality, checkpoint or noop_checkpoint, resume or {}
+            )
             return file_path if file_path else None
 
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"Download error for track {track_info['name']}: {e}")
             return None
 
-    def _download_from_y2mate(self, query):
+    async def _download_from_y2mate(self, track_info, quality, checkpoint=noop_checkpoint, resume=None):
+        # Each step runs on its own stage executor; see bot/executors.py
+        resume = resume or {}
+        query = f"{track_info['name']} {track_info['artist']}"
+        track_id = track_info.get('id') if self.index else None
+        duration_ms = track_info.get('duration_ms')
         try:
-            search_url = f"https://www.y2mate.is/mates/en68/analyze/ajax"
-            headers = {
-                "User-Agent": "Mozilla/5.0",
-                "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8"
-            }
+            if resume.get('file_path') and os.path.exists(resume['file_path']):
+                logger.info("Resuming with downloaded file: %s", resume['file_path'])
+                return resume['file_path']
+
+            if track_id:
+                cached = await executors.index.run(
+                    self._cached_file, track_id, quality, track_info.get('popularity')
+                )
+                if cached:
+                    return cached
+
+            if resume.get('download_url') and resume.get('partial_file'):
+                # The journal pairs the .part file with the URL that wrote it, so it may be continued
+                try:
+                    logger.info("Downloading from known URL: %s", resume['download_url'])
+                    filepath = await executors.download.run(
+                        self._profiled_finish, query, resume['download_url'], resume['partial_file'],
+                        self._file_path(track_info, quality), checkpoint, duration_ms, True
+                    )
+                    return await executors.index.run(self._add_to_cache, track_id, quality, filepath)
+                except CircuitOpenError:
+                    raise
+                except Exception as e:
+                    # Converter links expire; fall back to re-resolving from the video. A new
+                    # conversion is not byte-identical, so its bytes must not extend the old ones.
+                    logger.warning(f"Resume from download URL failed, re-resolving: {e}")
+                    self.cleanup_file(resume['partial_file'])
 
-            # Search YouTube
-            yt_search = f"https://www.youtube.com/results?search_query={query.replace(' ', '+')}"
-            yt_html = requests.get(yt_search, headers=headers).text
-            soup = BeautifulSoup(yt_html, 'html.parser')
-            for script in soup.find_all("script"):
-                if 'videoId' in script.text:
-                    start = script.text.find('"videoId":"') + 11
-                    video_id = script.text[start:start+11]
-                    break
-            else:
-                logger.error("No YouTube video ID found from search")
-                return None
-
-            video_url = f"https://www.youtube.com/watch?v={video_id}"
-            logger.info(f"Using video: {video_url}")
-
-            # Get Y2Mate download info
+            video_id = await self._video_id(track_info, checkpoint, resume.get('video_id'))
+            download_url = await self._download_url(video_id, quality)
+
+            filepath = self._file_path(track_info, quality)
+            partial_file = self._partial_path(filepath)
+            checkpoint("download_url", download_url=download_url, partial_file=partial_file)
+            filepath = await executors.download.run(
+                self._profiled_finish, query, download_url, partial_file, filepath, checkpoint, duration_ms
+            )
+            return await executors.index.run(self._add_to_cache, track_id, quality, filepath)
+
+        except CircuitOpenError:
+            raise
+        except DownloadError as e:
+            logger.error(str(e))
+            return None
+        except IntegrityError as e:
+            logger.error(f"Rejected download for '{query}': {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Y2Mate download error: {e}")
+            return None
+
+    async def resolve(self, track_info, quality):
+        """
+        Do everything a download needs short of fetching the file: find the video and get its file URL.
+
+        Used for speculative prefetch. The result can be passed to
+        download_track() as `resume`, which then starts at the file transfer
+        (and re-resolves on its own if the URL has expired by then).
+
+        Returns:
+            Dict with video_id, download_url and partial_file
+        """
+        video_id = await self._video_id(track_info)
+        download_url = await self._download_url(video_id, quality)
+        return {
+            'video_id': video_id,
+            'download_url': download_url,
+            'partial_file': self._partial_path(self._file_path(track_info, quality)),
+        }
+
+    async def _video_id(self, track_info, checkpoint=noop_checkpoint, known=None):
+        """YouTube video for a track: already known, from the index, or searched for (and remembered)."""
+        if known:
+            return known
+        track_id = track_info.get('id') if self.index else None
+        if track_id:
+            video_id = await executors.index.run(self.index.get_video_id, track_id)
+            if video_id:
+                return video_id
+
+        video_id = await self._search_youtube(f"{track_info['name']} {track_info['artist']}")
+        if track_id:
+            await executors.index.run(self.index.put_video_id, track_id, video_id)
+        checkpoint("resolved_video", video_id=video_id)
+        return video_id
+
+    async def _download_url(self, video_id, quality):
+        """Have Y2Mate convert a video at a bitrate and return the URL of the finished file."""
+        video_url = f"https://www.youtube.com/watch?v={video_id}"
+        logger.debug("Using video: %s", video_url)
+        convert_url = await self._y2mate_analyze(video_url, quality)
+        logger.debug("Converting via: %s", convert_url)
+        download_url = await self._y2mate_convert(convert_url)
+        logger.debug("Downloading from: %s", download_url)
+        return download_url
+
+    def _file_path(self, track_info, quality):
+        """Where the MP3 for a track and quality is stored."""
+        track_id = track_info.get('id') if self.index else None
+        if track_id:
+            filename = f"{track_id}_{quality}.mp3"
+        else:
+            query = f"{track_info['name']} {track_info['artist']}"
+            file_hash = hashlib.md5(query.encode()).hexdigest()[:8]
+            filename = f"{query[:40]}_{file_hash}.mp3"
+        return os.path.join(self.download_dir, filename)
+
+    def _partial_path(self, filepath):
+        """A .part name of its own for one download of `filepath`, so concurrent writers never share a file."""
+        return f"{filepath}.{uuid.uuid4().hex[:8]}.part"
+
+    def _cached_file(self, track_id, quality, popularity=None):
+        """Return the cached MP3 for a track and quality if it is still on disk."""
+        self.index.record_request(track_id, quality, popularity)
+        cached = self.index.get_audio(track_id, quality)
+        if cached and cached['file_path']:
+            if os.path.exists(cached['file_path']):
+                record_cache("audio", True)
+                return cached['file_path']
+            self.index.drop_file(track_id, quality)
+        record_cache("audio", False)
+        return None
+
+    def _add_to_cache(self, track_id, quality, filepath):
+        # Only files that passed the streaming integrity check reach this point
+        if track_id:
+            self.index.put_audio_file(track_id, quality, filepath, os.path.getsize(filepath))
+        return filepath
+
+    def _profiled_finish(self, label, download_url, partial_file, filepath, checkpoint, duration_ms=None,
+                         resume=False):
+        # The file transfer is the long, single-threaded part of a job
+        with profile_if_slow(label):
+            return self._finish_download(download_url, partial_file, filepath, checkpoint, duration_ms, resume)
+
+    def _finish_download(self, download_url, partial_file, filepath, checkpoint, duration_ms=None, resume=False):
+        """Fetch and verify into the .part file, then move it into place and journal the result."""
+        digest = self._fetch_file(download_url, partial_file, StreamValidator(duration_ms), resume)
+        os.replace(partial_file, filepath)
+        checkpoint("downloaded", file_path=filepath, sha256=digest)
+        return filepath
+
+    async def _search_youtube(self, query):
+        """Return the ID of the first YouTube search result for the query."""
+        with track_stage("youtube_search"):
+            yt_search = f"{YOUTUBE_BASE_URL}/results?search_query={query.replace(' ', '+')}"
+            yt_html = await executors.search.run(lambda: _upstream_request("GET", yt_search, headers=HEADERS).text)
+            video_id = await executors.parse.run(parse_video_id, yt_html)
+            if not video_id:
+                raise DownloadError("No YouTube video ID found from search")
+            return video_id
+
+    async def _y2mate_analyze(self, video_url, quality):
+        """Ask Y2Mate for the conversion page of a video and return its MP3 convert URL for a bitrate."""
+        with track_stage("y2mate_analyze"):
             payload = {
                 "url": video_url,
                 "q_auto": 0,
                 "ajax": 1
             }
-            res = requests.post(search_url, headers=headers, data=payload).json()
+            res = await executors.transcode.run(lambda: _upstream_request(
+                "POST", f"{Y2MATE_BASE_URL}/mates/en68/analyze/ajax", headers=HEADERS, data=payload
+            ).json())
 
-            soup = BeautifulSoup(res['result'], 'html.parser')
-            mp3_btn = soup.select_one("a[href*='/mates/en68/convert']")
-            if not mp3_btn:
-                logger.error("Y2Mate: No MP3 download link found.")
-                return None
+            href = await executors.parse.run(parse_convert_link, res['result'], quality)
+            if not href:
+                raise DownloadError("Y2Mate: No MP3 download link found.")
+            return Y2MATE_BASE_URL + href
 
-            convert_url = "https://www.y2mate.is" + mp3_btn['href']
-            logger.info(f"Converting via: {convert_url}")
-            res2 = requests.get(convert_url, headers=headers)
-            soup2 = BeautifulSoup(res2.text, 'html.parser')
-            final_btn = soup2.select_one("a[href^='https://dl']")
+    async def _y2mate_convert(self, convert_url):
+        """Run the Y2Mate conversion and return the final file URL."""
+        with track_stage("y2mate_convert"):
+            html = await executors.transcode.run(lambda: _upstream_request("GET", convert_url, headers=HEADERS).text)
+            href = await executors.parse.run(parse_link, html, f"a[href^='{Y2MATE_DOWNLOAD_PREFIX}']")
+            if not href:
+                raise DownloadError("Y2Mate: Final download link not found.")
+            return href
 
-            if not final_btn:
-                logger.error("Y2Mate: Final download link not found.")
-                return None
+    def _fetch_file(self, download_url, filepath, validator, resume=False):
+        """
+        Stream the converted file to disk.
 
-            download_url = final_btn['href']
-            logger.info(f"Downloading from: {download_url}")
+        With `resume`, a partial file that the same URL started is continued
+        with a range request; otherwise any existing partial file is replaced.
+        Every chunk passes through the validator before it is written; a bad
+        download is aborted at the first bad chunk and its partial file removed.
 
-            file_hash = hashlib.md5(query.encode()).hexdigest()[:8]
-            filename = f"{query[:40]}_{file_hash}.mp3"
-            filepath = os.path.join(self.download_dir, filename)
+        Returns:
+            SHA-256 hex digest of the complete file
+        """
+        import requests
 
-            r = requests.get(download_url, stream=True)
-            with open(filepath, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+        with track_stage("file_download"):
+            headers = {"User-Agent": HEADERS["User-Agent"]}
+            offset = os.path.getsize(filepath) if resume and os.path.exists(filepath) else 0
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
 
-            return filepath if os.path.exists(filepath) else None
+            # Large files legitimately take a while, so only errors (and junk content) trip the breaker
+            try:
+                with breaker_for(DOWNLOAD_BREAKER).guard(slow_call=None), \
+                        requests.get(download_url, stream=True, headers=headers, timeout=HTTP_TIMEOUT) as r:
+                    r.raise_for_status()
+                    # Only append when the server honoured the range request
+                    resumed = offset and r.status_code == 206
+                    length = r.headers.get("Content-Length")
+                    total = int(length) + (offset if resumed else 0) if length else None
+                    validator.check_response(r.headers.get("Content-Type"), total)
 
-        except Exception as e:
-            logger.error(f"Y2Mate download error: {e}")
-            return None
+                    if resumed:
+                        # The bytes already on disk still count towards the sniff, hash and size
+                        with open(filepath, "rb") as existing:
+                            for chunk in iter(lambda: existing.read(65536), b""):
+                                validator.feed(chunk)
+
+                    with open(filepath, "ab" if resumed else "wb") as f:
+                        for chunk in r.iter_content(chunk_size=8192):
+                            validator.feed(chunk)
+                            f.write(chunk)
+                return validator.finish()
+            except IntegrityError:
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+                raise
 
     def cleanup_file(self, file_path):
         try:
             if os.path.exists(file_path):
                 os.remove(file_path)
-                logger.info(f"Cleaned up: {file_path}")
+                logger.debug("Cleaned up: %s", file_path)
         except Exception as e:
             logger.warning(f"Failed to clean: {e}")
 
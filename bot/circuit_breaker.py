@@ -0,0 +1,152 @@
+"""
+Circuit Breaker Module
+Per-upstream-host circuit breakers so an outage fails fast instead of tying up threads.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+from config import (
+    BREAKER_WINDOW, BREAKER_MIN_CALLS, BREAKER_FAILURE_RATE, BREAKER_SLOW_CALL, BREAKER_OPEN_SECONDS
+)
+from .metrics import CIRCUIT_REJECTED, CIRCUIT_STATE
+
+logger = logging.getLogger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"{host} is unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Rolling-window circuit breaker for one upstream host.
+
+    Calls are recorded with their outcome for `window` seconds. Once at least
+    `min_calls` are in the window and the share that failed or took longer
+    than the slow-call limit reaches `failure_rate`, the circuit opens and
+    every call fails immediately with CircuitOpenError. After `open_seconds`
+    one probe call is let through (half-open): success closes the circuit,
+    failure opens it again.
+    """
+
+    def __init__(self, host: str, window: float = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 failure_rate: float = BREAKER_FAILURE_RATE, open_seconds: float = BREAKER_OPEN_SECONDS):
+        self.host = host
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._calls = deque()  # (finished_at, failed)
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, host=host)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"Circuit for {self.host}: {self.state} -> {state}")
+            self.state = state
+            CIRCUIT_STATE.set(STATE_VALUES[state], host=self.host)
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call must not go out; otherwise reserve it."""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    CIRCUIT_REJECTED.inc(host=self.host)
+                    raise CircuitOpenError(self.host, remaining)
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    CIRCUIT_REJECTED.inc(host=self.host)
+                    raise CircuitOpenError(self.host, 1.0)
+                self._probe_in_flight = True
+
+    def record(self, failed: bool):
+        """Record the outcome of a call that went out."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_in_flight = False
+                self._calls.clear()
+                if failed:
+                    self.opened_at = now
+                    self._set_state(OPEN)
+                else:
+                    self._set_state(CLOSED)
+                return
+
+            self._calls.append((now, failed))
+            while self._calls and self._calls[0][0] < now - self.window:
+                self._calls.popleft()
+            failures = sum(1 for _, f in self._calls if f)
+            if (self.state == CLOSED and len(self._calls) >= self.min_calls
+                    and failures / len(self._calls) >= self.failure_rate):
+                self.opened_at = now
+                self._set_state(OPEN)
+
+    @contextmanager
+    def guard(self, slow_call: Optional[float] = BREAKER_SLOW_CALL,
+              is_failure: Callable[[BaseException], bool] = lambda e: True):
+        """
+        Wrap one upstream call.
+
+        Args:
+            slow_call: Seconds after which a successful call still counts as failed (None disables)
+            is_failure: Decides whether an exception is the upstream's fault (e.g. not a 404)
+        """
+        self.before_call()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            # An exception that is not the upstream's fault still proves it answered
+            self.record(is_failure(e))
+            raise
+        except BaseException:
+            with self._lock:
+                self._probe_in_flight = False
+            raise
+        else:
+            self.record(slow_call is not None and time.monotonic() - started > slow_call)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            calls = len(self._calls)
+            failures = sum(1 for _, f in self._calls if f)
+        return {"state": self.state, "calls": calls, "failures": failures}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(url: str) -> CircuitBreaker:
+    """Return the shared circuit breaker for the host of a URL, or for a fixed name that is not a URL."""
+    host = urlparse(url).netloc or url
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(host)
+            if breaker is None:
+                breaker = _breakers[host] = CircuitBreaker(host)
+    return breaker
+
+
+def circuit_stats() -> Dict[str, Dict]:
+    return {host: breaker.stats() for host, breaker in _breakers.items()}
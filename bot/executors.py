@@ -0,0 +1,163 @@
+"""
+Stage Executors Module
+Separately sized worker pools for each pipeline stage, with saturation metrics.
+"""
+
+import asyncio
+import contextvars
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict
+from config import (
+    METADATA_WORKERS, SEARCH_WORKERS, PARSE_WORKERS, TRANSCODE_WORKERS, DOWNLOAD_WORKERS, INDEX_WORKERS
+)
+from .metrics import EXECUTOR_ACTIVE, EXECUTOR_QUEUED, EXECUTOR_QUEUE_WAIT
+
+logger = logging.getLogger(__name__)
+
+
+def _timed(function, args, kwargs):
+    """Runs on the worker: note when the task left the queue, then run it."""
+    started = time.time()
+    try:
+        return started, None, function(*args, **kwargs)
+    except Exception as e:
+        return started, e, None
+
+
+class StageExecutor:
+    """
+    A named pool of threads (or processes) for one pipeline stage.
+
+    Each stage gets its own workers so a backlog in one (multi-minute file
+    downloads) cannot delay another (a Spotify lookup behind a button press).
+    The pool is created on first use. Tasks start in submission order, so with
+    `n` tasks in flight min(n, max_workers) are running and the rest are
+    queued; queue wait is measured from submission until a worker picks the
+    task up.
+
+    A process stage runs on threads instead when the current process is a
+    daemon (a download worker), since daemonic processes may not have children.
+    """
+
+    def __init__(self, name: str, max_workers: int, processes: bool = False):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.processes = processes and not multiprocessing.current_process().daemon
+        self.finished = 0
+        self._in_flight = 0
+        self._pool = None
+        self._lock = threading.Lock()
+        EXECUTOR_ACTIVE.set(0, executor=name)
+        EXECUTOR_QUEUED.set(0, executor=name)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                if self.processes:
+                    # Spawn like the worker processes do; forking a process that runs threads is unsafe
+                    self._pool = ProcessPoolExecutor(
+                        self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                else:
+                    self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix=self.name)
+            return self._pool
+
+    def _counts(self):
+        active = min(self._in_flight, self.max_workers)
+        return active, self._in_flight - active
+
+    def _set_in_flight(self, delta: int):
+        with self._lock:
+            self._in_flight += delta
+            if delta < 0:
+                self.finished += 1
+            active, queued = self._counts()
+        EXECUTOR_ACTIVE.set(active, executor=self.name)
+        EXECUTOR_QUEUED.set(queued, executor=self.name)
+
+    def start(self):
+        """Create the pool now instead of on the first task; process pools start their workers."""
+        pool = self._get_pool()
+        if self.processes:
+            pool.submit(int).result()
+
+    async def run(self, function: Callable, *args, **kwargs):
+        """
+        Run a blocking function on this stage's workers and await its result.
+
+        For a process pool the function must be importable (module level) and
+        the arguments and result picklable.
+
+        Args:
+            function: Callable to run
+            *args, **kwargs: Passed to the callable
+
+        Returns:
+            Whatever the callable returns; its exceptions are re-raised here
+        """
+        pool = self._get_pool()
+        submitted = time.time()
+        try:
+            if self.processes:
+                future = pool.submit(_timed, function, args, kwargs)
+            else:
+                # Like asyncio.to_thread: the task's context (log fields) goes with it
+                future = pool.submit(contextvars.copy_context().run, _timed, function, args, kwargs)
+            self._set_in_flight(1)
+            future.add_done_callback(lambda _: self._set_in_flight(-1))
+            started, error, result = await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            logger.error(f"A '{self.name}' worker process died; a new pool will be started")
+            raise
+
+        EXECUTOR_QUEUE_WAIT.observe(max(0.0, started - submitted), executor=self.name)
+        if error is not None:
+            raise error
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            active, queued = self._counts()
+            finished = self.finished
+        wait = EXECUTOR_QUEUE_WAIT.summary().get((self.name,), {})
+        return {
+            "kind": "process" if self.processes else "thread",
+            "workers": self.max_workers,
+            "active": active,
+            "queued": queued,
+            "finished": finished,
+            "mean_queue_wait_ms": round(wait.get("mean", 0.0) * 1000, 2),
+        }
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+
+metadata = StageExecutor("metadata", METADATA_WORKERS)
+search = StageExecutor("search", SEARCH_WORKERS)
+parse = StageExecutor("parse", PARSE_WORKERS, processes=True)
+transcode = StageExecutor("transcode", TRANSCODE_WORKERS)
+download = StageExecutor("download", DOWNLOAD_WORKERS)
+index = StageExecutor("index", INDEX_WORKERS)
+
+EXECUTORS = (metadata, search, parse, transcode, download, index)
+
+
+def executor_stats() -> Dict[str, Dict]:
+    return {executor.name: executor.stats() for executor in EXECUTORS}
+
+
+def shutdown_executors(wait: bool = True):
+    for executor in EXECUTORS:
+        executor.shutdown(wait)
@@ -1,17 +1,184 @@
 # handlers.py
+import asyncio
 import logging
 import os
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+from telegram import InputFile, InputMediaAudio, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import CallbackQueryHandler, CommandHandler, ContextTypes, MessageHandler, filters
 from telegram.constants import ParseMode
-from config import BOT_WELCOME, BOT_HELP, DEMO_TRACKS
+from telegram.error import BadRequest, TelegramError
+from config import (
+    SPOTIFY_API_URL, YOUTUBE_BASE_URL,
+    BOT_WELCOME, BOT_HELP, DEMO_TRACKS, WORKER_COUNT, MAX_PLAYLIST_SIZE, BATCH_PREVIEW_SIZE, MEDIA_GROUP_SIZE,
+    ADMIN_USER_IDS, JOURNAL_MAX_ATTEMPTS, DRAIN_TIMEOUT, WARMUP_ON_START, PREFETCH_ENABLED,
+    TELEGRAM_UPLOAD_LIMIT, UPLOAD_WRITE_TIMEOUT
+)
+from . import executors
+from .admission import AdmissionController
+from .circuit_breaker import CircuitOpenError
 from .audio_processor import AudioProcessor
-from .utils import create_main_keyboard, extract_spotify_id
+from .index import TrackIndex
+from .job_queue import JobQueue
+from .journal import JobJournal, noop_checkpoint, sub_job_id
+from .logs import log_context
+from .metrics import DOWNLOADS_WAITING, JOBS_IN_FLIGHT, record_cache, track_stage
+from .prefetch import Prefetcher
+from .profiling import ProfilerBusyError, sample_stacks
+from .trace import note, trace_request
+from .watchdog import watchdog
+from .utils import (
+    create_main_keyboard, create_progress_bar, extract_spotify_links, fit_quality, resolve_short_link, truncate_text
+)
 from .spotify_client import SpotifyClient
 
 logger = logging.getLogger(__name__)
-audio_processor = AudioProcessor()
-spotify_client = SpotifyClient()
+admission = AdmissionController()
+DOWNLOADS_WAITING.set_function(lambda: admission.waiting)
+
+# Heavy services are built on first use so importing this module stays cheap
+_audio_processor = None
+_spotify_client = None
+_job_queue = None
+_index = None
+_journal = None
+_background_tasks = set()
+_services_lock = threading.Lock()
+
+def get_index() -> TrackIndex:
+    global _index
+    if _index is None:
+        with _services_lock:
+            if _index is None:
+                _index = TrackIndex()
+    return _index
+
+def get_audio_processor() -> AudioProcessor:
+    global _audio_processor
+    if _audio_processor is None:
+        index = get_index()
+        with _services_lock:
+            if _audio_processor is None:
+                _audio_processor = AudioProcessor(index)
+    return _audio_processor
+
+def get_spotify_client() -> SpotifyClient:
+    global _spotify_client
+    if _spotify_client is None:
+        index = get_index()
+        with _services_lock:
+            if _spotify_client is None:
+                _spotify_client = SpotifyClient(index)
+    return _spotify_client
+
+def get_job_queue():
+    """Return the shared job queue, or None when downloads run in-process."""
+    global _job_queue
+    if _job_queue is None and WORKER_COUNT:
+        with _services_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue()
+    return _job_queue
+
+def get_journal() -> JobJournal:
+    global _journal
+    if _journal is None:
+        with _services_lock:
+            if _journal is None:
+                _journal = JobJournal()
+    return _journal
+
+async def is_track_cached(track_info, quality):
+    """Whether a track can be sent without downloading: a known file_id or a cached file."""
+    cached = await get_index().aget_audio(track_info['id'], quality)
+    if not cached:
+        return False
+    return bool(cached['telegram_file_id'] or cached['file_path'] and os.path.exists(cached['file_path']))
+
+# Speculation yields to real work: nothing new starts while downloads wait for a slot
+prefetcher = Prefetcher(get_audio_processor, is_track_cached, is_busy=lambda: admission.waiting > 0)
+
+def preload_services():
+    """Build every lazy service, import the HTTP client and start the HTML parser processes."""
+    try:
+        get_index()
+        get_spotify_client()
+        get_audio_processor()
+        get_job_queue()
+        get_journal()
+        import requests  # noqa: F401
+        executors.parse.start()
+    except Exception as e:
+        logger.error(f"Service preload failed: {e}")
+
+async def post_init(application):
+    """Application post-init hook: start the loop watchdog, warm services and caches, resume unfinished jobs."""
+    watchdog.start()
+    # Keep the task referenced so it is not garbage collected before it finishes
+    task = asyncio.create_task(executors.metadata.run(preload_services))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    await resume_pending_jobs(application.bot)
+    # Workers download under the job queue's track locks; this process must not race them
+    if WARMUP_ON_START and get_job_queue() is None:
+        from .warmup import warm_demo_tracks
+        task = asyncio.create_task(warm_demo_tracks())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+async def resume_pending_jobs(bot):
+    """Restart in-process jobs the journal shows were interrupted by a crash or restart."""
+    journal = await executors.metadata.run(get_journal)
+    for job in journal.pending():
+        attempts = job.get('attempts', 0) + 1
+        if attempts > JOURNAL_MAX_ATTEMPTS:
+            logger.warning(f"Giving up on job {job['id']} after {attempts - 1} resume attempts")
+            journal.record(job['id'], "failed")
+            continue
+        journal.record(job['id'], "resumed", attempts=attempts)
+        logger.info(f"Resuming job {job['id']} from stage '{job.get('stage')}'")
+        task = asyncio.create_task(run_resumed_job(bot, job['payload']))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+async def drain_and_stop(application, timeout=DRAIN_TIMEOUT):
+    """
+    SIGTERM path: refuse new downloads, let in-flight ones finish, then stop polling.
+
+    Jobs still running when the timeout expires keep their journal entries and
+    resume on the next start.
+    """
+    logger.info(f"Draining downloads (up to {timeout:.0f}s) before shutdown...")
+    if await admission.drain(timeout):
+        logger.info("All in-flight downloads finished")
+    application.stop_running()
+
+async def run_resumed_job(bot, payload):
+    # Resumed jobs were already admitted once, so they wait in line rather than being shed
+    ticket = admission.try_admit(force=True, tracks=len(payload.get('tracks', ())) or 1)
+    if ticket is None:
+        return
+    try:
+        async with ticket:
+            await deliver_job(bot, payload)
+    except Exception as e:
+        logger.error(f"Resumed job {payload.get('job_id')} failed: {e}")
+
+def outage_message(error: CircuitOpenError) -> str:
+    """User-facing text for an upstream whose circuit breaker is open."""
+    if error.host in SPOTIFY_API_URL:
+        service = "Spotify"
+    elif error.host in YOUTUBE_BASE_URL:
+        service = "YouTube"
+    else:
+        service = "The download service"
+    return (
+        f"⚡ *{service} is having problems right now.*\n\n"
+        f"Please try again in about {int(error.retry_after) + 1} seconds. 🔄"
+    )
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = create_main_keyboard()
@@ -29,6 +196,57 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Admin-only: sample every thread for N seconds and reply with collapsed stacks."""
+    user = update.effective_user
+    if user is None or user.id not in ADMIN_USER_IDS:
+        return
+
+    try:
+        seconds = float(context.args[0]) if context.args else 10.0
+    except ValueError:
+        await update.message.reply_text("Usage: /profile [seconds]")
+        return
+
+    await update.message.reply_text(f"🔬 Profiling for {seconds:.0f}s...")
+    loop = asyncio.get_event_loop()
+    try:
+        stacks = await loop.run_in_executor(None, sample_stacks, seconds)
+    except ProfilerBusyError as e:
+        await update.message.reply_text(f"⚠️ {e}")
+        return
+
+    await update.message.reply_document(
+        document=stacks.encode(),
+        filename=f"profile_{int(time.time())}.folded",
+        caption="Collapsed stacks — open with speedscope or flamegraph.pl"
+    )
+
+async def resolve_links(links):
+    """Resolve short links and return deduplicated (spotify_id, content_type) pairs."""
+    resolved = await asyncio.gather(*(
+        executors.metadata.run(resolve_short_link, spotify_id)
+        if content_type == 'short' else asyncio.sleep(0, (spotify_id, content_type))
+        for spotify_id, content_type in links
+    ))
+    return list(dict.fromkeys(link for link in resolved if link))
+
+async def collect_tracks(links, limit=MAX_PLAYLIST_SIZE):
+    """Fetch metadata for every referenced track, album and playlist (at most `limit` tracks, None for all)."""
+    track_ids = [spotify_id for spotify_id, content_type in links if content_type == 'track']
+    containers = [
+        get_spotify_client().get_album_info(spotify_id) if content_type == 'album'
+        else get_spotify_client().get_playlist_info(spotify_id)
+        for spotify_id, content_type in links if content_type in ('album', 'playlist')
+    ]
+    results = await asyncio.gather(get_spotify_client().get_tracks_info(track_ids), *containers)
+
+    tracks = {track['id']: track for track in results[0]}
+    for container in results[1:]:
+        for track in (container or {}).get('tracks', []):
+            tracks.setdefault(track['id'], track)
+    return list(tracks.values())[:limit]
+
 async def handle_spotify_url(update: Update, context: ContextTypes.DEFAULT_TYPE, url: str):
     processing_msg = await update.message.reply_text(
         "🔍 *Analyzing your request...*\n\n"
@@ -37,14 +255,24 @@ async def handle_spotify_url(update: Update, context: ContextTypes.DEFAULT_TYPE,
     )
 
     try:
-        spotify_id, content_type = extract_spotify_id(url)
+        links = await resolve_links(extract_spotify_links(url))
+        if not links:
+            await processing_msg.edit_text(
+                "🚫 *I couldn't find any Spotify tracks in that message.*",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            return
 
-        if content_type == "track":
-            track_info = await spotify_client.get_track_info(spotify_id)
-            if not track_info:
-                raise Exception("Track not found.")
+        tracks = await collect_tracks(links)
+        if not tracks:
+            raise Exception("Track not found.")
 
+        if len(tracks) == 1:
+            track_info = tracks[0]
             context.user_data['current_track'] = track_info
+            # A worker process could not claim the result, so only speculate for in-process downloads
+            if PREFETCH_ENABLED and get_job_queue() is None:
+                prefetcher.schedule(track_info)
             keyboard = [
                 [
                     InlineKeyboardButton("🎯 128kbps", callback_data="quality_128"),
@@ -60,13 +288,31 @@ async def handle_spotify_url(update: Update, context: ContextTypes.DEFAULT_TYPE,
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
+            return
 
-        else:
-            await processing_msg.edit_text(
-                "🚫 *Only Spotify tracks are supported right now.*",
-                parse_mode=ParseMode.MARKDOWN
-            )
+        context.user_data['current_batch'] = tracks
+        listing = "\n".join(
+            f"{i}. {truncate_text(track['name'], 40)} — {truncate_text(track['artist'], 30)}"
+            for i, track in enumerate(tracks[:BATCH_PREVIEW_SIZE], 1)
+        )
+        if len(tracks) > BATCH_PREVIEW_SIZE:
+            listing += f"\n…and {len(tracks) - BATCH_PREVIEW_SIZE} more"
+        keyboard = [
+            [
+                InlineKeyboardButton("🎯 128kbps", callback_data="batch_128"),
+                InlineKeyboardButton("🎯 320kbps", callback_data="batch_320")
+            ]
+        ]
+        await processing_msg.edit_text(
+            f"🎶 Found {len(tracks)} tracks!\n\n"
+            f"{listing}\n\n"
+            f"🎯 Choose your preferred quality:",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
 
+    except CircuitOpenError as e:
+        logger.warning(f"Failing fast in handle_spotify_url: {e}")
+        await processing_msg.edit_text(outage_message(e), parse_mode=ParseMode.MARKDOWN)
     except Exception as e:
         logger.error(f"Error in handle_spotify_url: {e}")
         await processing_msg.edit_text(
@@ -75,57 +321,506 @@ async def handle_spotify_url(update: Update, context: ContextTypes.DEFAULT_TYPE,
             parse_mode=ParseMode.MARKDOWN
         )
 
-async def start_track_download(query, context, track_info, quality):
-    await query.edit_message_text(
+def upload_limit_mb():
+    return TELEGRAM_UPLOAD_LIMIT // (1024 * 1024)
+
+def quality_notice(quality, requested_quality):
+    """Line explaining that a long track is sent at a lower bitrate than requested ('' if it is not)."""
+    if not requested_quality or requested_quality == quality:
+        return ""
+    return f"📉 *At {requested_quality}kbps it would be over Telegram's {upload_limit_mb()} MB limit*\n"
+
+async def deliver_track(bot, chat_id, message_id, track_info, quality, job_id=None, requested_quality=None):
+    """Download a track and send it to the chat, editing the status message as it goes."""
+    await bot.edit_message_text(
         f"⬇️ *Downloading...*\n\n"
         f"🎶 **{track_info['name']}**\n"
         f"👨‍🎤 *by {track_info['artist']}*\n"
-        f"🎯 *Quality: {quality}kbps*\n\n"
-        f"⏳ Finding and processing your track...",
+        f"🎯 *Quality: {quality}kbps*\n"
+        + quality_notice(quality, requested_quality) +
+        f"\n⏳ Finding and processing your track...",
+        chat_id=chat_id,
+        message_id=message_id,
         parse_mode=ParseMode.MARKDOWN
     )
 
     try:
-        file_path = await audio_processor.download_track(track_info, quality)
-        if file_path:
-            file_size_bytes = os.path.getsize(file_path)
-            file_size_mb = round(file_size_bytes / (1024 * 1024), 1)
-
-            await context.bot.send_audio(
-                chat_id=query.message.chat_id,
-                audio=open(file_path, 'rb'),
-                title=track_info['name'],
-                performer=track_info['artist'],
-                duration=track_info['duration_ms'] // 1000,
-                caption=f"🎶 **{track_info['name']}** by *{track_info['artist']}*\n\n"
-                        f"🎯 *Quality:* {quality}kbps\n"
-                        f"📁 *Size:* {file_size_mb} MB\n"
-                        f"⏱️ *Duration:* {track_info['duration']}\n\n"
-                        f"Enjoy your music! 🎧✨",
-                parse_mode=ParseMode.MARKDOWN
-            )
-
+        with trace_request(track_info, quality):
+            delivered = await send_track(bot, chat_id, track_info, quality, job_id)
+            note(ok=delivered)
+        if delivered:
             keyboard = [[InlineKeyboardButton("🎵 Download Another", callback_data="download_another")]]
-            await query.edit_message_text(
+            await bot.edit_message_text(
                 f"✅ *Download Complete!*\n\n"
                 f"🎶 **{track_info['name']}**\n"
                 f"👨‍🎤 *by {track_info['artist']}*\n\n"
                 f"Enjoy your music! 🎧✨",
+                chat_id=chat_id,
+                message_id=message_id,
                 parse_mode=ParseMode.MARKDOWN,
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
+            return True
         else:
             raise Exception("Download failed — no file path returned")
 
+    except CircuitOpenError as e:
+        logger.warning(f"Failing fast for {track_info['name']}: {e}")
+        await bot.edit_message_text(
+            f"🎶 **{track_info['name']}**\n\n" + outage_message(e),
+            chat_id=chat_id,
+            message_id=message_id,
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return False
     except Exception as e:
         logger.error(f"Download error: {e}")
-        await query.edit_message_text(
+        await bot.edit_message_text(
             f"❌ *Download failed!*\n\n"
             f"🎶 **{track_info['name']}**\n"
             f"👨‍🎤 *by {track_info['artist']}*\n\n"
             f"Please try again later. 🔄",
+            chat_id=chat_id,
+            message_id=message_id,
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return False
+
+def audio_caption(track_info, quality, file_size_bytes):
+    file_size_mb = round(file_size_bytes / (1024 * 1024), 1)
+    return (
+        f"🎶 **{track_info['name']}** by *{track_info['artist']}*\n\n"
+        f"🎯 *Quality:* {quality}kbps\n"
+        f"📁 *Size:* {file_size_mb} MB\n"
+        f"⏱️ *Duration:* {track_info['duration']}\n\n"
+        f"Enjoy your music! 🎧✨"
+    )
+
+async def send_cached_track(bot, chat_id, track_info, quality):
+    """Send a track by the file_id Telegram gave it before. Returns False if there is none or it is rejected."""
+    index = get_index()
+    cached = await index.aget_audio(track_info['id'], quality)
+    if not cached or not cached['telegram_file_id']:
+        record_cache("telegram_file_id", False)
+        return False
+
+    try:
+        with track_stage("telegram_upload"):
+            await bot.send_audio(
+                chat_id=chat_id,
+                audio=cached['telegram_file_id'],
+                title=track_info['name'],
+                performer=track_info['artist'],
+                duration=track_info['duration_ms'] // 1000,
+                caption=audio_caption(track_info, quality, cached['file_size'] or 0),
+                parse_mode=ParseMode.MARKDOWN
+            )
+    except TelegramError as e:
+        logger.warning(f"Cached file_id rejected for {track_info['id']}: {e}")
+        await index.adrop_file_id(track_info['id'], quality)
+        record_cache("telegram_file_id", False)
+        return False
+    record_cache("telegram_file_id", True)
+    note(size=cached['file_size'] or 0, src="telegram")
+    return True
+
+def audio_input(bot, file_path, files, attach=False):
+    """
+    File argument for sending a local MP3.
+
+    Against a local Bot API server (local mode) this is just the path and the
+    server reads the file itself. Otherwise the file is opened on `files` (an
+    ExitStack) and streamed from the handle in chunks, never loaded into memory.
+    """
+    if bot.local_mode:
+        return Path(file_path)
+    audio_file = files.enter_context(open(file_path, 'rb'))
+    return InputFile(audio_file, filename=os.path.basename(file_path), read_file_handle=False, attach=attach)
+
+async def upload_audio(bot, chat_id, file_path, **kwargs):
+    """Send a local MP3 as an audio message; the file is closed afterwards."""
+    with ExitStack() as files:
+        return await bot.send_audio(
+            chat_id=chat_id,
+            audio=audio_input(bot, file_path, files),
+            write_timeout=UPLOAD_WRITE_TIMEOUT,
+            **kwargs
+        )
+
+def job_checkpoint(job_id):
+    """Journal checkpoint callback and resume state for a job (no-ops without a job_id)."""
+    if not job_id:
+        return noop_checkpoint, {}
+    journal = get_journal()
+    return journal.checkpointer(job_id), journal.state(job_id)
+
+async def download_for_upload(track_info, quality, checkpoint, resume):
+    """Download a track and check it fits Telegram's upload limit. Returns the file path or None."""
+    started = time.monotonic()
+    file_path = await get_audio_processor().download_track(track_info, quality, checkpoint, resume)
+    admission.record_stage("download", time.monotonic() - started)
+    if not file_path:
+        return None
+
+    file_size_bytes = os.path.getsize(file_path)
+    if file_size_bytes > TELEGRAM_UPLOAD_LIMIT:
+        logger.error(f"{file_path} is {file_size_bytes} bytes, over the {TELEGRAM_UPLOAD_LIMIT} byte upload limit")
+        return None
+    note(size=file_size_bytes)
+    return file_path
+
+async def send_track(bot, chat_id, track_info, quality, job_id=None):
+    """
+    Download one track and send it as an audio message. Returns False if the download failed.
+
+    A track Telegram has seen before is re-sent by file_id without downloading.
+    With a job_id, every stage is journaled and a resumed job continues from its last stage.
+    """
+    checkpoint, resume = job_checkpoint(job_id)
+    if resume.get('stage') == "uploaded":
+        return True
+
+    # Whatever was resolved while the quality card was shown; journaled progress takes precedence
+    prefetched = await prefetcher.claim(track_info['id'], quality)
+
+    if await send_cached_track(bot, chat_id, track_info, quality):
+        checkpoint("uploaded")
+        return True
+
+    file_path = await download_for_upload(track_info, quality, checkpoint, {**prefetched, **resume})
+    if not file_path:
+        return False
+
+    file_size_bytes = os.path.getsize(file_path)
+    started = time.monotonic()
+    with track_stage("telegram_upload"):
+        message = await upload_audio(
+            bot, chat_id, file_path,
+            title=track_info['name'],
+            performer=track_info['artist'],
+            duration=track_info['duration_ms'] // 1000,
+            caption=audio_caption(track_info, quality, file_size_bytes),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    admission.record_stage("upload", time.monotonic() - started)
+    checkpoint("uploaded")
+    if message.audio:
+        await get_index().aput_file_id(track_info['id'], quality, message.audio.file_id)
+    return True
+
+async def prepare_group_item(track_info, quality, job_id=None):
+    """
+    Get one batch track ready for a media group: its cached file_id, or else a fresh download.
+
+    Returns:
+        Dict with track_info, quality, job_id, size and either file_id or file_path; None if the download failed
+    """
+    item = {'track_info': track_info, 'quality': quality, 'job_id': job_id}
+    cached = await get_index().aget_audio(track_info['id'], quality)
+    if cached and cached['telegram_file_id']:
+        note(size=cached['file_size'] or 0, src="telegram")
+        return {**item, 'file_id': cached['telegram_file_id'], 'size': cached['file_size'] or 0}
+
+    record_cache("telegram_file_id", False)
+    checkpoint, resume = job_checkpoint(job_id)
+    file_path = await download_for_upload(track_info, quality, checkpoint, resume)
+    if not file_path:
+        return None
+    return {**item, 'file_path': file_path, 'size': os.path.getsize(file_path)}
+
+async def send_tracks_separately(bot, chat_id, items):
+    """Send prepared batch tracks one audio message each. Returns the track_info of those not delivered."""
+    failed = []
+    for item in items:
+        try:
+            if await send_track(bot, chat_id, item['track_info'], item['quality'], item['job_id']):
+                continue
+        except Exception as e:
+            logger.error(f"Upload error for {item['track_info']['name']}: {e}")
+        failed.append(item['track_info'])
+    return failed
+
+async def send_audio_group(bot, chat_id, items):
+    """
+    Send prepared batch tracks as one album (a single send_media_group call).
+
+    Telegram rejects the whole group if any cached file_id has gone stale, so
+    on a BadRequest every track is sent on its own instead, which drops the
+    bad file_id and uploads that track afresh. Any other error (a timeout or
+    network failure) may come after the album was delivered, so nothing is
+    re-sent and the tracks count as not delivered.
+
+    Returns:
+        The track_info of every track that was not delivered
+    """
+    if len(items) < 2:
+        # An album needs at least two audios
+        return await send_tracks_separately(bot, chat_id, items)
+
+    started = time.monotonic()
+    try:
+        with ExitStack() as files, track_stage("telegram_upload"):
+            media = [
+                InputMediaAudio(
+                    item['file_id'] if 'file_id' in item else audio_input(bot, item['file_path'], files, attach=True),
+                    caption=audio_caption(item['track_info'], item['quality'], item['size']),
+                    parse_mode=ParseMode.MARKDOWN,
+                    title=item['track_info']['name'],
+                    performer=item['track_info']['artist'],
+                    duration=item['track_info']['duration_ms'] // 1000
+                )
+                for item in items
+            ]
+            messages = await bot.send_media_group(chat_id=chat_id, media=media, write_timeout=UPLOAD_WRITE_TIMEOUT)
+    except BadRequest as e:
+        logger.warning(f"Media group of {len(items)} rejected, sending tracks one by one: {e}")
+        return await send_tracks_separately(bot, chat_id, items)
+    except TelegramError as e:
+        logger.error(f"Media group of {len(items)} failed, not re-sending in case it arrived: {e}")
+        return [item['track_info'] for item in items]
+    admission.record_stage("upload", time.monotonic() - started)
+
+    index = get_index()
+    for item, message in zip(items, messages):
+        if item['job_id']:
+            get_journal().record(item['job_id'], "uploaded")
+        if 'file_id' in item:
+            record_cache("telegram_file_id", True)
+        elif message.audio:
+            await index.aput_file_id(item['track_info']['id'], item['quality'], message.audio.file_id)
+    return []
+
+async def deliver_batch(bot, chat_id, message_id, tracks, quality, job_id=None):
+    """
+    Download a batch of tracks and send them as albums of up to MEDIA_GROUP_SIZE audios.
+
+    The progress message is edited once per album and replaced by a single
+    summary at the end. A track too long for the upload limit at `quality`
+    is sent at the highest bitrate that fits, or skipped if none does.
+    """
+    delivered = 0
+    failed = []
+    too_long = []
+    downgraded = 0
+    outage = None
+    pending = []
+    for i, track_info in enumerate(tracks):
+        track_job_id = sub_job_id(job_id, i)
+        track_quality = fit_quality(track_info.get('duration_ms'), quality)
+        if track_job_id and get_journal().state(track_job_id).get('stage') == "uploaded":
+            # Delivered before a restart
+            delivered += 1
+        elif track_quality is None:
+            too_long.append(track_info)
+        else:
+            downgraded += track_quality != quality
+            pending.append((track_job_id, track_info, track_quality))
+    notice = f"\n📉 {downgraded} long track(s) at a lower bitrate to fit the {upload_limit_mb()} MB limit" if downgraded else ""
+
+    for start in range(0, len(pending), MEDIA_GROUP_SIZE):
+        group = pending[start:start + MEDIA_GROUP_SIZE]
+        try:
+            await bot.edit_message_text(
+                f"⬇️ Downloading {len(tracks)} tracks ({quality}kbps){notice}\n\n"
+                f"{create_progress_bar(delivered + len(failed) + len(too_long), len(tracks))}\n"
+                f"🎶 {group[0][1]['name']} — {group[0][1]['artist']}"
+                + (f" and {len(group) - 1} more" if len(group) > 1 else ""),
+                chat_id=chat_id,
+                message_id=message_id
+            )
+        except Exception as e:
+            logger.warning(f"Could not update batch progress: {e}")
+
+        items = []
+        for track_job_id, track_info, track_quality in group:
+            try:
+                with log_context(job_id=track_job_id), trace_request(track_info, track_quality):
+                    item = await prepare_group_item(track_info, track_quality, track_job_id)
+                    note(ok=item is not None)
+                if item:
+                    items.append(item)
+                    continue
+            except CircuitOpenError as e:
+                # Keep going: tracks that are already cached can still be sent
+                outage = e
+            except Exception as e:
+                logger.error(f"Download error: {e}")
+            failed.append(track_info)
+
+        try:
+            group_failed = await send_audio_group(bot, chat_id, items)
+        except Exception as e:
+            logger.error(f"Upload error: {e}")
+            group_failed = [item['track_info'] for item in items]
+        delivered += len(items) - len(group_failed)
+        failed.extend(group_failed)
+
+    summary = f"✅ Batch complete: {delivered}/{len(tracks)} tracks delivered.{notice}"
+    if too_long:
+        summary += f"\n\n⏱️ Too long to send under {upload_limit_mb()} MB:\n" + "\n".join(
+            f"• {track['name']} — {track['artist']}" for track in too_long[:BATCH_PREVIEW_SIZE]
+        )
+    if failed:
+        summary += "\n\n❌ Failed:\n" + "\n".join(
+            f"• {track['name']} — {track['artist']}" for track in failed[:BATCH_PREVIEW_SIZE]
+        )
+    if outage:
+        summary += "\n\n" + outage_message(outage).replace("*", "")
+    keyboard = [[InlineKeyboardButton("🎵 Download Another", callback_data="download_another")]]
+    await bot.edit_message_text(
+        summary,
+        chat_id=chat_id,
+        message_id=message_id,
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+    return delivered > 0
+
+async def deliver_job(bot, payload):
+    """Run a queued job payload (single track or batch)."""
+    job_id = payload.get('job_id')
+    JOBS_IN_FLIGHT.inc()
+    try:
+        with log_context(job_id=job_id):
+            if 'tracks' in payload:
+                delivered = await deliver_batch(
+                    bot, payload['chat_id'], payload['message_id'], payload['tracks'], payload['quality'], job_id
+                )
+            else:
+                delivered = await deliver_track(
+                    bot, payload['chat_id'], payload['message_id'], payload['track_info'], payload['quality'], job_id,
+                    payload.get('requested_quality')
+                )
+    finally:
+        JOBS_IN_FLIGHT.dec()
+
+    # Interrupted jobs get no terminal record, so they are resumed on the next start
+    if job_id:
+        journal = get_journal()
+        for i in range(len(payload.get('tracks', ()))):
+            journal.record(sub_job_id(job_id, i), "done")
+        journal.record(job_id, "done" if delivered else "failed")
+    return delivered
+
+async def reject_download(query, title, estimated_wait):
+    await query.edit_message_text(
+        f"🚦 *I'm very busy right now!*\n\n"
+        f"{title}\n\n"
+        f"⏳ The wait would be over {int(estimated_wait // 60) + 1} minutes.\n"
+        f"Please try again in a little while. 🔄",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def reject_restarting(query, title):
+    await query.edit_message_text(
+        f"🔄 *The bot is restarting.*\n\n"
+        f"{title}\n\n"
+        f"Please try again in a few seconds. 🙏",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def notify_queue_position(query, title, quality, position, estimated_wait, requested_quality=None):
+    try:
+        await query.edit_message_text(
+            f"📥 *Queued!*\n\n"
+            f"{title}\n"
+            f"🎯 *Quality: {quality}kbps*\n"
+            + quality_notice(quality, requested_quality) +
+            f"\n⏳ You're #{position} in line, ~{int(estimated_wait)} seconds...",
             parse_mode=ParseMode.MARKDOWN
         )
+    except Exception as e:
+        logger.warning(f"Could not send queue position: {e}")
+
+async def start_download_job(query, context, payload, track_key, title, track_keys=None):
+    """
+    Admit a download job and run it in-process or hand it to the worker queue.
+
+    The wait estimate counts every queued track, so a batch weighs as much
+    as its tracks do. `track_keys` lists a batch's tracks;
+    no worker claims the batch while one of them is being downloaded.
+    """
+    job_queue = get_job_queue()
+    if job_queue is None:
+        if admission.closed:
+            await reject_restarting(query, title)
+            return
+
+        ticket = admission.try_admit(tracks=len(payload.get('tracks', ())) or 1)
+        if ticket is None:
+            estimated_wait = admission.estimate_wait(admission.waiting_tracks + 1)
+            await reject_download(query, title, estimated_wait)
+            return
+
+        try:
+            payload['job_id'] = uuid.uuid4().hex
+            get_journal().record(payload['job_id'], "accepted", payload=payload, accepted_at=time.time())
+            if ticket.position:
+                await notify_queue_position(
+                    query, title, payload['quality'], ticket.position, ticket.estimated_wait,
+                    payload.get('requested_quality')
+                )
+        except BaseException:
+            # Not entered yet, so nothing else would return the slot
+            ticket.cancel()
+            raise
+        async with ticket:
+            await deliver_job(context.bot, payload)
+        return
+
+    position = await job_queue.adepth() + 1
+    estimated_wait = admission.estimate_wait(
+        await job_queue.aqueued_tracks() + 1, WORKER_COUNT, await job_queue.arecent_job_time()
+    )
+    if admission.should_reject(position, estimated_wait):
+        admission.reject()
+        await reject_download(query, title, estimated_wait)
+        return
+
+    job_id = await job_queue.aenqueue(track_key, payload, track_keys)
+    position = max(await job_queue.aposition(job_id), 1)
+    await notify_queue_position(
+        query, title, payload['quality'], position, estimated_wait, payload.get('requested_quality')
+    )
+
+async def reject_too_long(query, track_info):
+    await query.edit_message_text(
+        f"⏱️ *This track is too long to send on Telegram.*\n\n"
+        f"🎶 **{track_info['name']}** ({track_info['duration']})\n\n"
+        f"Even at the lowest quality it would be over the {upload_limit_mb()} MB upload limit.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def start_track_download(query, context, track_info, quality):
+    # The size is known from the duration, so a file that would be too big is never downloaded
+    fitted = fit_quality(track_info.get('duration_ms'), quality)
+    if fitted is None:
+        await reject_too_long(query, track_info)
+        return
+
+    payload = {
+        'chat_id': query.message.chat_id,
+        'message_id': query.message.message_id,
+        'track_info': track_info,
+        'quality': fitted
+    }
+    if fitted != quality:
+        payload['requested_quality'] = quality
+    title = f"🎶 **{track_info['name']}**\n👨‍🎤 *by {track_info['artist']}*"
+    await start_download_job(query, context, payload, track_info['id'], title)
+
+async def start_batch_download(query, context, tracks, quality):
+    chat_id = query.message.chat_id
+    message_id = query.message.message_id
+    payload = {
+        'chat_id': chat_id,
+        'message_id': message_id,
+        'tracks': tracks,
+        'quality': quality
+    }
+    title = f"🎶 **{len(tracks)} tracks**"
+    await start_download_job(
+        query, context, payload, f"batch:{chat_id}:{message_id}", title, [track['id'] for track in tracks]
+    )
 
 async def handle_button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -144,6 +839,18 @@ async def handle_button_callback(update: Update, context: ContextTypes.DEFAULT_T
                 parse_mode=ParseMode.MARKDOWN
             )
 
+    elif data.startswith("batch_"):
+        quality = int(data.split("_")[1])
+        tracks = context.user_data.get("current_batch")
+
+        if tracks:
+            await start_batch_download(query, context, tracks, quality)
+        else:
+            await query.edit_message_text(
+                "⚠️ *Track list missing. Please send your links again.*",
+                parse_mode=ParseMode.MARKDOWN
+            )
+
     elif data == "download_another":
         keyboard = create_main_keyboard()
         await query.edit_message_text(
@@ -199,10 +906,18 @@ async def handle_button_callback(update: Update, context: ContextTypes.DEFAULT_T
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message_text = update.message.text.strip()
 
-    if "open.spotify.com/track" in message_text:
+    if extract_spotify_links(message_text):
         await handle_spotify_url(update, context, message_text)
     else:
         await update.message.reply_text(
-            "❓ *Please send a valid Spotify track link.*",
+            "❓ *Please send one or more Spotify track, album or playlist links.*",
             parse_mode=ParseMode.MARKDOWN
-        )
\ No newline at end of file
+        )
+
+def register_handlers(application):
+    """Attach every command, callback and message handler to an Application."""
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CallbackQueryHandler(handle_button_callback))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
@@ -0,0 +1,344 @@
+"""
+Track Index Module
+SQLite-backed index of everything learned about a track: Spotify metadata,
+matching YouTube video, cached MP3 per quality and Telegram file_id per quality.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+from config import INDEX_PATH, INDEX_METADATA_TTL, AUDIO_CACHE_MAX_BYTES, AUDIO_CACHE_ADMISSION, AUDIO_CACHE_GRACE
+from . import executors
+from .metrics import CACHE_ADMISSION, record_cache
+from .tinylfu import TinyLFU
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    track_id TEXT PRIMARY KEY,
+    info TEXT,
+    info_updated_at REAL,
+    video_id TEXT
+);
+CREATE TABLE IF NOT EXISTS audio (
+    track_id TEXT NOT NULL,
+    quality INTEGER NOT NULL,
+    file_path TEXT,
+    file_size INTEGER,
+    telegram_file_id TEXT,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (track_id, quality)
+);
+CREATE INDEX IF NOT EXISTS idx_audio_last_used ON audio (last_used) WHERE file_path IS NOT NULL;
+"""
+
+# Columns added after the first release, for databases created before them
+MIGRATIONS = {
+    "hits": "ALTER TABLE audio ADD COLUMN hits INTEGER NOT NULL DEFAULT 0",
+}
+
+
+class TrackIndex:
+    """
+    Shared lookup table for track knowledge.
+
+    Every lookup is a single primary-key query. The database runs in WAL
+    mode, so the bot process and any number of download workers on the same
+    host read and write it concurrently, and it survives restarts.
+
+    The plain methods block and are meant for executor threads; the `a*`
+    coroutines run them on the index stage executor so the event loop never
+    waits on SQLite locks.
+
+    With admission="tinylfu" the audio cache only lets a new file push out
+    older ones if it is requested more often than they are. The request
+    counts are kept in memory, per process, and also added up in the audio
+    table, which seeds the counts of every new process.
+    """
+
+    def __init__(self, path: str = INDEX_PATH, metadata_ttl: float = INDEX_METADATA_TTL,
+                 max_bytes: int = AUDIO_CACHE_MAX_BYTES, admission: str = AUDIO_CACHE_ADMISSION,
+                 grace: float = AUDIO_CACHE_GRACE):
+        self.path = path
+        self.metadata_ttl = metadata_ttl
+        self.max_bytes = max_bytes
+        self.admission = TinyLFU() if admission == "tinylfu" else None
+        self.grace = grace
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._migrate()
+        if self.admission:
+            self._seed_admission()
+
+    def _migrate(self):
+        conn = self._connection()
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(audio)")}
+        if columns:
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(statement)
+        conn.executescript(SCHEMA)
+
+    def _seed_admission(self):
+        rows = self._connection().execute(
+            "SELECT track_id, quality, hits FROM audio WHERE file_path IS NOT NULL AND hits > 0"
+        ).fetchall()
+        for row in rows:
+            self.admission.seed((row["track_id"], row["quality"]), row["hits"])
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    async def _run(self, function, *args):
+        return await executors.index.run(function, *args)
+
+    # Spotify metadata
+
+    def get_tracks(self, track_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Look up cached metadata for many tracks.
+
+        Args:
+            track_ids: Spotify track IDs
+
+        Returns:
+            Dict of track ID to track info for every fresh entry found
+        """
+        if not track_ids:
+            return {}
+        placeholders = ",".join("?" * len(track_ids))
+        rows = self._connection().execute(
+            f"SELECT track_id, info FROM tracks WHERE track_id IN ({placeholders}) "
+            f"AND info IS NOT NULL AND info_updated_at > ?",
+            (*track_ids, time.time() - self.metadata_ttl)
+        ).fetchall()
+        found = {row["track_id"]: json.loads(row["info"]) for row in rows}
+        for track_id in track_ids:
+            record_cache("track_metadata", track_id in found)
+        return found
+
+    def put_tracks(self, tracks: Iterable[Dict]):
+        """Store track info dicts as returned by SpotifyClient."""
+        now = time.time()
+        self._connection().executemany(
+            "INSERT INTO tracks (track_id, info, info_updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (track_id) DO UPDATE SET info = excluded.info, info_updated_at = excluded.info_updated_at",
+            [(track['id'], json.dumps(track), now) for track in tracks]
+        )
+
+    # YouTube match
+
+    def get_video_id(self, track_id: str) -> Optional[str]:
+        """Return the YouTube video previously matched to a track, if any."""
+        row = self._connection().execute(
+            "SELECT video_id FROM tracks WHERE track_id = ?", (track_id,)
+        ).fetchone()
+        video_id = row["video_id"] if row else None
+        record_cache("video_id", video_id is not None)
+        return video_id
+
+    def put_video_id(self, track_id: str, video_id: str):
+        self._connection().execute(
+            "INSERT INTO tracks (track_id, video_id) VALUES (?, ?) "
+            "ON CONFLICT (track_id) DO UPDATE SET video_id = excluded.video_id",
+            (track_id, video_id)
+        )
+
+    # Audio files and Telegram file_ids
+
+    def get_audio(self, track_id: str, quality: int) -> Optional[Dict]:
+        """
+        Look up the cached audio for a track at one quality and mark it as used.
+
+        A file the admission filter turned away stays at last_used = 0: it
+        can still be served until it is deleted, but it is not cached.
+
+        Returns:
+            Dict with file_path (None once evicted), file_size and telegram_file_id, or None
+        """
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT file_path, file_size, telegram_file_id FROM audio WHERE track_id = ? AND quality = ?",
+            (track_id, quality)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE audio SET last_used = CASE WHEN last_used = 0 THEN 0 ELSE ? END "
+            "WHERE track_id = ? AND quality = ?",
+            (time.time(), track_id, quality)
+        )
+        return dict(row)
+
+    def record_request(self, track_id: str, quality: int, popularity: Optional[int] = None):
+        """Count a request for a track's audio towards the admission filter, and in the index for later processes."""
+        if self.admission:
+            self.admission.record((track_id, quality), popularity)
+            self._connection().execute(
+                "UPDATE audio SET hits = hits + 1 WHERE track_id = ? AND quality = ?", (track_id, quality)
+            )
+
+    def put_audio_file(self, track_id: str, quality: int, file_path: str, file_size: int):
+        """
+        Record a downloaded MP3 and evict least recently used files over the disk budget.
+
+        With the admission filter, a file that does not beat the files it
+        would displace is recorded with last_used = 0 instead: it does not
+        count towards the budget, later lookups and uploads leave it that way,
+        and it is deleted once its grace period is over.
+        """
+        admitted = True
+        if self.admission:
+            victims = self._victims(file_size, exclude=file_path)
+            admitted = self.admission.admit((track_id, quality), [(row["track_id"], row["quality"]) for row in victims])
+            CACHE_ADMISSION.inc(result="admitted" if admitted else "rejected")
+        self._connection().execute(
+            "INSERT INTO audio (track_id, quality, file_path, file_size, last_used, hits) VALUES (?, ?, ?, ?, ?, 1) "
+            "ON CONFLICT (track_id, quality) DO UPDATE SET file_path = excluded.file_path, "
+            "file_size = excluded.file_size, last_used = excluded.last_used",
+            (track_id, quality, file_path, file_size, time.time() if admitted else 0)
+        )
+        self.evict(keep=file_path)
+
+    def put_file_id(self, track_id: str, quality: int, telegram_file_id: str):
+        """Record the file_id Telegram assigned to an uploaded track."""
+        self._connection().execute(
+            "INSERT INTO audio (track_id, quality, telegram_file_id, last_used) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (track_id, quality) DO UPDATE SET telegram_file_id = excluded.telegram_file_id, "
+            "last_used = CASE WHEN audio.last_used = 0 THEN 0 ELSE excluded.last_used END",
+            (track_id, quality, telegram_file_id, time.time())
+        )
+
+    def drop_file_id(self, track_id: str, quality: int):
+        """Forget a file_id Telegram no longer accepts."""
+        self._connection().execute(
+            "UPDATE audio SET telegram_file_id = NULL WHERE track_id = ? AND quality = ?",
+            (track_id, quality)
+        )
+
+    def drop_file(self, track_id: str, quality: int):
+        """Forget a cached file that has disappeared from disk."""
+        self._connection().execute(
+            "UPDATE audio SET file_path = NULL WHERE track_id = ? AND quality = ?",
+            (track_id, quality)
+        )
+
+    def _written_since(self, file_path: str, cutoff: float) -> bool:
+        try:
+            return os.path.getmtime(file_path) > cutoff
+        except OSError:
+            return False
+
+    def _cached_bytes(self) -> int:
+        return self._connection().execute(
+            "SELECT COALESCE(SUM(file_size), 0) FROM audio WHERE file_path IS NOT NULL AND last_used > 0"
+        ).fetchone()[0]
+
+    def _victims(self, size: int = 0, exclude: Optional[str] = None) -> List[sqlite3.Row]:
+        """
+        The least recently used files that must go for the cache to fit `size` more bytes.
+
+        Files written within the grace period are passed over: they may not
+        have been uploaded yet.
+        """
+        over = self._cached_bytes() + size - self.max_bytes
+        if over <= 0:
+            return []
+
+        cutoff = time.time() - self.grace
+        victims = []
+        rows = self._connection().execute(
+            "SELECT track_id, quality, file_path, file_size FROM audio "
+            "WHERE file_path IS NOT NULL AND last_used > 0 ORDER BY last_used"
+        ).fetchall()
+        for row in rows:
+            if over <= 0:
+                break
+            if row["file_path"] == exclude or self._written_since(row["file_path"], cutoff):
+                continue
+            victims.append(row)
+            over -= row["file_size"] or 0
+        return victims
+
+    def _remove_file(self, row: sqlite3.Row) -> bool:
+        try:
+            os.remove(row["file_path"])
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not evict {row['file_path']}: {e}")
+            return False
+        self.drop_file(row["track_id"], row["quality"])
+        return True
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """
+        Delete least recently used MP3s until the cache fits in max_bytes.
+
+        Files the admission filter turned away are deleted too, once their
+        grace period is over. Rows keep their telegram_file_id, so evicted
+        tracks can still be sent without downloading them again.
+
+        Args:
+            keep: File path that must not be evicted (the one just added)
+
+        Returns:
+            Number of files removed
+        """
+        cutoff = time.time() - self.grace
+        rejected = self._connection().execute(
+            "SELECT track_id, quality, file_path, file_size FROM audio WHERE file_path IS NOT NULL AND last_used = 0"
+        ).fetchall()
+        removed = 0
+        for row in rejected:
+            if row["file_path"] != keep and not self._written_since(row["file_path"], cutoff):
+                if self._remove_file(row):
+                    removed += 1
+        for row in self._victims(exclude=keep):
+            if self._remove_file(row):
+                removed += 1
+
+        if removed:
+            logger.info("Evicted %d cached file(s); cache now %.1f MB", removed, self._cached_bytes() / (1024 * 1024))
+        return removed
+
+    def stats(self) -> Dict:
+        row = self._connection().execute(
+            "SELECT COUNT(*) AS files, COALESCE(SUM(file_size), 0) AS bytes, "
+            "(SELECT COUNT(*) FROM audio WHERE telegram_file_id IS NOT NULL) AS file_ids, "
+            "(SELECT COUNT(*) FROM tracks) AS tracks "
+            "FROM audio WHERE file_path IS NOT NULL"
+        ).fetchone()
+        return dict(row)
+
+    # Coroutine wrappers for the event loop
+
+    async def aget_tracks(self, track_ids: List[str]) -> Dict[str, Dict]:
+        return await self._run(self.get_tracks, track_ids)
+
+    async def aput_tracks(self, tracks: List[Dict]):
+        await self._run(self.put_tracks, tracks)
+
+    async def aget_audio(self, track_id: str, quality: int) -> Optional[Dict]:
+        return await self._run(self.get_audio, track_id, quality)
+
+    async def aput_file_id(self, track_id: str, quality: int, telegram_file_id: str):
+        await self._run(self.put_file_id, track_id, quality, telegram_file_id)
+
+    async def adrop_file_id(self, track_id: str, quality: int):
+        await self._run(self.drop_file_id, track_id, quality)
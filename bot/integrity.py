@@ -0,0 +1,139 @@
+"""
+Integrity Module
+Incremental validation of MP3 downloads while they stream to disk.
+"""
+
+import hashlib
+from typing import Optional
+from config import MP3_MIN_SIZE_RATIO
+
+# Bitrates (kbps) by header index for MPEG-1 and MPEG-2/2.5 Layer III
+MPEG1_L3_BITRATES = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+MPEG2_L3_BITRATES = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+
+REJECTED_CONTENT_TYPES = ("text/", "application/json", "application/xml", "application/xhtml")
+ID3_HEADER_SIZE = 10
+MAX_ID3_SIZE = 4 * 1024 * 1024  # Cover art can be large, but not this large
+
+
+class IntegrityError(Exception):
+    """Raised when a download is not a plausible, complete MP3."""
+
+
+def parse_frame_header(header: bytes) -> Optional[int]:
+    """
+    Parse a 4-byte MPEG audio Layer III frame header.
+
+    Args:
+        header: The four bytes that should start a frame
+
+    Returns:
+        Bitrate in kbps, or None if the bytes are not a valid Layer III header
+    """
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x03  # 0 = 2.5, 2 = MPEG-2, 3 = MPEG-1, 1 = reserved
+    layer = (header[1] >> 1) & 0x03  # 1 = Layer III
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    table = MPEG1_L3_BITRATES if version == 3 else MPEG2_L3_BITRATES
+    return table[bitrate_index]
+
+
+class StreamValidator:
+    """
+    Checks an MP3 download chunk by chunk.
+
+    The response headers are checked before any byte is written, and the
+    first chunk(s) are sniffed for an optional ID3v2 tag followed by a
+    Layer III frame header, so an HTML error page is rejected as soon as it
+    starts. A SHA-256 of the content is kept as it streams. When the stream
+    ends, its length is compared with Content-Length and with the size
+    expected from the track duration and the bitrate found in the frame
+    header.
+    """
+
+    def __init__(self, duration_ms: Optional[int] = None, min_size_ratio: float = MP3_MIN_SIZE_RATIO):
+        self.duration_ms = duration_ms
+        self.min_size_ratio = min_size_ratio
+        self.size = 0
+        self.bitrate = None
+        self.expected_length = None
+        self._hash = hashlib.sha256()
+        self._head = b""
+
+    def check_response(self, content_type: Optional[str], content_length: Optional[int] = None):
+        """
+        Validate the response headers of the download.
+
+        Args:
+            content_type: Content-Type header value
+            content_length: Total size of the file in bytes, if the server announced it
+        """
+        content_type = (content_type or "").lower()
+        if content_type.startswith(REJECTED_CONTENT_TYPES):
+            raise IntegrityError(f"Download is {content_type}, not audio")
+        self.expected_length = content_length
+
+    def feed(self, chunk: bytes):
+        """Account for the next chunk of the file, sniffing the start of the stream."""
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        if self.bitrate is None:
+            self._head += chunk
+            self._sniff()
+
+    def _sniff(self):
+        head = self._head
+        if head[:1] in (b"<", b"{") or head.lstrip()[:1] == b"<":
+            raise IntegrityError("Download is an HTML or JSON page, not audio")
+
+        offset = 0
+        if head.startswith(b"ID3"):
+            if len(head) < ID3_HEADER_SIZE:
+                return
+            # ID3v2 sizes are "synchsafe": 7 bits per byte
+            tag_size = 0
+            for byte in head[6:10]:
+                tag_size = (tag_size << 7) | (byte & 0x7F)
+            footer = ID3_HEADER_SIZE if head[5] & 0x10 else 0
+            offset = ID3_HEADER_SIZE + tag_size + footer
+            if offset > MAX_ID3_SIZE:
+                raise IntegrityError(f"Implausible ID3 tag of {tag_size} bytes")
+
+        if len(head) < offset + 4:
+            return
+        bitrate = parse_frame_header(head[offset:offset + 4])
+        if bitrate is None:
+            raise IntegrityError("No MP3 frame header at the start of the download")
+        self.bitrate = bitrate
+        self._head = b""
+
+    def expected_size(self) -> Optional[int]:
+        """Size in bytes implied by the track duration and the stream's bitrate."""
+        if not self.duration_ms or not self.bitrate:
+            return None
+        return self.duration_ms * self.bitrate // 8
+
+    def finish(self) -> str:
+        """
+        Validate the completed stream.
+
+        Returns:
+            Hex SHA-256 digest of the file
+        """
+        if self.size == 0:
+            raise IntegrityError("Download is empty")
+        if self.bitrate is None:
+            raise IntegrityError(f"Download ended after {self.size} bytes, before the first MP3 frame")
+        if self.expected_length is not None and self.size != self.expected_length:
+            raise IntegrityError(f"Download truncated: got {self.size} of {self.expected_length} bytes")
+        expected = self.expected_size()
+        if expected and self.size < expected * self.min_size_ratio:
+            raise IntegrityError(
+                f"Download too small: {self.size} bytes for {self.duration_ms // 1000}s "
+                f"at {self.bitrate}kbps (expected ~{expected})"
+            )
+        return self._hash.hexdigest()
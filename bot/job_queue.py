@@ -0,0 +1,291 @@
+"""
+Job Queue Module
+Durable SQLite-backed queue shared by the bot process and download workers.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional
+from config import JOB_QUEUE_PATH, JOB_STALE_TIMEOUT
+from . import executors
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    track_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    worker_id TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    claimed_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL,
+    tracks INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_track_key ON jobs (track_key, status);
+CREATE TABLE IF NOT EXISTS job_tracks (
+    job_id INTEGER NOT NULL,
+    track_key TEXT NOT NULL,
+    PRIMARY KEY (track_key, job_id)
+);
+CREATE INDEX IF NOT EXISTS idx_job_tracks_job ON job_tracks (job_id);
+"""
+
+# Columns added after the first release, for databases created before them
+MIGRATIONS = {
+    "heartbeat_at": "ALTER TABLE jobs ADD COLUMN heartbeat_at REAL",
+    "tracks": "ALTER TABLE jobs ADD COLUMN tracks INTEGER NOT NULL DEFAULT 1",
+}
+
+
+class JobQueue:
+    """
+    Queue of download jobs stored in a local SQLite database.
+
+    Any number of processes on the same host can enqueue and claim jobs.
+    Claims are serialized with an immediate transaction, and a job is only
+    handed out while no running job shares one of its tracks, so a track is
+    never downloaded by two workers at once, even inside a batch.
+
+    A worker renews its claim with heartbeat() while it works; a job whose
+    heartbeat stops for JOB_STALE_TIMEOUT is handed to another worker.
+
+    The plain methods block (a write may wait up to 30 s for the database
+    lock); the `a*` coroutines run them on the index stage executor for
+    callers on the event loop.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._migrate()
+
+    def _migrate(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if columns:
+                for column, statement in MIGRATIONS.items():
+                    if column not in columns:
+                        conn.execute(statement)
+            for statement in SCHEMA.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+            # Jobs queued before job_tracks existed are locked by their own key
+            conn.execute(
+                "INSERT OR IGNORE INTO job_tracks (job_id, track_key) "
+                "SELECT id, track_key FROM jobs WHERE status IN ('queued', 'running') "
+                "AND id NOT IN (SELECT job_id FROM job_tracks)"
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def _run(self, function, *args):
+        return await executors.index.run(function, *args)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, track_key: str, payload: Dict, track_keys: Optional[Iterable[str]] = None) -> int:
+        """
+        Add a job to the queue.
+
+        Args:
+            track_key: Key identifying the job's track, or the batch
+            payload: JSON-serializable job description
+            track_keys: Keys of every track a batch job downloads (defaults to track_key)
+
+        Returns:
+            ID of the new job
+        """
+        track_keys = list(dict.fromkeys(track_keys)) if track_keys else [track_key]
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(
+                "INSERT INTO jobs (track_key, payload, created_at, tracks) VALUES (?, ?, ?, ?)",
+                (track_key, json.dumps(payload), time.time(), len(track_keys))
+            )
+            conn.executemany(
+                "INSERT INTO job_tracks (job_id, track_key) VALUES (?, ?)",
+                [(cursor.lastrowid, key) for key in track_keys]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.lastrowid
+
+    def claim(self, worker_id: str) -> Optional[Dict]:
+        """
+        Claim the oldest queued job none of whose tracks is already being processed.
+
+        Args:
+            worker_id: Identifier of the claiming worker
+
+        Returns:
+            Job dict with id, track_key and payload, or None if nothing is claimable
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, track_key, payload FROM jobs WHERE status = 'queued' AND NOT EXISTS "
+                "(SELECT 1 FROM job_tracks mine "
+                "JOIN job_tracks other ON other.track_key = mine.track_key AND other.job_id != mine.job_id "
+                "JOIN jobs busy ON busy.id = other.job_id AND busy.status = 'running' "
+                "WHERE mine.job_id = jobs.id) "
+                "ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker_id = ?, claimed_at = ?, heartbeat_at = ? WHERE id = ?",
+                (worker_id, now, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return {
+            "id": row["id"],
+            "track_key": row["track_key"],
+            "payload": json.loads(row["payload"])
+        }
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """
+        Renew a worker's claim on a running job.
+
+        Returns:
+            False if the job is no longer held by this worker (it was requeued as stale)
+        """
+        cursor = self._connection().execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running' AND worker_id = ?",
+            (time.time(), job_id, worker_id)
+        )
+        return cursor.rowcount > 0
+
+    def complete(self, job_id: int):
+        """Mark a job as done."""
+        self._connection().execute(
+            "UPDATE jobs SET status = 'done', finished_at = ? WHERE id = ?",
+            (time.time(), job_id)
+        )
+
+    def fail(self, job_id: int, error: str):
+        """Mark a job as failed with the given error message."""
+        self._connection().execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+            (error, time.time(), job_id)
+        )
+
+    def requeue_stale(self, timeout: float = JOB_STALE_TIMEOUT) -> int:
+        """
+        Return jobs held by workers that died mid-download to the queue.
+
+        Args:
+            timeout: Seconds without a heartbeat after which a running job is considered abandoned
+
+        Returns:
+            Number of jobs requeued
+        """
+        cursor = self._connection().execute(
+            "UPDATE jobs SET status = 'queued', worker_id = NULL, claimed_at = NULL, heartbeat_at = NULL "
+            "WHERE status = 'running' AND COALESCE(heartbeat_at, claimed_at) < ?",
+            (time.time() - timeout,)
+        )
+        if cursor.rowcount:
+            logger.warning(f"Requeued {cursor.rowcount} stale job(s)")
+        return cursor.rowcount
+
+    def position(self, job_id: int) -> int:
+        """Return the 1-based position of a queued job, or 0 if it is no longer queued."""
+        row = self._connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND id <= ? "
+            "AND EXISTS (SELECT 1 FROM jobs WHERE id = ? AND status = 'queued')",
+            (job_id, job_id)
+        ).fetchone()
+        return row[0]
+
+    def depth(self) -> int:
+        """Return the number of jobs waiting to be claimed."""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+        ).fetchone()[0]
+
+    def queued_tracks(self) -> int:
+        """Return the number of tracks in the jobs waiting to be claimed (a batch counts each track)."""
+        return self._connection().execute(
+            "SELECT COALESCE(SUM(tracks), 0) FROM jobs WHERE status = 'queued'"
+        ).fetchone()[0]
+
+    def running(self) -> int:
+        """Return the number of jobs currently held by workers."""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'running'"
+        ).fetchone()[0]
+
+    def recent_job_time(self, limit: int = 50) -> Optional[float]:
+        """Return the mean processing time per track of the most recently finished jobs, if any."""
+        row = self._connection().execute(
+            "SELECT SUM(finished_at - claimed_at) / SUM(tracks) FROM (SELECT finished_at, claimed_at, tracks FROM jobs "
+            "WHERE status IN ('done', 'failed') AND claimed_at IS NOT NULL "
+            "ORDER BY finished_at DESC LIMIT ?)",
+            (limit,)
+        ).fetchone()
+        return row[0]
+
+    def purge_finished(self, older_than: float = 86400) -> int:
+        """Delete finished jobs older than the given number of seconds."""
+        conn = self._connection()
+        cursor = conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+            (time.time() - older_than,)
+        )
+        conn.execute("DELETE FROM job_tracks WHERE job_id NOT IN (SELECT id FROM jobs)")
+        return cursor.rowcount
+
+    # Coroutine wrappers for the event loop
+
+    async def aenqueue(self, track_key: str, payload: Dict, track_keys: Optional[Iterable[str]] = None) -> int:
+        return await self._run(self.enqueue, track_key, payload, track_keys)
+
+    async def aheartbeat(self, job_id: int, worker_id: str) -> bool:
+        return await self._run(self.heartbeat, job_id, worker_id)
+
+    async def aposition(self, job_id: int) -> int:
+        return await self._run(self.position, job_id)
+
+    async def adepth(self) -> int:
+        return await self._run(self.depth)
+
+    async def aqueued_tracks(self) -> int:
+        return await self._run(self.queued_tracks)
+
+    async def arecent_job_time(self, limit: int = 50) -> Optional[float]:
+        return await self._run(self.recent_job_time, limit)
@@ -0,0 +1,145 @@
+"""
+Job Journal Module
+Append-only record of each job's progress so work can resume after a crash or restart.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from config import JOURNAL_PATH, JOURNAL_MAX_AGE
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STAGES = ("done", "failed")
+EVENTS = ("resumed",)  # Records that update a job's details without moving its stage
+
+
+class JobJournal:
+    """
+    JSON-lines journal of job stages.
+
+    Every stage transition is appended as one line and flushed to disk:
+
+        accepted        job payload (chat, message, track(s), quality)
+        resolved_video  YouTube video id
+        download_url    final file URL from the converter
+        partial_file    path of the .part file being streamed
+        downloaded      path of the finished file
+        uploaded        the audio was sent to the chat
+        done / failed   terminal; the job is forgotten on the next compaction
+
+    A "resumed" record (with the attempt count) only updates the job's
+    details: the job continues from the stage it had reached.
+
+    On startup the journal is folded into the latest state per job and
+    rewritten with only unfinished jobs. The file belongs to the bot process;
+    jobs handed to worker processes are made durable by the job queue instead.
+    """
+
+    def __init__(self, path: str = JOURNAL_PATH, max_age: float = JOURNAL_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._states: Dict[str, Dict] = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load_and_compact()
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _load_and_compact(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-write
+                    continue
+                self._apply(record)
+
+        cutoff = time.time() - self.max_age
+        self._states = {
+            job_id: state for job_id, state in self._states.items()
+            if state.get("updated", 0) >= cutoff
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for job_id, state in self._states.items():
+                f.write(json.dumps({"id": job_id, "stage": "snapshot", "state": state}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        if self._states:
+            logger.info(f"Journal loaded with {len(self._states)} unfinished job(s)")
+
+    def _apply(self, record: Dict):
+        job_id = record["id"]
+        stage = record["stage"]
+        if stage in TERMINAL_STAGES:
+            self._states.pop(job_id, None)
+            return
+        if stage == "snapshot":
+            self._states[job_id] = record["state"]
+            return
+        state = self._states.setdefault(job_id, {})
+        state.update({k: v for k, v in record.items() if k not in ("id", "stage", "t")})
+        if stage not in EVENTS:
+            state["stage"] = stage
+        state["updated"] = record.get("t", time.time())
+
+    def record(self, job_id: str, stage: str, **data):
+        """
+        Append a stage transition for a job.
+
+        Args:
+            job_id: Job identifier
+            stage: Stage name (see class docstring)
+            **data: JSON-serializable details for the stage
+        """
+        record = {"id": job_id, "stage": stage, "t": time.time(), **data}
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        with self._lock:
+            # One write() per record keeps appends from concurrent processes whole
+            os.write(self._fd, line)
+            self._apply(record)
+
+    def checkpointer(self, job_id: str) -> Callable:
+        """Return a `checkpoint(stage, **data)` callable bound to one job."""
+        def checkpoint(stage, **data):
+            self.record(job_id, stage, **data)
+        return checkpoint
+
+    def state(self, job_id: str) -> Dict:
+        """Latest known state of a job, or an empty dict."""
+        with self._lock:
+            return dict(self._states.get(job_id, {}))
+
+    def pending(self) -> List[Dict]:
+        """Unfinished jobs that carry their own payload, oldest first."""
+        with self._lock:
+            jobs = [
+                {"id": job_id, **state} for job_id, state in self._states.items()
+                if "payload" in state
+            ]
+        return sorted(jobs, key=lambda job: job.get("accepted_at", 0))
+
+    def close(self):
+        try:
+            os.close(self._fd)
+        except OSError:
+            pass
+
+
+def noop_checkpoint(stage: str, **data):
+    """Checkpoint used when a job is not journaled."""
+
+
+def sub_job_id(job_id: Optional[str], index: int) -> Optional[str]:
+    """Journal id for one track of a batch job."""
+    return f"{job_id}/{index}" if job_id else None
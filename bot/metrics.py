@@ -0,0 +1,333 @@
+"""
+Metrics Module
+Lightweight in-process counters, gauges and histograms rendered in Prometheus text format.
+
+Download workers record their metrics in their own process. Each one
+publishes a snapshot to METRICS_DIR every few seconds, and the bot process
+renders those alongside its own, labelled with the worker's name.
+"""
+
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from config import METRICS_DIR, WORKER_COUNT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry: List["_Metric"] = []
+_stage_times: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("stage_times", default=None)
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self, peers: Optional[Dict[str, Dict]] = None) -> List[str]:
+        """
+        Text exposition of this metric, followed by the samples of other processes.
+
+        Args:
+            peers: Process name to snapshot() of that process
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples(self._items()))
+        for process, metrics in (peers or {}).items():
+            items = [(tuple(key), value) for key, value in metrics.get(self.name, [])]
+            lines.extend(self._samples(items, f'process="{process}"'))
+        return lines
+
+    def _items(self) -> List[Tuple[Tuple[str, ...], object]]:
+        with self._lock:
+            return list(self._values.items())
+
+    def _samples(self, items, extra: str = "") -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self, items, extra=""):
+        return [f"{self.name}{_format_labels(self.labelnames, key, extra)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function = function
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def get(self, **labels) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels), 0)
+
+    def _items(self):
+        if self._function is not None:
+            return [((), self._function())]
+        return super()._items()
+
+    def _samples(self, items, extra=""):
+        return [f"{self.name}{_format_labels(self.labelnames, key, extra)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # One slot per bucket plus +Inf, then sum and count
+                state = self._values[key] = [0] * (len(self.buckets) + 3)
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def summary(self) -> Dict[Tuple[str, ...], Dict[str, float]]:
+        """Return count, sum and mean per label set."""
+        with self._lock:
+            items = [(key, state[-1], state[-2]) for key, state in self._values.items()]
+        return {
+            key: {"count": count, "sum": total, "mean": total / count if count else 0.0}
+            for key, count, total in items
+        }
+
+    def _items(self):
+        with self._lock:
+            return [(key, list(state)) for key, state in self._values.items()]
+
+    def _samples(self, items, extra=""):
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                labels = _format_labels(self.labelnames, key, ",".join(filter(None, (extra, 'le="%s"' % le))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, extra)
+            lines.append(f"{self.name}_sum{labels} {state[-2]}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "musicflow_stage_duration_seconds", "Time spent in each pipeline stage.", ["stage"]
+)
+STAGE_TOTAL = Counter(
+    "musicflow_stage_total", "Pipeline stage executions by outcome.", ["stage", "outcome"]
+)
+CACHE_REQUESTS = Counter(
+    "musicflow_cache_requests_total", "Cache lookups by cache and result.", ["cache", "result"]
+)
+CACHE_ADMISSION = Counter(
+    "musicflow_cache_admission_total", "Downloaded files admitted to or turned away from the audio cache.", ["result"]
+)
+JOBS_IN_FLIGHT = Gauge(
+    "musicflow_jobs_in_flight", "Download jobs currently being processed."
+)
+DOWNLOADS_WAITING = Gauge(
+    "musicflow_downloads_waiting", "Admitted downloads waiting for a free slot."
+)
+DOWNLOADS_REJECTED = Counter(
+    "musicflow_downloads_rejected_total", "Downloads shed by admission control."
+)
+CIRCUIT_STATE = Gauge(
+    "musicflow_circuit_state", "Upstream circuit breaker state (0 closed, 1 half-open, 2 open).", ["host"]
+)
+CIRCUIT_REJECTED = Counter(
+    "musicflow_circuit_rejected_total", "Calls failed fast because the upstream circuit was open.", ["host"]
+)
+PREFETCH_TOTAL = Counter(
+    "musicflow_prefetch_total", "Speculative track resolutions by outcome.", ["outcome"]
+)
+EXECUTOR_QUEUE_WAIT = Histogram(
+    "musicflow_executor_queue_wait_seconds", "Time a task waited for a free worker, per stage executor.", ["executor"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+)
+EXECUTOR_ACTIVE = Gauge(
+    "musicflow_executor_active_workers", "Workers currently running a task, per stage executor.", ["executor"]
+)
+EXECUTOR_QUEUED = Gauge(
+    "musicflow_executor_queued_tasks", "Tasks waiting for a free worker, per stage executor.", ["executor"]
+)
+LOG_RECORDS_DROPPED = Counter(
+    "musicflow_log_records_dropped_total", "Log records dropped because the log writer fell behind."
+)
+LOOP_LAG_SECONDS = Histogram(
+    "musicflow_event_loop_lag_seconds", "How late the bot's event loop ran a scheduled wake-up.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+LOOP_STALLS = Counter(
+    "musicflow_event_loop_stalls_total", "Times a single callback blocked the event loop past the stall threshold."
+)
+
+
+@contextmanager
+def track_stage(stage: str):
+    """
+    Time a pipeline stage and count its outcome.
+
+    Any exception escaping the block counts as a failure and is re-raised.
+
+    Args:
+        stage: Stage name, e.g. 'youtube_search'
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_TOTAL.inc(stage=stage, outcome="failure")
+        raise
+    else:
+        STAGE_TOTAL.inc(stage=stage, outcome="success")
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        collected = _stage_times.get()
+        if collected is not None:
+            collected[stage] = collected.get(stage, 0.0) + elapsed
+
+
+@contextmanager
+def collect_stages():
+    """
+    Also collect the stage timings of one request, e.g. for a trace record.
+
+    Yields a dict of stage name to total seconds that every track_stage()
+    inside the block (including in stage executor threads) adds to.
+    """
+    collected: Dict[str, float] = {}
+    token = _stage_times.set(collected)
+    try:
+        yield collected
+    finally:
+        _stage_times.reset(token)
+
+
+def record_cache(cache: str, hit: bool):
+    """Count a cache hit or miss."""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def snapshot() -> Dict[str, List]:
+    """Every metric's samples as JSON-serializable data: name to [[label values], value or histogram state]."""
+    return {metric.name: [[list(key), value] for key, value in metric._items()] for metric in _registry}
+
+
+def publish_snapshot(process: str, directory: str = METRICS_DIR):
+    """Write this process's snapshot where the bot process picks it up (atomically replaced)."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{process}.json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def clear_snapshots(directory: str = METRICS_DIR):
+    """Forget the snapshots of earlier worker processes."""
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(".json"):
+            os.remove(os.path.join(directory, name))
+
+
+def load_snapshots(directory: str = METRICS_DIR) -> Dict[str, Dict]:
+    """Process name to snapshot for every published snapshot."""
+    peers = {}
+    if not os.path.isdir(directory):
+        return peers
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                peers[name[:-len(".json")]] = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read metrics snapshot {name}: {e}")
+    return peers
+
+
+def render_metrics(include_workers: bool = WORKER_COUNT > 0) -> str:
+    """
+    Render every registered metric in Prometheus text exposition format.
+
+    Args:
+        include_workers: Also render the snapshots download workers published,
+            with a process label per worker
+    """
+    peers = load_snapshots() if include_workers else None
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render(peers))
+    return "\n".join(lines) + "\n"
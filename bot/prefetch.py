@@ -0,0 +1,113 @@
+"""
+Speculative Prefetch Module
+Resolves a track while its quality card is on screen, so the button press only waits for what is left.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict
+from config import PREFETCH_QUALITY, PREFETCH_MAX_ACTIVE, PREFETCH_TTL, PREFETCH_DOWNLOAD
+from .metrics import PREFETCH_TOTAL
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """
+    Bounded speculative work for tracks a user is looking at.
+
+    schedule() starts resolving a track's video and file URL for `quality`
+    (and with `download`, fetching the file itself) in the background,
+    unless `max_active` speculations are already running or `is_busy()`
+    reports real downloads waiting for a slot. claim() hands the result to
+    the download the button press starts, waiting for it if it is still
+    running. A result nobody claims within `ttl` seconds is cancelled.
+
+    Outcomes are counted in musicflow_prefetch_total: started, skipped,
+    cached (nothing to do), claimed_ready, claimed_running, expired, failed.
+    """
+
+    def __init__(self, get_processor: Callable, is_cached: Callable[..., Awaitable[bool]],
+                 is_busy: Callable[[], bool] = lambda: False, quality: int = PREFETCH_QUALITY,
+                 max_active: int = PREFETCH_MAX_ACTIVE, ttl: float = PREFETCH_TTL,
+                 download: bool = PREFETCH_DOWNLOAD):
+        self.get_processor = get_processor
+        self.is_cached = is_cached
+        self.is_busy = is_busy
+        self.quality = quality
+        self.max_active = max_active
+        self.ttl = ttl
+        self.download = download
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._expiry: Dict[str, asyncio.TimerHandle] = {}
+
+    @property
+    def active(self) -> int:
+        return sum(1 for task in self._tasks.values() if not task.done())
+
+    def schedule(self, track_info: Dict):
+        """Start speculating on a track if the budget allows. Call from the event loop."""
+        track_id = track_info.get('id')
+        loop = asyncio.get_running_loop()
+        existing = self._tasks.get(track_id)
+        if not track_id or (existing and existing.get_loop() is loop):
+            return
+        if self.active >= self.max_active or self.is_busy():
+            PREFETCH_TOTAL.inc(outcome="skipped")
+            return
+
+        task = loop.create_task(self._speculate(track_info), name=f"prefetch-{track_id}")
+        self._tasks[track_id] = task
+        self._expiry[track_id] = loop.call_later(self.ttl, self._expire, track_id, task)
+        PREFETCH_TOTAL.inc(outcome="started")
+
+    async def _speculate(self, track_info: Dict) -> Dict:
+        try:
+            if await self.is_cached(track_info, self.quality):
+                PREFETCH_TOTAL.inc(outcome="cached")
+                return {}
+            processor = self.get_processor()
+            hints = await processor.resolve(track_info, self.quality)
+            if self.download:
+                file_path = await processor.download_track(track_info, self.quality, resume=hints)
+                if file_path:
+                    hints['file_path'] = file_path
+            return hints
+        except Exception as e:
+            PREFETCH_TOTAL.inc(outcome="failed")
+            logger.warning(f"Prefetch for {track_info['id']} failed: {e}")
+            return {}
+
+    def _expire(self, track_id: str, task: asyncio.Task):
+        if self._tasks.get(track_id) is task:
+            del self._tasks[track_id]
+            self._expiry.pop(track_id, None)
+            task.cancel()
+            PREFETCH_TOTAL.inc(outcome="expired")
+
+    async def claim(self, track_id: str, quality: int) -> Dict:
+        """
+        Take the speculative result for a track, waiting for it if it is still running.
+
+        Args:
+            track_id: Spotify track ID
+            quality: Quality the user chose
+
+        Returns:
+            Hints for download_track(resume=...): video_id, download_url,
+            partial_file (and file_path) for the prefetched quality, only
+            video_id for another quality, or an empty dict
+        """
+        task = self._tasks.pop(track_id, None)
+        handle = self._expiry.pop(track_id, None)
+        if handle is not None:
+            handle.cancel()
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            return {}
+
+        PREFETCH_TOTAL.inc(outcome="claimed_ready" if task.done() else "claimed_running")
+        hints = await task
+        if quality != self.quality:
+            # The file URL is per quality; only the video carries over
+            return {'video_id': hints['video_id']} if hints.get('video_id') else {}
+        return hints
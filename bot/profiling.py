@@ -0,0 +1,116 @@
+"""
+Profiling Module
+On-demand sampling profiler and slow-job cProfile capture for the live process.
+"""
+
+import cProfile
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from config import PROFILE_DIR, PROFILE_MAX_SECONDS, PROFILE_SAMPLE_INTERVAL, SLOW_JOB_PROFILE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusyError(Exception):
+    """Raised when a sampling run is requested while another one is in progress."""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _collapse(frame) -> list:
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def sample_stacks(seconds: float, interval: float = PROFILE_SAMPLE_INTERVAL) -> str:
+    """
+    Sample the stacks of every thread for a while.
+
+    Blocks the calling thread for the duration; the rest of the process keeps
+    running. Only one sampling run can be active at a time.
+
+    Args:
+        seconds: How long to sample (capped at PROFILE_MAX_SECONDS)
+        interval: Seconds between samples
+
+    Returns:
+        Collapsed stacks ("thread;frame;frame count" per line), the input
+        format of flamegraph.pl, speedscope and similar tools
+    """
+    seconds = max(0.0, min(seconds, PROFILE_MAX_SECONDS))
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError("A profiling run is already in progress")
+
+    try:
+        own_id = threading.get_ident()
+        counts = Counter()
+        deadline = time.monotonic() + seconds
+        samples = 0
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                thread_name = re.sub(r"[;\s]+", "_", names.get(thread_id, str(thread_id)))
+                counts[";".join([thread_name] + _collapse(frame))] += 1
+            samples += 1
+            time.sleep(interval)
+    finally:
+        _profile_lock.release()
+
+    logger.info(f"Sampling profile finished: {samples} samples over {seconds:.1f}s")
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common()) + "\n"
+
+
+@contextmanager
+def profile_if_slow(label: str, threshold: float = SLOW_JOB_PROFILE_THRESHOLD):
+    """
+    Profile the enclosed block with cProfile and keep the stats only if it was slow.
+
+    cProfile only sees the current thread, so wrap code that runs in one
+    thread (e.g. the executor side of a download). Does nothing when the
+    threshold is 0.
+
+    Args:
+        label: Name used in the stats file name
+        threshold: Minimum duration in seconds for the profile to be saved
+    """
+    if threshold <= 0:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active in this interpreter
+        yield
+        return
+
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = time.monotonic() - start
+        if elapsed >= threshold:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            safe_label = re.sub(r"[^A-Za-z0-9_-]+", "_", label)[:60]
+            path = os.path.join(PROFILE_DIR, f"{int(time.time())}_{safe_label}.prof")
+            profiler.dump_stats(path)
+            logger.warning(f"Slow job ({elapsed:.1f}s) profiled: {path}")
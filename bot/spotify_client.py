@@ -1,24 +1,39 @@
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
 import logging
-import asyncio
 from typing import Dict, List, Optional
-from config import SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET
+from config import SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET, SPOTIFY_API_URL, SPOTIFY_AUTH_URL
+from . import executors
+from .circuit_breaker import CircuitOpenError, breaker_for
+from .metrics import track_stage
 
 logger = logging.getLogger(__name__)
 
+
+def _is_upstream_failure(error: BaseException) -> bool:
+    """Spotify client errors (bad IDs, 404s) do not count against the circuit; outages and 429s do."""
+    status = getattr(error, "http_status", None)
+    return status is None or status >= 500 or status == 429
+
+
 class SpotifyClient:
-    def __init__(self):
+    def __init__(self, index=None):
+        # Optional TrackIndex: track metadata is served from it and written back after API calls
+        self.index = index
         try:
+            # spotipy pulls in requests/urllib3; import it only when a client is built
+            import spotipy
+            from spotipy.oauth2 import SpotifyClientCredentials
+
             client_credentials_manager = SpotifyClientCredentials(
                 client_id=SPOTIFY_CLIENT_ID,
                 client_secret=SPOTIFY_CLIENT_SECRET
             )
+            client_credentials_manager.OAUTH_TOKEN_URL = f"{SPOTIFY_AUTH_URL}/api/token"
             self.sp = spotipy.Spotify(
                 client_credentials_manager=client_credentials_manager,
                 requests_timeout=15,  # Increased timeout from default
                 retries=3
             )
+            self.sp.prefix = f"{SPOTIFY_API_URL}/v1/"
             logger.info("Spotify client initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize Spotify client: {e}")
@@ -30,33 +45,55 @@ class SpotifyClient:
             return None
 
         try:
-            loop = asyncio.get_event_loop()
-            track = await loop.run_in_executor(None, self.sp.track, track_id)
-            return {
-                'id': track['id'],
-                'name': track['name'],
-                'artist': ', '.join(artist['name'] for artist in track['artists']),
-                'album': track['album']['name'],
-                'duration': self._format_duration(track['duration_ms']),
-                'duration_ms': track['duration_ms'],
-                'popularity': track['popularity'],
-                'preview_url': track.get('preview_url'),
-                'external_urls': track['external_urls'],
-                'release_date': track['album']['release_date'],
-                'image_url': track['album']['images'][0]['url'] if track['album']['images'] else None
-            }
+            if self.index:
+                cached = await self.index.aget_tracks([track_id])
+                if track_id in cached:
+                    return cached[track_id]
+
+            track = await self._call(self.sp.track, track_id)
+            info = self._track_to_info(track)
+            if self.index:
+                await self.index.aput_tracks([info])
+            return info
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"Error retrieving track info for {track_id}: {e}")
             return None
 
+    async def get_tracks_info(self, track_ids: List[str]) -> List[Dict]:
+        """Fetch metadata for many tracks using one API request per 50 IDs."""
+        if not self.sp:
+            logger.error("Spotify client not initialized")
+            return []
+
+        try:
+            cached = await self.index.aget_tracks(track_ids) if self.index else {}
+            missing = [track_id for track_id in track_ids if track_id not in cached]
+
+            fetched = []
+            for i in range(0, len(missing), 50):
+                batch = missing[i:i + 50]
+                result = await self._call(self.sp.tracks, batch)
+                fetched.extend(self._track_to_info(t) for t in result['tracks'] if t)
+            if self.index and fetched:
+                await self.index.aput_tracks(fetched)
+
+            found = {**cached, **{track['id']: track for track in fetched}}
+            return [found[track_id] for track_id in track_ids if track_id in found]
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"Error retrieving track info for {len(track_ids)} tracks: {e}")
+            return []
+
     async def get_playlist_info(self, playlist_id: str) -> Optional[Dict]:
         if not self.sp:
             logger.error("Spotify client not initialized")
             return None
 
         try:
-            loop = asyncio.get_event_loop()
-            playlist = await loop.run_in_executor(None, self.sp.playlist, playlist_id)
+            playlist = await self._call(self.sp.playlist, playlist_id)
             tracks = []
             results = playlist['tracks']
 
@@ -75,7 +112,7 @@ class SpotifyClient:
                         })
 
                 if results['next']:
-                    results = await loop.run_in_executor(None, self.sp.next, results)
+                    results = await self._call(self.sp.next, results)
                 else:
                     results = None
 
@@ -90,6 +127,8 @@ class SpotifyClient:
                 'image_url': playlist['images'][0]['url'] if playlist['images'] else None
             }
 
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"Error retrieving playlist info for {playlist_id}: {e}")
             return None
@@ -100,8 +139,7 @@ class SpotifyClient:
             return None
 
         try:
-            loop = asyncio.get_event_loop()
-            album = await loop.run_in_executor(None, self.sp.album, album_id)
+            album = await self._call(self.sp.album, album_id)
             tracks = []
 
             for track in album['tracks']['items']:
@@ -127,6 +165,8 @@ class SpotifyClient:
                 'image_url': album['images'][0]['url'] if album['images'] else None
             }
 
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"Error retrieving album info for {album_id}: {e}")
             return None
@@ -137,11 +177,7 @@ class SpotifyClient:
             return []
 
         try:
-            loop = asyncio.get_event_loop()
-            results = await loop.run_in_executor(
-                None,
-                lambda: self.sp.search(q=query, type='track', limit=limit)
-            )
+            results = await self._call(lambda: self.sp.search(q=query, type='track', limit=limit))
 
             return [{
                 'id': t['id'],
@@ -154,10 +190,32 @@ class SpotifyClient:
                 'external_urls': t['external_urls']
             } for t in results['tracks']['items']]
 
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"Error searching tracks for query '{query}': {e}")
             return []
 
+    async def _call(self, function, *args):
+        """Run a blocking spotipy call on the metadata executor, through the Spotify circuit breaker."""
+        with track_stage("spotify_lookup"), breaker_for(SPOTIFY_API_URL).guard(is_failure=_is_upstream_failure):
+            return await executors.metadata.run(function, *args)
+
+    def _track_to_info(self, track: Dict) -> Dict:
+        return {
+            'id': track['id'],
+            'name': track['name'],
+            'artist': ', '.join(artist['name'] for artist in track['artists']),
+            'album': track['album']['name'],
+            'duration': self._format_duration(track['duration_ms']),
+            'duration_ms': track['duration_ms'],
+            'popularity': track['popularity'],
+            'preview_url': track.get('preview_url'),
+            'external_urls': track['external_urls'],
+            'release_date': track['album']['release_date'],
+            'image_url': track['album']['images'][0]['url'] if track['album']['images'] else None
+        }
+
     def _format_duration(self, duration_ms: int) -> str:
         seconds = duration_ms // 1000
         minutes = seconds // 60
@@ -0,0 +1,116 @@
+"""
+TinyLFU Module
+Frequency-sketch admission filter that keeps one-off downloads from flushing the audio cache.
+"""
+
+import threading
+from typing import Hashable, Iterable, Optional
+from config import AUDIO_CACHE_SKETCH_WIDTH, AUDIO_CACHE_POPULARITY_SEED
+
+MAX_COUNT = 15  # Counters saturate here, like the 4-bit counters of the TinyLFU paper
+_HALVED = bytes(count >> 1 for count in range(256))
+
+
+class FrequencySketch:
+    """
+    Count-min sketch of recent request counts.
+
+    `depth` rows of `width` small counters; a key's estimate is the minimum
+    of its counter in each row, so collisions can only overestimate. After
+    10 x width increments every counter is halved, which ages out
+    popularity that is no longer current.
+    """
+
+    def __init__(self, width: int = AUDIO_CACHE_SKETCH_WIDTH, depth: int = 4):
+        self.width = max(16, width)
+        self.depth = depth
+        self.sample_size = 10 * self.width
+        self.additions = 0
+        self._rows = [bytearray(self.width) for _ in range(depth)]
+
+    def _indexes(self, key: Hashable):
+        for row in range(self.depth):
+            yield row, hash((row, key)) % self.width
+
+    def estimate(self, key: Hashable) -> int:
+        return min(self._rows[row][i] for row, i in self._indexes(key))
+
+    def increment(self, key: Hashable, amount: int = 1):
+        """Add `amount` to a key's count (conservative update: only the minimal counters grow)."""
+        indexes = list(self._indexes(key))
+        target = min(MAX_COUNT, min(self._rows[row][i] for row, i in indexes) + amount)
+        for row, i in indexes:
+            if self._rows[row][i] < target:
+                self._rows[row][i] = target
+        self.additions += amount
+        if self.additions >= self.sample_size:
+            self._halve()
+
+    def _halve(self):
+        for counters in self._rows:
+            counters[:] = counters.translate(_HALVED)
+        self.additions //= 2
+
+
+class TinyLFU:
+    """
+    Admission filter for a byte-budgeted cache.
+
+    Every lookup is recorded in a frequency sketch. A key seen for the first
+    time starts from its Spotify popularity instead of zero (up to
+    `popularity_seed` extra counts at popularity 100), so a chart hit is
+    worth keeping on its first request while a niche track needs repeats.
+
+    A new file is admitted only if it is estimated to be requested more
+    often than all the files it would displace together. Evicting several
+    small files for one large file therefore takes a higher frequency than
+    evicting one file of the same size. A cached file counts as requested
+    at least once even if the sketch has not seen it (after a restart), so
+    an empty sketch does not let one-off downloads flush the cache.
+    """
+
+    def __init__(self, width: int = AUDIO_CACHE_SKETCH_WIDTH,
+                 popularity_seed: int = AUDIO_CACHE_POPULARITY_SEED):
+        self.sketch = FrequencySketch(width)
+        self.popularity_seed = popularity_seed
+        self._lock = threading.Lock()
+
+    def record(self, key: Hashable, popularity: Optional[int] = None):
+        """
+        Count one request for a key.
+
+        Args:
+            key: Cache key, e.g. (track_id, quality)
+            popularity: Spotify popularity (0-100), used when the key is new
+        """
+        with self._lock:
+            amount = 1
+            if popularity and self.sketch.estimate(key) == 0:
+                amount += round(popularity / 100 * self.popularity_seed)
+            self.sketch.increment(key, amount)
+
+    def seed(self, key: Hashable, count: int):
+        """Start a key at a count carried over from before this process, e.g. stored hit counts."""
+        with self._lock:
+            count = min(count, MAX_COUNT) - self.sketch.estimate(key)
+            if count > 0:
+                self.sketch.increment(key, count)
+
+    def estimate(self, key: Hashable) -> int:
+        with self._lock:
+            return self.sketch.estimate(key)
+
+    def admit(self, candidate: Hashable, victims: Iterable[Hashable]) -> bool:
+        """
+        Decide whether `candidate` may displace `victims`.
+
+        Args:
+            candidate: Key of the file that was just fetched
+            victims: Keys of the files that would be evicted to make room for it
+
+        Returns:
+            True if nothing has to go or the candidate is the more frequent
+        """
+        with self._lock:
+            victim_frequency = sum(max(self.sketch.estimate(key), 1) for key in victims)
+            return victim_frequency == 0 or self.sketch.estimate(candidate) > victim_frequency
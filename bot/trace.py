@@ -0,0 +1,162 @@
+"""
+Workload Trace Module
+Compact append-only record of the tracks users request, for replaying against cache policies offline.
+"""
+
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+from config import TRACE_ENABLED, TRACE_PATH, TRACE_SALT, TRACE_SALT_PATH
+from .metrics import collect_stages
+
+logger = logging.getLogger(__name__)
+
+_current: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("trace_entry", default=None)
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def load_salt(path: str = TRACE_SALT_PATH) -> str:
+    """
+    The secret key for hashing track IDs, generated on first use and kept in `path`.
+
+    Processes that start at the same time agree on one key: each writes a
+    candidate to a temporary file and only the first hard link to `path` wins.
+    """
+    if not os.path.exists(path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.write(fd, secrets.token_hex(32).encode())
+        finally:
+            os.close(fd)
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def hash_track_id(track_id: str, salt: str) -> str:
+    """
+    Short keyed hash of a Spotify track ID: stable within a trace, not reversible to the track.
+
+    Track IDs are public, so the hash is only irreversible while the salt
+    is secret; an empty salt is refused.
+    """
+    if not salt:
+        raise ValueError("hash_track_id needs a non-empty secret salt")
+    return hashlib.blake2b(track_id.encode(), digest_size=8, key=salt.encode()[:64]).hexdigest()
+
+
+class TraceRecorder:
+    """
+    JSON-lines trace of track requests.
+
+    One line per track a job asks for, written when the track is ready:
+
+        t       request time (unix seconds)
+        track   hashed track ID
+        q       quality in kbps
+        pop     Spotify popularity (0-100)
+        dur     track duration in ms
+        size    MP3 size in bytes (0 if the track failed)
+        src     telegram (re-sent by file_id), disk (audio cache) or download
+        ok      False if the track could not be fetched
+        stages  seconds per pipeline stage (see bot.metrics.track_stage)
+        total   seconds for the whole request
+
+    Lines are appended with one write() each, so the bot and its worker
+    processes can share a file. Without a TRACE_SALT the track IDs are keyed
+    with a random salt kept in TRACE_SALT_PATH, so traces stay comparable
+    across restarts but cannot be matched to the public catalogue.
+    """
+
+    def __init__(self, path: str = TRACE_PATH, salt: Optional[str] = None):
+        self.path = path
+        self.salt = salt or TRACE_SALT or load_salt()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def write(self, entry: Dict):
+        try:
+            os.write(self._fd, (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8"))
+        except OSError as e:
+            logger.warning(f"Could not write trace entry: {e}")
+
+    @contextmanager
+    def request(self, track_info: Dict, quality: int):
+        """
+        Trace one track request; note() inside the block fills in size, source and outcome.
+
+        Args:
+            track_info: Track dict (id, popularity, duration_ms)
+            quality: Requested quality in kbps
+        """
+        entry = {
+            "t": round(time.time(), 3),
+            "track": hash_track_id(track_info['id'], self.salt),
+            "q": int(quality),
+            "pop": track_info.get('popularity'),
+            "dur": track_info.get('duration_ms'),
+            "size": 0,
+            "src": None,
+            "ok": False,
+        }
+        start = time.perf_counter()
+        token = _current.set(entry)
+        try:
+            with collect_stages() as stages:
+                yield entry
+        finally:
+            _current.reset(token)
+            entry["total"] = round(time.perf_counter() - start, 3)
+            entry["stages"] = {stage: round(seconds, 3) for stage, seconds in stages.items()}
+            if entry["src"] is None:
+                entry["src"] = "download" if "file_download" in stages else "disk"
+            self.write(entry)
+
+    def close(self):
+        os.close(self._fd)
+
+
+def get_recorder() -> Optional[TraceRecorder]:
+    """The process-wide recorder, or None when tracing is off."""
+    global _recorder
+    if not TRACE_ENABLED:
+        return None
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = TraceRecorder()
+    return _recorder
+
+
+def trace_request(track_info: Dict, quality: int):
+    """Context manager tracing one track request if TRACE_ENABLED, else a no-op."""
+    recorder = get_recorder()
+    if recorder is None or not track_info.get('id'):
+        return nullcontext()
+    return recorder.request(track_info, quality)
+
+
+def note(**fields):
+    """Set fields (size, src, ok) on the trace entry of the current request, if one is being traced."""
+    entry = _current.get()
+    if entry is not None:
+        entry.update(fields)
@@ -4,13 +4,58 @@ Contains helper functions for the Telegram music bot.
 """
 
 import re
+import hmac
 import logging
+import threading
+from collections import OrderedDict
 from typing import List, Tuple, Optional
 from telegram import InlineKeyboardButton
-from config import QUALITY_OPTIONS
+from config import QUALITY_OPTIONS, ADMIN_TOKEN, AUDIO_BITRATES, AUDIO_SIZE_MARGIN, TELEGRAM_UPLOAD_LIMIT
+from .metrics import record_cache
 
 logger = logging.getLogger(__name__)
 
+SPOTIFY_LINK_PATTERN = re.compile(
+    r'spotify\.com/(?:intl-[a-zA-Z-]+/)?(track|playlist|album)/([a-zA-Z0-9]+)'
+    r'|spotify:(track|playlist|album):([a-zA-Z0-9]+)'
+    r'|((?:https?://)?spotify\.link/[a-zA-Z0-9]+)'
+)
+SPOTIFY_URL_PATTERN = re.compile(
+    r'https?://open\.spotify\.com/(track|playlist|album)/[a-zA-Z0-9]+'
+    r'|spotify:(track|playlist|album):[a-zA-Z0-9]+'
+)
+SHORT_LINK_CACHE_SIZE = 1024
+
+_short_link_cache = OrderedDict()
+_short_link_lock = threading.Lock()
+
+def extract_spotify_links(text: str) -> List[Tuple[str, str]]:
+    """
+    Find every Spotify reference in a message in a single pass.
+    
+    Args:
+        text: Message text that may contain any number of links
+        
+    Returns:
+        Deduplicated list of (spotify_id, content_type) in order of appearance.
+        Short links are returned as (short_url, 'short') and must be resolved
+        with resolve_short_link().
+    """
+    links = []
+    seen = set()
+    for match in SPOTIFY_LINK_PATTERN.finditer(text):
+        web_type, web_id, uri_type, uri_id, short_url = match.groups()
+        if short_url:
+            if not short_url.startswith('http'):
+                short_url = f"https://{short_url}"
+            link = (short_url, 'short')
+        else:
+            link = (web_id or uri_id, web_type or uri_type)
+        if link not in seen:
+            seen.add(link)
+            links.append(link)
+    return links
+
 def extract_spotify_id(url: str) -> Tuple[Optional[str], Optional[str]]:
     """
     Extract Spotify ID and content type from a Spotify URL.
@@ -21,43 +66,54 @@ def extract_spotify_id(url: str) -> Tuple[Optional[str], Optional[str]]:
     Returns:
         Tuple of (spotify_id, content_type) or (None, None) if invalid
     """
-    try:
-        # Regular expression patterns for different Spotify URL formats
-        patterns = {
-            'track': r'spotify\.com/track/([a-zA-Z0-9]+)',
-            'playlist': r'spotify\.com/playlist/([a-zA-Z0-9]+)',
-            'album': r'spotify\.com/album/([a-zA-Z0-9]+)',
-        }
-        
-        # Also handle spotify: URI format
-        uri_patterns = {
-            'track': r'spotify:track:([a-zA-Z0-9]+)',
-            'playlist': r'spotify:playlist:([a-zA-Z0-9]+)',
-            'album': r'spotify:album:([a-zA-Z0-9]+)',
-        }
-        
-        # Try web URL patterns first
-        for content_type, pattern in patterns.items():
-            match = re.search(pattern, url)
-            if match:
-                spotify_id = match.group(1)
-                logger.info(f"Extracted {content_type} ID: {spotify_id}")
-                return spotify_id, content_type
-        
-        # Try URI patterns
-        for content_type, pattern in uri_patterns.items():
-            match = re.search(pattern, url)
-            if match:
-                spotify_id = match.group(1)
-                logger.info(f"Extracted {content_type} ID from URI: {spotify_id}")
-                return spotify_id, content_type
-        
-        logger.warning(f"No valid Spotify ID found in URL: {url}")
-        return None, None
+    for spotify_id, content_type in extract_spotify_links(url):
+        if content_type != 'short':
+            return spotify_id, content_type
+    
+    logger.debug("No valid Spotify ID found in URL: %s", url)
+    return None, None
+
+def resolve_short_link(short_url: str, timeout: float = 10) -> Optional[Tuple[str, str]]:
+    """
+    Resolve a spotify.link short URL to the (spotify_id, content_type) it points at.
+    Successful resolutions are cached, since short links never change target.
+    
+    Args:
+        short_url: Short link such as https://spotify.link/abc123
+        timeout: Request timeout in seconds
         
+    Returns:
+        Tuple of (spotify_id, content_type) or None if it could not be resolved
+    """
+    with _short_link_lock:
+        if short_url in _short_link_cache:
+            _short_link_cache.move_to_end(short_url)
+            record_cache("short_link", True)
+            return _short_link_cache[short_url]
+    record_cache("short_link", False)
+    
+    import requests
+    
+    try:
+        response = requests.get(short_url, timeout=timeout, allow_redirects=True,
+                                headers={"User-Agent": "Mozilla/5.0"})
+        # The redirect target is normally open.spotify.com; some app-link pages
+        # only embed it in the HTML, so fall back to searching the body.
+        candidates = extract_spotify_links(response.url) or extract_spotify_links(response.text)
     except Exception as e:
-        logger.error(f"Error extracting Spotify ID from URL {url}: {e}")
-        return None, None
+        logger.error(f"Error resolving short link {short_url}: {e}")
+        return None
+    
+    resolved = next((link for link in candidates if link[1] != 'short'), None)
+    if resolved is None:
+        logger.warning(f"Short link did not resolve to Spotify content: {short_url}")
+        return None
+    
+    with _short_link_lock:
+        _short_link_cache[short_url] = resolved
+        if len(_short_link_cache) > SHORT_LINK_CACHE_SIZE:
+            _short_link_cache.popitem(last=False)
+    return resolved
 
 def create_quality_keyboard(track_id: str) -> List[List[InlineKeyboardButton]]:
     """
@@ -117,16 +173,7 @@ def validate_spotify_url(url: str) -> bool:
     Returns:
         True if valid Spotify URL, False otherwise
     """
-    spotify_patterns = [
-        r'https?://open\.spotify\.com/(track|playlist|album)/[a-zA-Z0-9]+',
-        r'spotify:(track|playlist|album):[a-zA-Z0-9]+'
-    ]
-    
-    for pattern in spotify_patterns:
-        if re.match(pattern, url):
-            return True
-    
-    return False
+    return SPOTIFY_URL_PATTERN.match(url) is not None
 
 def format_file_size(size_bytes: int) -> str:
     """
@@ -151,6 +198,39 @@ def format_file_size(size_bytes: int) -> str:
     
     return f"{size:.1f} {size_names[size_index]}"
 
+def estimate_audio_size(duration_ms: int, quality: int) -> int:
+    """
+    Predict the size of an MP3 before downloading it.
+
+    Args:
+        duration_ms: Track duration in milliseconds
+        quality: Bitrate in kbps
+
+    Returns:
+        Expected size in bytes, with AUDIO_SIZE_MARGIN headroom
+    """
+    return int(duration_ms / 1000 * quality * 1000 / 8 * AUDIO_SIZE_MARGIN)
+
+def fit_quality(duration_ms: Optional[int], quality: int, limit: int = TELEGRAM_UPLOAD_LIMIT) -> Optional[int]:
+    """
+    Pick the highest bitrate up to the requested one whose file will fit the upload limit.
+
+    Args:
+        duration_ms: Track duration in milliseconds (unknown: the request is kept)
+        quality: Requested bitrate in kbps
+        limit: Largest file that can be sent, in bytes
+
+    Returns:
+        The requested bitrate if it fits, else the highest lower one from
+        AUDIO_BITRATES that does, or None if the track is too long at any
+    """
+    if not duration_ms:
+        return quality
+    for bitrate in sorted({quality, *AUDIO_BITRATES}, reverse=True):
+        if bitrate <= quality and estimate_audio_size(duration_ms, bitrate) <= limit:
+            return bitrate
+    return None
+
 def sanitize_filename(filename: str) -> str:
     """
     Sanitize filename by removing invalid characters.
@@ -268,5 +348,21 @@ def create_search_query(track_name: str, artist_name: str) -> str:
     # Create search query
     search_query = f"{track_clean} {artist_clean}"
     
-    logger.info(f"Created search query: {search_query}")
+    logger.debug("Created search query: %s", search_query)
     return search_query
+
+def verify_admin_token(authorization: Optional[str]) -> bool:
+    """
+    Check an Authorization header against the configured admin token.
+    
+    Args:
+        authorization: Header value, e.g. "Bearer <token>"
+        
+    Returns:
+        True if admin endpoints are enabled and the token matches
+    """
+    if not ADMIN_TOKEN or not authorization:
+        return False
+    
+    token = authorization[7:] if authorization.startswith("Bearer ") else authorization
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
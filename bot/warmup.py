@@ -0,0 +1,165 @@
+"""
+Cache Warm-up Module
+Pre-populates the metadata, video-match and audio caches for known tracks.
+
+Run offline against a file of Spotify track, album and playlist links
+(one or more per line, '#' starts a comment):
+
+    python -m bot.warmup links.txt --quality 128,320 --concurrency 4
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+from config import DEMO_TRACKS, WARMUP_CONCURRENCY, WARMUP_QUALITIES
+from .logs import setup_logging
+from .utils import extract_spotify_links
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupProgress:
+    """Counts finished downloads and reports progress and throughput."""
+
+    def __init__(self, total: int, report: Optional[Callable[[str], None]] = None):
+        self.total = total
+        self.done = 0
+        self.cached = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.report = report
+
+    def finish(self, track_info: Dict, quality: int, ok: bool, cached: bool):
+        self.done += 1
+        self.cached += cached
+        self.failed += not ok
+        if self.report:
+            status = "cached" if cached else ("ok" if ok else "FAILED")
+            self.report(
+                f"[{self.done}/{self.total}] {self.rate():.2f} tracks/s  "
+                f"{track_info['name']} — {track_info['artist']} ({quality}kbps) {status}"
+            )
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed else 0.0
+
+    def summary(self) -> Dict:
+        return {
+            "tracks": self.total,
+            "downloaded": self.done - self.cached - self.failed,
+            "already_cached": self.cached,
+            "failed": self.failed,
+            "seconds": round(time.monotonic() - self.started, 1),
+            "tracks_per_second": round(self.rate(), 3),
+        }
+
+
+async def warm_tracks(tracks: List[Dict], qualities: Iterable[int] = WARMUP_QUALITIES,
+                      concurrency: int = WARMUP_CONCURRENCY,
+                      report: Optional[Callable[[str], None]] = None) -> Dict:
+    """
+    Download every track at every quality into the audio cache.
+
+    Tracks that are already cached are skipped without touching the network.
+
+    Args:
+        tracks: Track info dicts from SpotifyClient
+        qualities: Bitrates to cache
+        concurrency: Downloads running at once
+        report: Optional callable receiving one progress line per finished download
+
+    Returns:
+        Summary dict with counts and throughput
+    """
+    from .handlers import get_audio_processor, get_index
+
+    index = get_index()
+    processor = get_audio_processor()
+    jobs = [(track, quality) for track in tracks for quality in qualities]
+    progress = WarmupProgress(len(jobs), report)
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def warm(track_info, quality):
+        async with semaphore:
+            cached = await index.aget_audio(track_info['id'], quality)
+            # A file deleted behind the index's back is downloaded again (download_track drops the stale row)
+            if cached and cached['file_path'] and os.path.exists(cached['file_path']):
+                progress.finish(track_info, quality, True, True)
+                return
+            file_path = await processor.download_track(track_info, quality)
+            progress.finish(track_info, quality, bool(file_path), False)
+
+    await asyncio.gather(*(warm(track, quality) for track, quality in jobs))
+    return progress.summary()
+
+
+async def warm_links(text: str, **options) -> Dict:
+    """Resolve every Spotify link in `text` (no playlist size cap) and warm the tracks."""
+    from .handlers import collect_tracks, resolve_links
+
+    links = await resolve_links(extract_spotify_links(text))
+    tracks = await collect_tracks(links, limit=None)
+    logger.info(f"Warm-up: {len(links)} link(s) resolved to {len(tracks)} track(s)")
+    return await warm_tracks(tracks, **options)
+
+
+async def warm_demo_tracks() -> Optional[Dict]:
+    """
+    Background startup task: make the demo tracks instant before traffic arrives.
+
+    Only started when downloads run in-process, where download_track merges
+    it with user requests for the same track.
+    """
+    from .demo_songs import DemoSongs
+
+    urls = DemoSongs().demo_urls + [track["url"] for track in DEMO_TRACKS]
+    try:
+        summary = await warm_links("\n".join(urls))
+    except Exception as e:
+        logger.error(f"Demo warm-up failed: {e}")
+        return None
+    logger.info(f"Demo warm-up finished: {summary}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pre-populate the track caches from a file of Spotify links.",
+        epilog="Use '-' to read links from stdin."
+    )
+    parser.add_argument("links_file")
+    parser.add_argument("--quality", default=",".join(map(str, WARMUP_QUALITIES)),
+                        help="comma-separated bitrates to cache (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--quiet", action="store_true", help="only print the final summary")
+    args = parser.parse_args()
+
+    setup_logging(level=logging.WARNING, fmt="text")
+    if args.links_file == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(args.links_file, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    text = "\n".join(line.split("#", 1)[0] for line in lines)
+
+    summary = asyncio.run(warm_links(
+        text,
+        qualities=[int(q) for q in args.quality.split(",") if q.strip()],
+        concurrency=args.concurrency,
+        report=None if args.quiet else print,
+    ))
+    print(
+        f"✅ Warmed {summary['tracks']} download(s) in {summary['seconds']}s "
+        f"({summary['tracks_per_second']} tracks/s): {summary['downloaded']} downloaded, "
+        f"{summary['already_cached']} already cached, {summary['failed']} failed"
+    )
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
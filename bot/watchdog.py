@@ -0,0 +1,144 @@
+"""
+Event Loop Watchdog Module
+Measures the bot's event-loop lag from inside the loop and catches callbacks that block it.
+"""
+
+import asyncio
+import inspect
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, Optional
+from config import LOOP_PROBE_INTERVAL, LOOP_STALL_THRESHOLD, LOOP_LAG_UNHEALTHY, LOOP_LAG_WINDOW
+from .metrics import LOOP_LAG_SECONDS, LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+
+class LoopWatchdog:
+    """
+    Event-loop lag probe plus a stall detector.
+
+    A task on the loop sleeps for `interval` and records how late it woke up;
+    that lateness is the time other callbacks held the loop. A separate
+    thread checks that the probe keeps ticking: when it has been silent for
+    longer than `stall_threshold`, the loop thread's stack is captured so the
+    blocking call and the coroutine that made it can be reported.
+    """
+
+    def __init__(self, interval: float = LOOP_PROBE_INTERVAL,
+                 stall_threshold: float = LOOP_STALL_THRESHOLD,
+                 unhealthy_lag: float = LOOP_LAG_UNHEALTHY,
+                 window: int = LOOP_LAG_WINDOW):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.unhealthy_lag = unhealthy_lag
+        self.stalls = 0
+        self.last_stall: Optional[Dict] = None
+        self.last_seen = 0.0
+        self._lags = deque(maxlen=window)
+        self._last_tick = None
+        self._loop = None
+        self._loop_thread_id = None
+        self._monitor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start probing the running loop. Call from inside the loop; safe to call again after a restart."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._tick()
+        self._loop.create_task(self._probe(), name="loop-watchdog")
+
+        with self._lock:
+            if self._monitor is None:
+                self._monitor = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+                self._monitor.start()
+
+    def _tick(self):
+        self._last_tick = time.monotonic()
+        self.last_seen = time.time()
+
+    async def _probe(self):
+        loop = asyncio.get_running_loop()
+        while loop is self._loop:
+            scheduled = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - scheduled - self.interval)
+            self._lags.append(lag)
+            LOOP_LAG_SECONDS.observe(lag)
+            self._tick()
+
+    def _watch(self):
+        reported_tick = None
+        while True:
+            time.sleep(self.interval)
+            last_tick = self._last_tick
+            if last_tick is None or last_tick == reported_tick:
+                continue
+            blocked = time.monotonic() - last_tick - self.interval
+            if blocked > self.stall_threshold and self._loop is not None and self._loop.is_running():
+                # Report each stall once, while it is still happening
+                reported_tick = last_tick
+                self._report_stall(blocked)
+
+    def _report_stall(self, blocked: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        stack = traceback.format_stack(frame)
+        # The innermost coroutine frame is the one that made the blocking call
+        coroutine = None
+        while frame is not None and coroutine is None:
+            if frame.f_code.co_flags & inspect.CO_COROUTINE:
+                coroutine = f"{frame.f_code.co_name} ({frame.f_code.co_filename}:{frame.f_lineno})"
+            frame = frame.f_back
+
+        self.stalls += 1
+        LOOP_STALLS.inc()
+        self.last_stall = {
+            "at": time.time(),
+            "blocked_for": round(blocked, 3),
+            "coroutine": coroutine,
+            "stack": "".join(stack[-15:]),
+        }
+        logger.warning(
+            f"Event loop blocked for {blocked:.1f}s+ in {coroutine or 'a plain callback'}:\n"
+            + "".join(stack[-8:])
+        )
+
+    def current_lag(self) -> float:
+        """Seconds the loop is currently overdue to run the probe (0 when it is responsive)."""
+        if self._last_tick is None:
+            return 0.0
+        return max(0.0, time.monotonic() - self._last_tick - self.interval)
+
+    def healthy(self) -> bool:
+        """False when the loop is blocked right now, or recent lag is above the threshold."""
+        lags = sorted(self._lags)
+        p95 = lags[int(len(lags) * 0.95)] if lags else 0.0
+        return max(self.current_lag(), p95) < self.unhealthy_lag
+
+    def stats(self) -> Dict:
+        lags = sorted(self._lags)
+
+        def percentile(p):
+            return round(lags[min(len(lags) - 1, int(len(lags) * p))] * 1000, 2) if lags else None
+
+        return {
+            "running": self._last_tick is not None,
+            "current_lag_ms": round(self.current_lag() * 1000, 2),
+            "lag_p50_ms": percentile(0.50),
+            "lag_p95_ms": percentile(0.95),
+            "lag_p99_ms": percentile(0.99),
+            "lag_max_ms": round(lags[-1] * 1000, 2) if lags else None,
+            "stalls": self.stalls,
+            "last_stall": self.last_stall,
+            "healthy": self.healthy(),
+        }
+
+
+watchdog = LoopWatchdog()
@@ -11,10 +11,116 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 
+# Upstream Endpoints (override to point the bot at local stand-ins)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com")
+SPOTIFY_AUTH_URL = os.getenv("SPOTIFY_AUTH_URL", "https://accounts.spotify.com")
+YOUTUBE_BASE_URL = os.getenv("YOUTUBE_BASE_URL", "https://www.youtube.com")
+Y2MATE_BASE_URL = os.getenv("Y2MATE_BASE_URL", "https://www.y2mate.is")
+Y2MATE_DOWNLOAD_PREFIX = os.getenv("Y2MATE_DOWNLOAD_PREFIX", "https://dl")  # Start of final file links
+
+# Telegram Uploads
+# Set TELEGRAM_LOCAL_MODE=1 when TELEGRAM_API_URL is a self-hosted telegram-bot-api server on this
+# machine: files are then sent by path (the server reads them from disk) and may be up to 2000 MB
+TELEGRAM_LOCAL_MODE = os.getenv("TELEGRAM_LOCAL_MODE", "0") == "1"
+TELEGRAM_UPLOAD_LIMIT = (2000 if TELEGRAM_LOCAL_MODE else 50) * 1024 * 1024
+UPLOAD_WRITE_TIMEOUT = 300  # Seconds allowed for streaming one file to the public Bot API
+
 # Bot Settings
 MAX_PLAYLIST_SIZE = 50  # Maximum number of songs to process from a playlist
+BATCH_PREVIEW_SIZE = 10  # Number of tracks listed on a batch card
+MEDIA_GROUP_SIZE = 10  # Batch tracks sent per album (send_media_group accepts 2-10 audios)
 DOWNLOAD_TIMEOUT = 300  # 5 minutes timeout for downloads
 CONCURRENT_DOWNLOADS = 3  # Maximum concurrent downloads
+MP3_MIN_SIZE_RATIO = 0.5  # Downloads smaller than this fraction of duration x bitrate are rejected as truncated
+
+# Stage Executors (worker threads per pipeline stage, so slow downloads never delay quick lookups)
+METADATA_WORKERS = int(os.getenv("METADATA_WORKERS", "8"))  # Spotify calls and short-link resolution
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))  # YouTube search page fetches
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(2, os.cpu_count() or 1))))  # Processes for HTML parsing
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", "4"))  # Y2Mate analyze/convert round trips
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", str(CONCURRENT_DOWNLOADS + 2)))  # File transfers (+2 for warm-up)
+INDEX_WORKERS = 2  # SQLite track index reads and writes
+
+# Upstream Timeouts & Circuit Breakers
+HTTP_TIMEOUT = (5, 30)  # (connect, read) seconds for every upstream HTTP request
+BREAKER_WINDOW = 60  # Seconds of calls considered when deciding to open a circuit
+BREAKER_MIN_CALLS = 5  # Calls needed in the window before a circuit can open
+BREAKER_FAILURE_RATE = 0.5  # Fraction of failed (or slow) calls that opens the circuit
+BREAKER_SLOW_CALL = 20.0  # Seconds after which a request counts as failed
+BREAKER_OPEN_SECONDS = 30  # How long an open circuit fails fast before probing again
+
+# Admission Control
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "50"))  # Maximum downloads waiting in line
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "600"))  # Reject when the estimated wait (s) exceeds this
+ADMISSION_DEFAULT_JOB_TIME = 30.0  # Assumed seconds per download until real latencies are recorded
+ADMISSION_LATENCY_WINDOW = 50  # Number of recent samples kept per pipeline stage
+
+# Storage
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+# Worker Mode
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "0"))  # 0 = download inside the bot process
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(DATA_DIR, "jobs.db"))
+WORKER_POLL_INTERVAL = 1.0  # Seconds an idle worker waits before polling the queue again
+JOB_STALE_TIMEOUT = DOWNLOAD_TIMEOUT * 2  # Running jobs without a heartbeat for this long are handed to another worker
+JOB_HEARTBEAT_INTERVAL = JOB_STALE_TIMEOUT / 4  # Seconds between a worker's claim renewals while a job runs
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(DATA_DIR, "metrics"))  # Worker metric snapshots for /metrics
+METRICS_PUBLISH_INTERVAL = 10.0  # Seconds between a worker's metric snapshots
+
+# Track Index & Audio Cache
+INDEX_PATH = os.getenv("INDEX_PATH", os.path.join(DATA_DIR, "index.db"))
+INDEX_METADATA_TTL = 7 * 24 * 3600  # Seconds before cached Spotify metadata is fetched again
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", os.path.join(DATA_DIR, "audio"))
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_MB", "2048")) * 1024 * 1024  # Disk budget for cached MP3s
+AUDIO_CACHE_ADMISSION = os.getenv("AUDIO_CACHE_ADMISSION", "tinylfu")  # "tinylfu", or "lru" to cache every download
+AUDIO_CACHE_SKETCH_WIDTH = 8192  # Counters per row of the request frequency sketch (about 16x the files cached)
+AUDIO_CACHE_POPULARITY_SEED = 1  # A new track's count starts at 1 + round(popularity / 100 * this)
+AUDIO_CACHE_GRACE = 600  # Seconds a new file is never deleted, so it can still be uploaded
+
+# Cache Warm-up
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "1") == "1"  # Pre-download the demo tracks (without download workers)
+WARMUP_QUALITIES = [int(q) for q in os.getenv("WARMUP_QUALITIES", "128").split(",") if q.strip()]
+WARMUP_CONCURRENCY = 2  # Parallel downloads for the startup warm-up (the CLI takes --concurrency)
+
+# Speculative Prefetch (resolve a track while the user is still choosing its quality)
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"  # Only applies without download workers
+PREFETCH_QUALITY = 128  # Quality whose file URL is resolved ahead of time (the first button)
+PREFETCH_MAX_ACTIVE = int(os.getenv("PREFETCH_MAX_ACTIVE", "4"))  # Speculative jobs running at once
+PREFETCH_TTL = 120  # Seconds a speculative result waits for the button press before it is discarded
+PREFETCH_DOWNLOAD = os.getenv("PREFETCH_DOWNLOAD", "0") == "1"  # Also fetch the file itself (costs bandwidth)
+
+# Job Journal
+JOURNAL_PATH = os.getenv("JOURNAL_PATH", os.path.join(DATA_DIR, "journal.jsonl"))
+JOURNAL_MAX_AGE = 24 * 3600  # Unfinished jobs older than this are not resumed
+JOURNAL_MAX_ATTEMPTS = 3  # Times a job is resumed before it is marked failed
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "25"))  # Seconds to finish in-flight jobs on SIGTERM
+
+# Workload Trace (one line per requested track, for sizing the cache offline; see benchmarks/simulate_cache.py)
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "0") == "1"
+TRACE_PATH = os.getenv("TRACE_PATH", os.path.join(DATA_DIR, "trace.jsonl"))
+TRACE_SALT = os.getenv("TRACE_SALT", "")  # Key for the hashed track ids in the trace; empty: a random one, see below
+TRACE_SALT_PATH = os.path.join(DATA_DIR, "trace_salt")  # Where the random key is generated on first use and kept
+
+# Logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" (one object per line, with job ids) or "text"
+LOG_QUEUE_SIZE = 10000  # Records buffered for the writer thread; beyond this new records are dropped
+LOG_DEBUG_SAMPLE = int(os.getenv("LOG_DEBUG_SAMPLE", "100"))  # Keep 1 in N DEBUG lines per message
+
+# Admin & Profiling
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # Bearer token for /admin/* endpoints (unset disables them)
+ADMIN_USER_IDS = {int(uid) for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}
+PROFILE_MAX_SECONDS = 60  # Longest sampling run an admin can request
+PROFILE_SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+SLOW_JOB_PROFILE_THRESHOLD = float(os.getenv("SLOW_JOB_PROFILE_THRESHOLD", "0"))  # Seconds; 0 disables
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")
+
+# Event Loop Watchdog
+LOOP_PROBE_INTERVAL = 0.5  # Seconds between lag probes on the bot's event loop
+LOOP_STALL_THRESHOLD = 1.0  # A callback blocking the loop longer than this is logged with its stack
+LOOP_LAG_UNHEALTHY = float(os.getenv("LOOP_LAG_UNHEALTHY", "10"))  # Seconds of lag that fail /health
+LOOP_LAG_WINDOW = 240  # Probes kept for lag percentiles (~2 minutes)
 
 # Quality Options
 QUALITY_OPTIONS = {
@@ -22,6 +128,8 @@ QUALITY_OPTIONS = {
     "🚀 High (192kbps)": "192", 
     "💎 Premium (320kbps)": "320"
 }
+AUDIO_BITRATES = sorted(int(quality) for quality in QUALITY_OPTIONS.values())  # Steps a too-long track drops through
+AUDIO_SIZE_MARGIN = 1.03  # Predicted MP3 size = duration x bitrate x this (tags, bitrate overshoot)
 
 # Bot Messages
 BOT_WELCOME = """🎵 *Welcome to MusicFlow Bot!* 🎵
@@ -6,25 +6,32 @@ Runs Flask for Render and starts the Telegram bot (async).
 
 import logging
 import os
+import signal
+import sys
 import threading
 import time
 import asyncio
-from flask import Flask, jsonify, render_template
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
-from bot.handlers import (
-    start_command, help_command, handle_button_callback, handle_message
-)
+from flask import Flask, Response, abort, jsonify, render_template, request
+from telegram.ext import Application
+from config import WORKER_COUNT, TELEGRAM_API_URL, TELEGRAM_LOCAL_MODE, DRAIN_TIMEOUT
+from bot.handlers import register_handlers, post_init, admission, drain_and_stop
+from bot.circuit_breaker import circuit_stats
+from bot.executors import executor_stats
+from bot.logs import setup_logging
+from bot.metrics import render_metrics, PROMETHEUS_CONTENT_TYPE
+from bot.profiling import ProfilerBusyError, sample_stacks
+from bot.utils import verify_admin_token
+from bot.watchdog import watchdog
+from worker import start_workers
 
 # Logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Flask setup
 app = Flask(__name__)
-bot_status = {"running": False, "start_time": time.time(), "last_seen": 0}
+bot_status = {"running": False, "start_time": time.time()}
+bot_runtime = {"application": None, "loop": None, "workers": []}
 
 @app.route('/')
 def home():
@@ -32,12 +39,15 @@ def home():
 
 @app.route('/health')
 def health():
+    # A wedged event loop answers 503 so the platform restarts the instance
+    healthy = watchdog.healthy()
     return jsonify({
-        "status": "healthy",
+        "status": "healthy" if healthy else "unhealthy",
         "timestamp": time.time(),
         "bot_running": bot_status["running"],
+        "event_loop_lag_ms": round(watchdog.current_lag() * 1000, 2),
         "service": "Telegram Music Bot"
-    })
+    }), 200 if healthy else 503
 
 @app.route('/status')
 def status_page():
@@ -55,49 +65,94 @@ def api_status():
     return jsonify({
         "bot_running": bot_status["running"],
         "uptime": time.time() - bot_status["start_time"],
-        "last_seen": bot_status["last_seen"]
+        "last_seen": watchdog.last_seen,
+        "downloads": admission.stats(),
+        "event_loop": watchdog.stats(),
+        "circuits": circuit_stats(),
+        "executors": executor_stats()
     })
 
-async def run_telegram_bot_async():
-    """Run Telegram bot using async Application."""
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for every pipeline stage."""
+    return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/admin/profile')
+def admin_profile():
+    """Sample all threads for ?seconds=N and return collapsed stacks (admin token required)."""
+    if not verify_admin_token(request.headers.get("Authorization")):
+        abort(404)
+    seconds = request.args.get("seconds", 10.0, type=float)
+    try:
+        stacks = sample_stacks(seconds)
+    except ProfilerBusyError as e:
+        return jsonify({"error": str(e)}), 409
+    return Response(stacks, content_type="text/plain; charset=utf-8")
+
+def build_application(bot_token):
+    """Create the Telegram Application with all handlers registered."""
+    application = (
+        Application.builder()
+        .token(bot_token)
+        .base_url(f"{TELEGRAM_API_URL}/bot")
+        .base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        .local_mode(TELEGRAM_LOCAL_MODE)
+        .concurrent_updates(True)
+        .post_init(post_init)
+        .build()
+    )
+    register_handlers(application)
+    return application
+
+def run_telegram_bot():
+    """Run bot in a separate thread with its own event loop."""
     try:
         bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
         if not bot_token:
             logger.error("❌ TELEGRAM_BOT_TOKEN not set in environment.")
             return
 
-        application = Application.builder().token(bot_token).build()
-
-        # Add handlers
-        application.add_handler(CommandHandler("start", start_command))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CallbackQueryHandler(handle_button_callback))
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        application = build_application(bot_token)
+        bot_runtime.update(application=application, loop=loop)
 
         bot_status["running"] = True
-        bot_status["last_seen"] = time.time()
 
         logger.info("🤖 Telegram bot starting...")
-        await application.run_polling()
-
-    except Exception as e:
-        logger.error(f"❌ Error running Telegram bot: {e}")
-        bot_status["running"] = False
-
-def run_telegram_bot():
-    """Run bot in a separate thread."""
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(run_telegram_bot_async())
+        # Signal handlers can only be installed from the main thread
+        application.run_polling(stop_signals=None)
     except Exception as e:
         logger.error(f"❌ Bot thread error: {e}")
+    finally:
         bot_status["running"] = False
 
+def handle_sigterm(signum, frame):
+    """Drain in-flight downloads on the bot's loop, stop the workers, then exit."""
+    logger.info("SIGTERM received, shutting down gracefully...")
+    application, loop = bot_runtime["application"], bot_runtime["loop"]
+    if application is not None and loop is not None and loop.is_running():
+        future = asyncio.run_coroutine_threadsafe(drain_and_stop(application), loop)
+        try:
+            future.result(DRAIN_TIMEOUT + 5)
+        except Exception as e:
+            logger.error(f"Drain failed: {e}")
+
+    # Workers finish their current job on SIGTERM; the job queue keeps the rest
+    for process in bot_runtime["workers"]:
+        process.terminate()
+    for process in bot_runtime["workers"]:
+        process.join(DRAIN_TIMEOUT)
+    sys.exit(0)
+
 def main():
     print("🚀 Starting Flask + Telegram bot service...")
     port = int(os.getenv("PORT", 5000))
 
+    if WORKER_COUNT:
+        bot_runtime["workers"] = start_workers(WORKER_COUNT)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
     bot_thread = threading.Thread(target=run_telegram_bot, daemon=True)
     bot_thread.start()
 
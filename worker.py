@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Download Worker - pulls download jobs from the shared job queue.
+Run standalone (`python worker.py`) or let main.py spawn WORKER_COUNT of them.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+from config import TELEGRAM_BOT_TOKEN, TELEGRAM_API_URL, TELEGRAM_LOCAL_MODE, WORKER_COUNT, WORKER_POLL_INTERVAL, JOB_QUEUE_PATH, JOB_HEARTBEAT_INTERVAL, METRICS_PUBLISH_INTERVAL
+from bot.job_queue import JobQueue
+from bot.logs import log_context, setup_logging
+from bot.metrics import clear_snapshots, publish_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+async def keep_claim(queue, job_id, worker_id, interval=JOB_HEARTBEAT_INTERVAL):
+    """Renew the claim on a running job every `interval` seconds, so long batches are not requeued."""
+    while True:
+        await asyncio.sleep(interval)
+        if not await queue.aheartbeat(job_id, worker_id):
+            logger.warning(f"Worker {worker_id} lost its claim on job {job_id}")
+            return
+
+
+async def publish_metrics(worker_id, interval=METRICS_PUBLISH_INTERVAL):
+    """Publish this worker's metrics for the bot process's /metrics every `interval` seconds."""
+    while True:
+        try:
+            publish_snapshot(worker_id)
+        except OSError as e:
+            logger.warning(f"Worker {worker_id} could not publish metrics: {e}")
+        await asyncio.sleep(interval)
+
+
+async def worker_loop(worker_id, handle_job, queue_path=JOB_QUEUE_PATH,
+                      poll_interval=WORKER_POLL_INTERVAL, stop_when_empty=False, stop_event=None):
+    """
+    Claim and process jobs until stopped.
+
+    Args:
+        worker_id: Identifier recorded on claimed jobs
+        handle_job: Coroutine function taking a job payload, returning True on success
+        queue_path: Path of the SQLite job queue
+        poll_interval: Seconds to wait when no job is claimable
+        stop_when_empty: Return once the queue has no waiting jobs (benchmarks)
+        stop_event: asyncio.Event; once set, the worker returns after its current job
+    """
+    queue = JobQueue(queue_path)
+    logger.info(f"Worker {worker_id} started (pid {os.getpid()})")
+
+    while stop_event is None or not stop_event.is_set():
+        job = queue.claim(worker_id)
+        if job is None:
+            if stop_when_empty and queue.depth() == 0:
+                return
+            queue.requeue_stale()
+            await asyncio.sleep(poll_interval)
+            continue
+
+        heartbeat = asyncio.create_task(keep_claim(queue, job["id"], worker_id))
+        try:
+            with log_context(worker=worker_id, queue_job=job["id"]):
+                succeeded = await handle_job(job["payload"])
+            if succeeded:
+                queue.complete(job["id"])
+            else:
+                queue.fail(job["id"], "handler reported failure")
+        except Exception as e:
+            logger.error(f"Worker {worker_id} job {job['id']} error: {e}")
+            queue.fail(job["id"], str(e))
+        finally:
+            heartbeat.cancel()
+
+    logger.info(f"Worker {worker_id} stopped")
+
+
+async def run_download_worker_async(worker_id):
+    """Deliver queued tracks with a Bot instance owned by this worker."""
+    from telegram import Bot
+    from bot.handlers import deliver_job
+
+    bot = Bot(
+        TELEGRAM_BOT_TOKEN,
+        base_url=f"{TELEGRAM_API_URL}/bot",
+        base_file_url=f"{TELEGRAM_API_URL}/file/bot",
+        local_mode=TELEGRAM_LOCAL_MODE
+    )
+    # SIGTERM lets the current job finish; unclaimed jobs stay in the queue
+    stop_event = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop_event.set)
+
+    publisher = asyncio.create_task(publish_metrics(worker_id))
+    try:
+        async with bot:
+            async def handle_job(payload):
+                return await deliver_job(bot, payload)
+
+            await worker_loop(worker_id, handle_job, stop_event=stop_event)
+    finally:
+        publisher.cancel()
+        publish_snapshot(worker_id)
+
+
+def run_download_worker(worker_id):
+    """Process entry point for a download worker."""
+    setup_logging()
+    try:
+        asyncio.run(run_download_worker_async(worker_id))
+    except KeyboardInterrupt:
+        pass
+
+
+def start_workers(count=WORKER_COUNT):
+    """
+    Spawn download worker processes.
+
+    Args:
+        count: Number of worker processes
+
+    Returns:
+        List of started processes
+    """
+    clear_snapshots()
+    ctx = multiprocessing.get_context("spawn")
+    processes = []
+    for i in range(count):
+        process = ctx.Process(
+            target=run_download_worker,
+            args=(f"worker-{i}",),
+            name=f"download-worker-{i}",
+            daemon=True
+        )
+        process.start()
+        processes.append(process)
+    logger.info(f"Started {len(processes)} download worker(s)")
+    return processes
+
+
+def main():
+    if not TELEGRAM_BOT_TOKEN:
+        print("❌ TELEGRAM_BOT_TOKEN not set in environment.")
+        sys.exit(1)
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else max(WORKER_COUNT, 1)
+    print(f"🛠️ Starting {count} download worker(s)...")
+    for process in start_workers(count):
+        process.join()
+
+
+if __name__ == "__main__":
+    main()